@@ -0,0 +1,202 @@
+"""Evaluate many positions at once with NumPy.
+
+Positions are packed as an N x 64 array of piece codes indexed by y * 8 + x
+(0 for an empty square, 1-6 for white pawn, knight, bishop, rook, queen and
+king, 7-12 for the black pieces) or as N x 12 x 64 piece planes. Material,
+piece-square scores, mobility and check flags are then computed for the
+whole batch with array operations instead of one Board at a time.
+
+Mobility is approximated by the number of squares each side attacks, the
+same count the Board attack maps keep, so pins and own pieces are ignored.
+"""
+import numpy as np
+
+from chess import Bishop, Board, Color, King, Knight, Pawn, Queen, Rook, expand_placement
+from evaluation import PIECE_VALUES, SQUARE_SCORES
+import tables
+
+PIECE_ORDER = (Pawn, Knight, Bishop, Rook, Queen, King)
+PIECE_CODES = {}
+CODE_PIECES = [None]  # Shared piece instance for every code
+for _color in (Color.WHITE, Color.BLACK):
+    for _piece_type in PIECE_ORDER:
+        PIECE_CODES[_piece_type, _color] = len(CODE_PIECES)
+        CODE_PIECES.append(_piece_type(_color))
+# Translates the expanded FEN placement from chess.expand_placement straight into codes
+FEN_CODES = bytes.maketrans(
+    b'.' + ''.join(piece.fen_letter for piece in CODE_PIECES[1:]).encode('ascii'), bytes(range(13)))
+
+# Score of each code on each square from white's point of view, empty squares score 0
+MATERIAL = np.zeros(13, dtype=np.int32)
+SCORES = np.zeros((13, 64), dtype=np.int32)
+for (_piece_type, _color), _code in PIECE_CODES.items():
+    _sign = 1 if _color == Color.WHITE else -1
+    MATERIAL[_code] = _sign * PIECE_VALUES[_piece_type]
+    SCORES[_code] = _sign * np.array(SQUARE_SCORES[_piece_type, _color])
+
+SQUARES = np.arange(64)
+EMPTY = 64  # Index of the always empty padding square added after the 64 real ones
+
+# Directions are orthogonal first, then diagonal, like Queen.directions and tables.RAYS
+DIRECTIONS = tables.DIRECTIONS
+
+
+def _target_table(targets):
+    table = np.full((64, max(map(len, targets))), EMPTY, dtype=np.intp)
+    for index, squares in enumerate(targets):
+        table[index, :len(squares)] = squares
+    return table
+
+
+# Bitboard of the squares from each square to the edge in each direction, and their number
+RAY_MASKS = np.array(tables.RAY_MASKS, dtype=np.uint64)
+RAY_LENGTHS = np.array([[len(ray) for ray in rays] for rays in tables.RAYS], dtype=np.intp)
+# Directions along which the square index grows, so the nearest blocker is the lowest set bit
+ASCENDING = np.array([dy * 8 + dx > 0 for dx, dy in DIRECTIONS])
+KNIGHT_TARGETS = _target_table(tables.KNIGHT_TARGETS)
+KING_TARGETS = _target_table(tables.KING_TARGETS)
+PAWN_TARGETS = {Color.WHITE: _target_table(tables.PAWN_TARGETS[1]), Color.BLACK: _target_table(tables.PAWN_TARGETS[-1])}
+# Squares attacked by a knight, king or pawn do not depend on the other pieces,
+# counted positive for white and negative for black
+STEP_ATTACKS = np.zeros((13, 64), dtype=np.int32)
+SIGNS = np.zeros(13, dtype=np.int32)
+for _color in (Color.WHITE, Color.BLACK):
+    _sign = 1 if _color == Color.WHITE else -1
+    SIGNS[[PIECE_CODES[_piece_type, _color] for _piece_type in PIECE_ORDER]] = _sign
+    STEP_ATTACKS[PIECE_CODES[Knight, _color]] = _sign * (KNIGHT_TARGETS != EMPTY).sum(axis=1)
+    STEP_ATTACKS[PIECE_CODES[King, _color]] = _sign * (KING_TARGETS != EMPTY).sum(axis=1)
+    STEP_ATTACKS[PIECE_CODES[Pawn, _color]] = _sign * (PAWN_TARGETS[_color] != EMPTY).sum(axis=1)
+# Which of the eight directions each code slides along
+SLIDES = np.zeros((13, len(DIRECTIONS)), dtype=bool)
+for _color in (Color.WHITE, Color.BLACK):
+    SLIDES[PIECE_CODES[Rook, _color], :4] = True
+    SLIDES[PIECE_CODES[Bishop, _color], 4:] = True
+    SLIDES[PIECE_CODES[Queen, _color]] = True
+IS_SLIDER = SLIDES.any(axis=1)
+
+
+def encode(boards):
+    """Pack an iterable of Boards into an N x 64 array of piece codes."""
+    boards = list(boards)
+    codes = np.zeros((len(boards), 64), dtype=np.uint8)
+    for row, board in zip(codes, boards):
+        row[:] = [PIECE_CODES[type(square.piece), square.piece.color] if square.piece else 0
+                  for square in board.squares]
+    return codes
+
+
+def encode_fens(fens):
+    """Pack FEN strings (only the placement field is used) into an N x 64 array of piece codes."""
+    packed = ''.join(expand_placement(fen.split(maxsplit=1)[0]) for fen in fens).encode('ascii')
+    codes = np.frombuffer(packed.translate(FEN_CODES), dtype=np.uint8).reshape(-1, 64)
+    if codes.max(initial=0) > 12:
+        raise ValueError("Invalid piece letter in FEN placement")
+    return codes
+
+
+def decode(codes, board=None):
+    """Unpack one row of piece codes into a Board, reusing board if given.
+
+    Castling rights are not part of the codes and are left empty.
+    """
+    board = board if board is not None else Board()
+    board.set_position([CODE_PIECES[code] for code in codes.tolist()])
+    return board
+
+
+def to_planes(codes):
+    """Turn N x 64 piece codes into N x 12 x 64 planes, one per piece type and color."""
+    return (codes[:, None, :] == np.arange(1, 13, dtype=np.uint8)[None, :, None]).astype(np.uint8)
+
+
+def from_planes(planes):
+    return (planes * np.arange(1, 13, dtype=np.uint8)[None, :, None]).sum(axis=1, dtype=np.uint8)
+
+
+class BatchEvaluation:
+    """Per-position results of evaluate_batch, each an array of length N, from white's point of view."""
+
+    def __init__(self, material, piece_square, mobility, white_in_check, black_in_check):
+        self.material = material
+        self.piece_square = piece_square  # Piece-square table bonus on top of material
+        self.mobility = mobility  # Squares attacked by white minus squares attacked by black
+        self.white_in_check = white_in_check
+        self.black_in_check = black_in_check
+
+    @property
+    def score(self):
+        """Material plus piece-square score, the same number as evaluation.evaluate for white."""
+        return self.material + self.piece_square
+
+    def __len__(self):
+        return len(self.material)
+
+
+def evaluate_batch(codes, chunk_size=4096):
+    """Evaluate an N x 64 array of piece codes (or N x 12 x 64 planes) in chunks of chunk_size positions."""
+    codes = np.asarray(codes)
+    if codes.ndim == 3:
+        codes = from_planes(codes)
+    parts = [_evaluate_chunk(codes[start:start + chunk_size]) for start in range(0, len(codes), chunk_size)]
+    if not parts:
+        parts = [_evaluate_chunk(codes.reshape(0, 64))]
+    return BatchEvaluation(*(np.concatenate(column) for column in zip(*parts)))
+
+
+def _evaluate_chunk(codes):
+    codes = codes.astype(np.intp)
+    count = len(codes)
+    material = MATERIAL[codes].sum(axis=1)
+    piece_square = SCORES[codes, SQUARES].sum(axis=1) - material
+
+    occupied = np.packbits(codes != 0, axis=1, bitorder='little').view('<u8').ravel()
+    mobility = STEP_ATTACKS[codes, SQUARES].sum(axis=1)
+    # Rays are only followed from the squares that hold a slider
+    rows, squares = np.nonzero(IS_SLIDER[codes])
+    nearest, found = _nearest_blockers(occupied[rows], squares)
+    # A slider attacks the empty squares along a ray and the first piece it meets
+    distance = np.maximum(abs(nearest % 8 - squares[:, None] % 8), abs(nearest // 8 - squares[:, None] // 8))
+    reach = np.where(found, distance, RAY_LENGTHS[squares])
+    slider_codes = codes[rows, squares]
+    slider_attacks = (reach * SLIDES[slider_codes]).sum(axis=1) * SIGNS[slider_codes]
+    mobility += np.bincount(rows, weights=slider_attacks, minlength=count).astype(mobility.dtype)
+
+    # Pad every position with an empty square so targets past the edge read as empty
+    padded = np.concatenate([codes, np.zeros((count, 1), dtype=np.intp)], axis=1)
+    return (material, piece_square, mobility,
+            _in_check(padded, occupied, Color.WHITE), _in_check(padded, occupied, Color.BLACK))
+
+
+def _nearest_blockers(occupied, squares):
+    """Return the index of the nearest piece from each square in each direction, and whether there is one."""
+    blockers = occupied[:, None] & RAY_MASKS[squares]  # len(squares) x 8
+    ascending = blockers[:, ASCENDING]
+    nearest = np.empty_like(blockers)
+    nearest[:, ASCENDING] = ascending & (~ascending + np.uint64(1))
+    descending = blockers[:, ~ASCENDING]
+    for shift in (1, 2, 4, 8, 16, 32):
+        descending |= descending >> np.uint64(shift)
+    nearest[:, ~ASCENDING] = descending ^ (descending >> np.uint64(1))
+    found = nearest != 0
+    # Every nearest blocker is a single bit, which converts to float exactly
+    index = np.log2(np.where(found, nearest, np.uint64(1)).astype(np.float64)).astype(np.intp)
+    return index, found
+
+
+def _in_check(padded, occupied, color):
+    enemy = Color.BLACK if color == Color.WHITE else Color.WHITE
+    rows = np.arange(len(padded))
+    is_king = padded[:, :64] == PIECE_CODES[King, color]
+    has_king = is_king.any(axis=1)
+    king = is_king.argmax(axis=1)
+
+    # The first piece on each ray out from the king
+    nearest, found = _nearest_blockers(occupied, king)
+    first = np.where(found, padded[rows[:, None], nearest], 0)
+    queen = PIECE_CODES[Queen, enemy]
+    check = (((first[:, :4] == PIECE_CODES[Rook, enemy]) | (first[:, :4] == queen)).any(axis=1) |
+             ((first[:, 4:] == PIECE_CODES[Bishop, enemy]) | (first[:, 4:] == queen)).any(axis=1))
+    # Knights and pawns attack the king from the squares a piece on the king square would attack
+    check |= (padded[rows[:, None], KNIGHT_TARGETS[king]] == PIECE_CODES[Knight, enemy]).any(axis=1)
+    check |= (padded[rows[:, None], PAWN_TARGETS[color][king]] == PIECE_CODES[Pawn, enemy]).any(axis=1)
+    return check & has_king
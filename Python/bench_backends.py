@@ -0,0 +1,69 @@
+"""Compare the square-dict Board with BitboardBoard on the same move sequences.
+
+Each ply is validated with Game.play_move and followed by the status checks
+Game.play runs every turn (checkmate, stalemate and check). Since Board keeps
+incremental attack counts the bitboard backend is no longer faster: expect a
+speedup between about 0.9x and 1.1x, which is within the noise of one run.
+"""
+import argparse
+import time
+
+from bitboard import BitboardBoard
+from chess import Board, Game
+
+SEQUENCES = {
+    "scholars_mate": "e2 e4 e7 e5 d1 h5 b8 c6 f1 c4 g8 f6 h5 f7",
+    "fools_mate": "f2 f3 e7 e5 g2 g4 d8 h4",
+    "open_game": "e2 e4 e7 e5 g1 f3 b8 c6 f1 c4 f8 c5 c2 c3 g8 f6 d2 d4 e5 d4 c3 d4 c5 b4 "
+                 "b1 c3 f6 e4 c1 d2 e4 d2 d1 d2 d7 d5 c4 d5 d8 d5 c3 d5 b4 d2 e1 d2",
+    "queens_gambit": "d2 d4 d7 d5 c2 c4 e7 e6 b1 c3 g8 f6 c1 g5 f8 e7 e2 e3 b8 d7 g1 f3 c7 c6 "
+                     "a1 c1 h7 h6 g5 h4 d5 c4 f1 c4 b7 b5 c4 d3 a7 a6 a2 a4 b5 b4 c3 e4 f6 e4",
+}
+
+
+def replay(board_class, moves):
+    game = Game(board_class())
+    status = []
+    for start_pos, end_pos in zip(moves[::2], moves[1::2]):
+        if not game.play_move(start_pos, end_pos):
+            raise ValueError(f"illegal move {start_pos} {end_pos}")
+        status.append((
+            game.board.is_checkmate(game.current_turn),
+            game.board.is_stalemate(game.current_turn),
+            game.board.is_king_in_check(game.current_turn),
+        ))
+    return status
+
+
+def benchmark(board_class, repeat):
+    timings = {}
+    for name, sequence in SEQUENCES.items():
+        moves = sequence.split()
+        start = time.perf_counter()
+        for _ in range(repeat):
+            replay(board_class, moves)
+        timings[name] = (time.perf_counter() - start) / repeat
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=5, help="replays per sequence")
+    args = parser.parse_args()
+
+    for sequence in SEQUENCES.values():
+        moves = sequence.split()
+        if replay(Board, moves) != replay(BitboardBoard, moves):
+            raise AssertionError("backends disagree on game status")
+
+    squares = benchmark(Board, args.repeat)
+    bitboards = benchmark(BitboardBoard, args.repeat)
+    print(f"{'sequence':<16}{'plies':>6}{'dict ms':>10}{'bitboard ms':>13}{'speedup':>9}")
+    for name, sequence in SEQUENCES.items():
+        plies = len(sequence.split()) // 2
+        print(f"{name:<16}{plies:>6}{squares[name] * 1000:>10.2f}{bitboards[name] * 1000:>13.2f}"
+              f"{squares[name] / bitboards[name]:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+"""Compare evaluating positions one Board at a time with evaluate_batch."""
+import argparse
+import time
+
+from batch import encode_fens, evaluate_batch
+from bench_fen import generate_fens, read_fens
+from chess import Board, Color
+from evaluation import evaluate
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--file", help="file with one FEN per line")
+    parser.add_argument("--chunk-size", type=int, default=4096)
+    args = parser.parse_args()
+    fens = read_fens(args.file) if args.file else generate_fens()
+
+    board = Board()
+    start = time.perf_counter()
+    for fen in fens:
+        board.load_fen(fen)
+        evaluate(board, Color.WHITE)
+    scalar = time.perf_counter() - start
+
+    start = time.perf_counter()
+    codes = encode_fens(fens)
+    packed = time.perf_counter() - start
+    start = time.perf_counter()
+    evaluate_batch(codes, args.chunk_size)
+    batched = time.perf_counter() - start
+
+    print(f"{len(fens)} positions")
+    print(f"load_fen + evaluate  {len(fens) / scalar:10.0f} positions/s (material and piece-square only)")
+    print(f"encode_fens          {len(fens) / packed:10.0f} positions/s")
+    print(f"evaluate_batch       {len(fens) / batched:10.0f} positions/s (adds mobility and check flags)")
+    print(f"  both               {len(fens) / (packed + batched):10.0f} positions/s")
+
+
+if __name__ == "__main__":
+    main()
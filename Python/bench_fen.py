@@ -0,0 +1,63 @@
+"""Measure how many FEN positions per second can be loaded and evaluated.
+
+Reads one FEN per line from --file, or builds a set by walking the perft
+positions two plies deep. The first two rates load into one reused board or
+game, the last two build a new one for every position.
+"""
+import argparse
+import time
+
+from chess import Board, Color, Game
+from evaluation import evaluate
+from perft import POSITIONS
+
+
+def generate_fens():
+    fens = []
+    for fen, _ in POSITIONS.values():
+        game = Game.from_fen(fen)
+        for move in game.legal_moves():
+            game.push(move)
+            for reply in game.legal_moves():
+                game.push(reply)
+                fens.append(game.to_fen())
+                game.pop()
+            game.pop()
+    return fens
+
+
+def read_fens(path):
+    with open(path) as file:
+        return [line.strip() for line in file if line.strip()]
+
+
+def rate(fens, load):
+    start = time.perf_counter()
+    for fen in fens:
+        load(fen)
+    return len(fens) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--file", help="file with one FEN per line")
+    args = parser.parse_args()
+
+    fens = read_fens(args.file) if args.file else generate_fens()
+    board = Board()
+    game = Game()
+
+    def load_and_evaluate(fen):
+        board.load_fen(fen)
+        evaluate(board, Color.WHITE)
+
+    print(f"{len(fens)} positions")
+    print(f"Board.load_fen    {rate(fens, board.load_fen):10.0f} positions/s")
+    print(f"  + evaluate      {rate(fens, load_and_evaluate):10.0f} positions/s")
+    print(f"Game.load_fen     {rate(fens, game.load_fen):10.0f} positions/s")
+    print(f"Board(fen)        {rate(fens, Board):10.0f} positions/s")
+    print(f"Game.from_fen     {rate(fens, Game.from_fen):10.0f} positions/s")
+
+
+if __name__ == "__main__":
+    main()
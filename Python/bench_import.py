@@ -0,0 +1,61 @@
+"""Measure how long importing the rules engine takes in a fresh interpreter.
+
+Each sample starts a new Python with -X importtime and reads the cumulative
+time of the module itself, so interpreter startup is not counted. One warm-up
+run first writes the bytecode cache, which is then allowed for every sample
+even when PYTHONDONTWRITEBYTECODE is set, so compiling is not counted either.
+Exits with status 1 when the median is over --target milliseconds or when a
+display or numeric dependency was imported along with the module.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+# Modules the rules engine must not pull in
+UNWANTED = ("pyfiglet", "numpy")
+
+
+def run(code, *options):
+    environment = dict(os.environ)
+    environment.pop("PYTHONDONTWRITEBYTECODE", None)
+    return subprocess.run([sys.executable, *options, "-c", code], capture_output=True, text=True, check=True,
+                          cwd=os.path.dirname(os.path.abspath(__file__)), env=environment)
+
+
+def import_time(module):
+    """Return the milliseconds one fresh interpreter spends importing module."""
+    for line in run(f"import {module}", "-X", "importtime").stderr.splitlines():
+        fields = line.split("|")
+        if len(fields) == 3 and fields[2].strip() == module:
+            return int(fields[1]) / 1000
+    raise RuntimeError(f"no import time reported for {module}")
+
+
+def unwanted_modules(module):
+    found = run(f"import sys, {module}; print(' '.join(name for name in {UNWANTED!r} if name in sys.modules))")
+    return found.stdout.split()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("modules", nargs="*", default=["chess"])
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--target", type=float, default=20.0, help="milliseconds the median must stay under")
+    args = parser.parse_args()
+
+    failed = False
+    for module in args.modules:
+        run(f"import {module}")
+        times = [import_time(module) for _ in range(args.runs)]
+        median = statistics.median(times)
+        unwanted = unwanted_modules(module)
+        print(f"{module:12} median {median:6.1f} ms  min {min(times):6.1f} ms  max {max(times):6.1f} ms"
+              + (f"  imports {', '.join(unwanted)}" if unwanted else ""))
+        failed |= median > args.target or bool(unwanted)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,30 @@
+"""Measure the memory held by each live Game with tracemalloc."""
+import argparse
+import tracemalloc
+
+from chess import Game
+
+
+def memory_per_game(count):
+    # Build one game first so class-level tables and caches are not counted
+    Game()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    games = [Game() for _ in range(count)]
+    for game in games:
+        game.play_move("e2", "e4")
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    total = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    return total / count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--games", type=int, default=1000)
+    args = parser.parse_args()
+    print(f"{memory_per_game(args.games):.0f} bytes per Game ({args.games} games)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""Measure how perft and PGN replay scale with the number of worker processes.
+
+Speedup is against the same work done in this process without a pool, and
+efficiency is speedup divided by the worker count.
+"""
+import argparse
+import os
+import time
+
+from chess import START_FEN, Game
+from parallel import parallel_perft, parallel_replay
+from perft import perft
+from pgn import ReplayStats, read_games, replay_games
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - start
+
+
+def serial_replay(path):
+    stats = ReplayStats()
+    for _ in replay_games(read_games(path), stats):
+        pass
+
+
+def report(name, serial, runs):
+    print(f"{name}: serial {serial:.2f}s")
+    print("  workers   time  speedup  efficiency")
+    for workers, elapsed in runs:
+        speedup = serial / elapsed
+        print(f"  {workers:7d} {elapsed:6.2f} {speedup:7.2f}x {speedup / workers:10.0%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count())
+    parser.add_argument("--depth", type=int, default=4, help="perft depth from the start position")
+    parser.add_argument("--pgn", help="PGN archive to replay as well")
+    parser.add_argument("--chunk-size", type=int, default=100)
+    args = parser.parse_args()
+    counts = range(1, args.max_workers + 1)
+
+    serial = timed(perft, Game.from_fen(START_FEN), args.depth)
+    report(f"perft depth {args.depth}", serial,
+           [(workers, timed(parallel_perft, START_FEN, args.depth, workers)) for workers in counts])
+    if args.pgn:
+        serial = timed(serial_replay, args.pgn)
+        report(f"replay {args.pgn}", serial,
+               [(workers, timed(parallel_replay, args.pgn, workers, args.chunk_size)) for workers in counts])
+
+
+if __name__ == "__main__":
+    main()
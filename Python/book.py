@@ -0,0 +1,208 @@
+"""Opening book built from PGN games and read through a memory-mapped file.
+
+The book is a header followed by fixed-size entries sorted by position key:
+
+    key     8 bytes  Game.zobrist_hash of the position
+    move    2 bytes  start index | end index << 6 | promotion << 12
+    weight  2 bytes  how good the move did, higher is better
+
+so a lookup is a binary search over the mapped file and opening a book costs
+one mmap call whatever its size. Worker processes that open the same book
+share its pages through the operating system's cache. Keys come from the
+Zobrist tables in chess.py, so a book only works with this engine.
+
+    python book.py build openings.bin games.pgn --max-ply 20
+    python book.py probe openings.bin "<fen>"
+"""
+import argparse
+import mmap
+import os
+import random
+import struct
+import sys
+from collections import defaultdict
+
+from chess import PROMOTION_PIECES, START_FEN, Color, Game
+from pgn import PGNError, ReplayStats, decode_san, read_games
+
+MAGIC = b'CHESSBK1'
+ENTRY = struct.Struct('<QHH')
+KEY = struct.Struct('<Q')
+MAX_WEIGHT = 0xFFFF
+# Promotion classes by their 3-bit code, 0 for no promotion
+PROMOTIONS = (None, PROMOTION_PIECES['n'], PROMOTION_PIECES['b'], PROMOTION_PIECES['r'], PROMOTION_PIECES['q'])
+# Points for the side that played a move, by game result
+RESULT_POINTS = {'1-0': {Color.WHITE: 2, Color.BLACK: 0},
+                 '0-1': {Color.WHITE: 0, Color.BLACK: 2},
+                 '1/2-1/2': {Color.WHITE: 1, Color.BLACK: 1}}
+
+
+def encode_move(start_square, end_square, promotion=None):
+    return start_square.index | end_square.index << 6 | PROMOTIONS.index(promotion) << 12
+
+
+def decode_move(code):
+    """Return (start index, end index, promotion class) of an encoded book move."""
+    return code & 63, code >> 6 & 63, PROMOTIONS[code >> 12 & 7]
+
+
+def collect(sources, max_ply=20, weights=None, stats=None):
+    """Add up move weights from the first max_ply plies of every game in sources.
+
+    A move scores 2 for every win and 1 for every draw of the side that played
+    it, or 1 when the result is unknown. Games that could not be parsed or have
+    no result, which is how a truncated game ends, are left out, and games stop
+    counting at their first bad move. Each of these is recorded as a PGNError in
+    stats, a pgn.ReplayStats, the way pgn.replay_games records failures.
+    """
+    weights = weights if weights is not None else defaultdict(int)
+    stats = stats if stats is not None else ReplayStats()
+    for source in sources:
+        for pgn_game in read_games(source):
+            if pgn_game.error or pgn_game.result is None:
+                stats.errors.append(PGNError(pgn_game.error or "no result, the game is truncated", pgn_game.offset))
+                continue
+            points = RESULT_POINTS.get(pgn_game.result, {Color.WHITE: 1, Color.BLACK: 1})
+            try:
+                game = Game.from_fen(pgn_game.headers.get('FEN', START_FEN))
+            except ValueError as error:
+                stats.errors.append(PGNError(str(error), pgn_game.offset))
+                continue
+            stats.games += 1
+            stats.results[pgn_game.result] += 1
+            for ply, san in enumerate(pgn_game.moves[:max_ply]):
+                try:
+                    start_square, end_square, promotion = decode_san(game, san)
+                except ValueError as error:
+                    stats.errors.append(PGNError(f"ply {ply + 1}: {error}", pgn_game.offset))
+                    break
+                key, color = game.zobrist_hash, game.current_turn
+                if not game.play_move(repr(start_square), repr(end_square), promotion):
+                    stats.errors.append(PGNError(f"ply {ply + 1}: illegal move {san}", pgn_game.offset))
+                    break
+                weights[key, encode_move(start_square, end_square, promotion)] += points[color]
+                stats.moves += 1
+    return weights
+
+
+def write_book(weights, path):
+    """Write {(key, move): weight} to path as a sorted book and return the number of entries."""
+    by_key = defaultdict(list)
+    for (key, move), weight in weights.items():
+        if weight > 0:
+            by_key[key].append((move, weight))
+    count = 0
+    with open(path, 'wb') as output:
+        output.write(MAGIC)
+        for key in sorted(by_key):
+            moves = by_key[key]
+            # Scale down so the best move fits in 16 bits and keeps the ratios
+            scale = max(1, -(-max(weight for _, weight in moves) // MAX_WEIGHT))
+            for move, weight in sorted(moves, key=lambda item: -item[1]):
+                output.write(ENTRY.pack(key, move, max(1, weight // scale)))
+                count += 1
+    return count
+
+
+def build_book(sources, path, max_ply=20, stats=None):
+    """Build a book at path from PGN sources (paths or binary files) and return the number of entries."""
+    return write_book(collect(sources, max_ply, stats=stats), path)
+
+
+class OpeningBook:
+    """A book file mapped into memory, looked up by Game.zobrist_hash."""
+
+    def __init__(self, path, seed=None):
+        self.path = path
+        with open(path, 'rb') as book_file:
+            if book_file.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{path} is not an opening book, it does not start with {MAGIC.decode()}")
+            length = os.fstat(book_file.fileno()).st_size - len(MAGIC)
+            if length % ENTRY.size:
+                raise ValueError(f"{path} is truncated, {length} bytes of entries is not a multiple of {ENTRY.size}")
+            self._data = mmap.mmap(book_file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.size = length // ENTRY.size
+        self.random = random.Random(seed)
+
+    def __reduce__(self):
+        # Pickled as its path so each process maps the file itself
+        return (type(self), (self.path,))
+
+    def __len__(self):
+        return self.size
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self._data.close()
+
+    def entries(self, key):
+        """Return [(move code, weight)] stored for the key, best first."""
+        data, header = self._data, len(MAGIC)
+        low, high = 0, self.size
+        while low < high:
+            middle = (low + high) // 2
+            if KEY.unpack_from(data, header + middle * ENTRY.size)[0] < key:
+                low = middle + 1
+            else:
+                high = middle
+        found = []
+        for index in range(low, self.size):
+            entry_key, move, weight = ENTRY.unpack_from(data, header + index * ENTRY.size)
+            if entry_key != key:
+                break
+            found.append((move, weight))
+        return found
+
+    def moves(self, game):
+        """Return [(Move, weight)] for the book moves that are legal in the game's position."""
+        entries = self.entries(game.zobrist_hash)
+        if not entries:
+            return []
+        # Matching against legal_moves also guards against hash collisions
+        legal = {(move.start_pos.index, move.end_pos.index, move.promotion): move for move in game.legal_moves()}
+        return [(legal[decode_move(code)], weight) for code, weight in entries if decode_move(code) in legal]
+
+    def choose(self, game):
+        """Pick a book move at random in proportion to its weight, or None when out of book."""
+        moves = self.moves(game)
+        if not moves:
+            return None
+        return self.random.choices([move for move, _ in moves], [weight for _, weight in moves])[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or probe an opening book.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build")
+    build.add_argument("book")
+    build.add_argument("pgn", nargs="+")
+    build.add_argument("--max-ply", type=int, default=20, help="plies of each game to include")
+    probe = commands.add_parser("probe")
+    probe.add_argument("book")
+    probe.add_argument("fen", nargs="?", default=START_FEN)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        stats = ReplayStats()
+        count = build_book(args.pgn, args.book, args.max_ply, stats)
+        for error in stats.errors:
+            print(error, file=sys.stderr)
+        print(f"{count} entries written to {args.book} from {stats.games} games, {len(stats.errors)} errors")
+        return
+    with OpeningBook(args.book) as book:
+        game = Game.from_fen(args.fen)
+        moves = book.moves(game)
+        total = sum(weight for _, weight in moves)
+        for move, weight in moves:
+            print(f"{move.to_uci():6} {weight:6d} {weight / total:6.1%}")
+        if not moves:
+            print("out of book")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,30 +1,99 @@
-from pyfiglet import Figlet
+import random
+import sys
+from array import array
+
+from transposition import LRUCache
+
+from tables import (BETWEEN, BISHOP_DIRECTIONS, KING_MASKS, KING_OFFSETS, KING_TARGETS, KNIGHT_MASKS,
+                    KNIGHT_OFFSETS, KNIGHT_TARGETS, LINE, NO_LINE, OPPOSITE, PAWN_TARGETS, RAYS,
+                    ROOK_DIRECTIONS)
 
 class Color:
     WHITE = 'white'
     BLACK = 'black'
 
+class Status:
+    IN_PROGRESS = 'in progress'
+    CHECK = 'check'
+    CHECKMATE = 'checkmate'
+    STALEMATE = 'stalemate'
+    INSUFFICIENT_MATERIAL = 'insufficient material'
+    FIFTY_MOVES = 'fifty-move rule'
+    THREEFOLD_REPETITION = 'threefold repetition'
+    OVER = (CHECKMATE, STALEMATE, INSUFFICIENT_MATERIAL, FIFTY_MOVES, THREEFOLD_REPETITION)
+    # Results known from Game.tablebase for the side to move, while play may go on
+    TABLEBASE_WIN = 'tablebase win'
+    TABLEBASE_DRAW = 'tablebase draw'
+    TABLEBASE_LOSS = 'tablebase loss'
+    DECIDED = (TABLEBASE_WIN, TABLEBASE_DRAW, TABLEBASE_LOSS)
+
 class Square:
+    __slots__ = ('x', 'y', 'index', 'piece', 'board')
     columns = 'abcdefgh'
 
-    def __init__(self, x, y):
+    def __init__(self, x, y, board=None):
         self.x = x
         self.y = y
+        self.index = y * 8 + x  # Position in Board.squares and in the tables module
         self.piece = None
+        self.board = board
 
     def __repr__(self):
         return f"{Square.columns[self.x]}{self.y + 1}"
 
 class Piece:
-    def __init__(self, color, board=None):
-        self.color = color
-        self.board = board
-        self.has_moved = False  # Indicates if the piece has moved
+    __slots__ = ('color',)
+    letter = None  # FEN letter, lower case
+    # Single-step (dx, dy) jumps and sliding (dx, dy) rays used for move generation,
+    # with the matching tables.py target table and ray numbers
+    offsets = ()
+    directions = ()
+    targets = None
+    rays = ()
+    _shared = {}
+
+    def __new__(cls, color, board=None):
+        # Pieces keep no per-game state (the board is reached through the squares and
+        # castling rights live on the Board), so one instance per type and color is shared
+        piece = Piece._shared.get((cls, color))
+        if piece is None:
+            piece = object.__new__(cls)
+            piece.color = color
+            Piece._shared[cls, color] = piece
+        return piece
+
+    def __reduce__(self):
+        return (type(self), (self.color,))
+
+    @property
+    def fen_letter(self):
+        return self.letter.upper() if self.color == Color.WHITE else self.letter
 
     def is_valid_move(self, start_square, end_square, last_move=None):
         raise NotImplementedError("Must be implemented by subclass")
-    
+
+    def candidate_squares(self, start_square, last_move=None):
+        """Yield the squares this piece could move to, ignoring checks on its own king."""
+        squares = start_square.board.squares
+        if self.targets is not None:
+            for index in self.targets[start_square.index]:
+                square = squares[index]
+                if square.piece is None or square.piece.color != self.color:
+                    yield square
+        rays = RAYS[start_square.index]
+        for direction in self.rays:
+            for index in rays[direction]:
+                square = squares[index]
+                if square.piece is not None:
+                    if square.piece.color != self.color:
+                        yield square
+                    break
+                yield square
+
 class Pawn(Piece):
+    __slots__ = ()
+    letter = 'p'
+
     def __str__(self):
         return '♙' if self.color == Color.WHITE else '♟'
 
@@ -38,179 +107,366 @@ class Pawn(Piece):
             return True
 
         # First move can be two squares forward
-        if start_x == end_x and end_y == start_y + 2 * direction and start_y in (1, 6) and end_square.piece is None:
-            return True
+        if start_x == end_x and end_y == start_y + 2 * direction and start_y == self.start_rank and end_square.piece is None:
+            return start_square.board.is_path_clear(start_square, end_square)
 
         # Capturing move
         if abs(start_x - end_x) == 1 and end_y == start_y + direction:
             if end_square.piece and end_square.piece.color != self.color:
                 return True
-            # En passant move
-            if last_move:
-                last_start, last_end = last_move
-                if isinstance(last_end.piece, Pawn) and last_end.piece.color != self.color:
-                    if last_end.x == end_x and abs(last_start.y - last_end.y) == 2:
-                        if last_end.y == start_y:
-                            return True
+            return self.is_en_passant(start_square, end_square, last_move)
 
         return False
 
+    @property
+    def start_rank(self):
+        return 1 if self.color == Color.WHITE else 6
+
+    def is_en_passant(self, start_square, end_square, last_move):
+        if last_move:
+            last_start, last_end = last_move
+            if isinstance(last_end.piece, Pawn) and last_end.piece.color != self.color:
+                if last_end.x == end_square.x and abs(last_start.y - last_end.y) == 2:
+                    if last_end.y == start_square.y:
+                        return True
+        return False
+
+    def candidate_squares(self, start_square, last_move=None):
+        squares = start_square.board.squares
+        direction = 1 if self.color == Color.WHITE else -1
+        x, y = start_square.x, start_square.y + direction
+        if not 0 <= y < 8:
+            return
+
+        ahead = squares[y * 8 + x]
+        if ahead.piece is None:
+            yield ahead
+            if start_square.y == self.start_rank:
+                two_ahead = squares[(y + direction) * 8 + x]
+                if two_ahead.piece is None:
+                    yield two_ahead
+
+        for dx in (-1, 1):
+            if 0 <= x + dx < 8:
+                target = squares[y * 8 + x + dx]
+                if target.piece is not None:
+                    if target.piece.color != self.color:
+                        yield target
+                elif self.is_en_passant(start_square, target, last_move):
+                    yield target
+
 
 class Rook(Piece):
+    __slots__ = ()
+    letter = 'r'
+    directions = ROOK_DIRECTIONS
+    rays = (0, 1, 2, 3)
+
     def __str__(self):
         return '♖' if self.color == Color.WHITE else '♜'
 
     def is_valid_move(self, start_square, end_square, last_move=None):
-        start_x, start_y = start_square.x, start_square.y
-        end_x, end_y = end_square.x, end_square.y
-
-        if start_x != end_x and start_y != end_y:
+        if LINE[start_square.index][end_square.index] not in self.rays:
             return False
 
-        if self.board.is_path_clear(start_square, end_square):
+        if start_square.board.is_path_clear(start_square, end_square):
             return end_square.piece is None or end_square.piece.color != self.color
 
         return False
 
 class Knight(Piece):
+    __slots__ = ()
+    letter = 'n'
+    offsets = KNIGHT_OFFSETS
+    targets = KNIGHT_TARGETS
+
     def __str__(self):
         return '♘' if self.color == Color.WHITE else '♞'
 
     def is_valid_move(self, start_square, end_square, last_move=None):
-        start_x, start_y = start_square.x, start_square.y
-        end_x, end_y = end_square.x, end_square.y
-
-        dx = abs(start_x - end_x)
-        dy = abs(start_y - end_y)
-
-        if (dx == 2 and dy == 1) or (dx == 1 and dy == 2):
+        if KNIGHT_MASKS[start_square.index] >> end_square.index & 1:
             return end_square.piece is None or end_square.piece.color != self.color
 
         return False
 
 class Bishop(Piece):
+    __slots__ = ()
+    letter = 'b'
+    directions = BISHOP_DIRECTIONS
+    rays = (4, 5, 6, 7)
+
     def __str__(self):
         return '♗' if self.color == Color.WHITE else '♝'
 
     def is_valid_move(self, start_square, end_square, last_move=None):
-        start_x, start_y = start_square.x, start_square.y
-        end_x, end_y = end_square.x, end_square.y
-
-        if abs(start_x - end_x) != abs(start_y - end_y):
+        if LINE[start_square.index][end_square.index] not in self.rays:
             return False
 
-        if self.board.is_path_clear(start_square, end_square):
+        if start_square.board.is_path_clear(start_square, end_square):
             return end_square.piece is None or end_square.piece.color != self.color
 
         return False
 
 class Queen(Piece):
+    __slots__ = ()
+    letter = 'q'
+    directions = Rook.directions + Bishop.directions
+    rays = Rook.rays + Bishop.rays
+
     def __str__(self):
         return '♕' if self.color == Color.WHITE else '♛'
 
     def is_valid_move(self, start_square, end_square, last_move=None):
-        start_x, start_y = start_square.x, start_square.y
-        end_x, end_y = end_square.x, end_square.y
+        if LINE[start_square.index][end_square.index] == NO_LINE:
+            return False
 
-        if (abs(start_x - end_x) == abs(start_y - end_y) or 
-            start_x == end_x or 
-            start_y == end_y):
-            if self.board.is_path_clear(start_square, end_square):
-                return end_square.piece is None or end_square.piece.color != self.color
+        if start_square.board.is_path_clear(start_square, end_square):
+            return end_square.piece is None or end_square.piece.color != self.color
 
         return False
 
 class King(Piece):
+    __slots__ = ()
+    letter = 'k'
+    offsets = KING_OFFSETS
+    targets = KING_TARGETS
+
     def __str__(self):
         return '♔' if self.color == Color.WHITE else '♚'
 
     def is_valid_move(self, start_square, end_square, last_move=None):
-        start_x, start_y = start_square.x, start_square.y
-        end_x, end_y = end_square.x, end_square.y
-
         # Regular king move (one square in any direction)
-        if max(abs(start_x - end_x), abs(start_y - end_y)) == 1:
+        if KING_MASKS[start_square.index] >> end_square.index & 1:
             return end_square.piece is None or end_square.piece.color != self.color
 
         # Castling move
-        if start_y == end_y and not self.has_moved and self.can_castle(start_square, end_square):
+        board = start_square.board
+        start_x, end_x = start_square.x, end_square.x
+        if start_square.y == end_square.y and self.can_castle(start_square, end_square):
             if end_x == start_x + 2:  # Kingside castling
-                rook_square = self.board.get_square(Square.columns[start_x + 3] + str(start_y + 1))
-                if rook_square.piece and isinstance(rook_square.piece, Rook) and not rook_square.piece.has_moved:
-                    if self.board.is_path_clear(start_square, end_square) and self.board.is_path_clear(start_square, rook_square):
+                rook_square = board.squares[start_square.index + 3]
+                if rook_square.piece and isinstance(rook_square.piece, Rook):
+                    if board.is_path_clear(start_square, end_square) and board.is_path_clear(start_square, rook_square):
                         return True
             elif end_x == start_x - 2:  # Queenside castling
-                rook_square = self.board.get_square(Square.columns[start_x - 4] + str(start_y + 1))
-                if rook_square.piece and isinstance(rook_square.piece, Rook) and not rook_square.piece.has_moved:
-                    if self.board.is_path_clear(start_square, end_square) and self.board.is_path_clear(start_square, rook_square):
+                rook_square = board.squares[start_square.index - 4]
+                if rook_square.piece and isinstance(rook_square.piece, Rook):
+                    if board.is_path_clear(start_square, end_square) and board.is_path_clear(start_square, rook_square):
                         return True
 
         return False
+
+    def candidate_squares(self, start_square, last_move=None):
+        yield from super().candidate_squares(start_square, last_move)
+        board = start_square.board
+        if start_square.x == 4 and board.castling_rights & (CASTLING_KINGSIDE[self.color] | CASTLING_QUEENSIDE[self.color]):
+            for end_x in (2, 6):
+                end_square = board.squares[start_square.index - start_square.x + end_x]
+                if self.is_valid_move(start_square, end_square, last_move):
+                    yield end_square
     
     def can_castle(self, start_square, end_square):
         # Castling conditions
-        if self.has_moved or self.board.is_king_in_check(self.color):
-            return False
-        
+        board = start_square.board
         direction = end_square.x - start_square.x
         if abs(direction) != 2:
             return False
 
-        rook_square = self.board.get_square(Square.columns[end_square.x + (1 if direction < 0 else -1)] + str(start_square.y + 1))
+        right = CASTLING_KINGSIDE[self.color] if direction > 0 else CASTLING_QUEENSIDE[self.color]
+        if not board.castling_rights & right or board.is_king_in_check(self.color):
+            return False
+
+        rook_square = board.squares[start_square.y * 8 + (7 if direction > 0 else 0)]
         rook = rook_square.piece
-        if not isinstance(rook, Rook) or rook.has_moved:
+        if not isinstance(rook, Rook) or rook.color != self.color:
             return False
 
-        path_clear = self.board.is_path_clear(start_square, end_square)
-        if path_clear and not self.board.is_path_under_attack(start_square, end_square, self.color):
+        path_clear = board.is_path_clear(start_square, end_square)
+        if path_clear and not board.is_path_under_attack(start_square, end_square, self.color):
             return True
 
         return False
 
+# Zobrist keys: a position hashes to the XOR of the keys of its pieces, castling
+# rights, en passant file and side to move, so each move updates it with a few XORs
+_zobrist_random = random.Random(20240601)
+ZOBRIST_PIECES = {(piece_type, color): [_zobrist_random.getrandbits(64) for _ in range(64)]
+                  for piece_type in (Pawn, Knight, Bishop, Rook, Queen, King) for color in (Color.WHITE, Color.BLACK)}
+ZOBRIST_BLACK_TO_MOVE = _zobrist_random.getrandbits(64)
+_castling_keys = [_zobrist_random.getrandbits(64) for _ in range(4)]
+ZOBRIST_CASTLING = [0] * 16  # Indexed by a castling rights mask
+for _rights in range(16):
+    for _bit in range(4):
+        if _rights & (1 << _bit):
+            ZOBRIST_CASTLING[_rights] ^= _castling_keys[_bit]
+ZOBRIST_EN_PASSANT = [_zobrist_random.getrandbits(64) for _ in range(8)]
+
+# Castling rights are a mask of these bits (K = 1, Q = 2, k = 4, q = 8)
+CASTLING_KINGSIDE = {Color.WHITE: 1, Color.BLACK: 4}
+CASTLING_QUEENSIDE = {Color.WHITE: 2, Color.BLACK: 8}
+# Rights kept when a piece moves from or to each square: a king or rook leaving
+# its starting square, or a rook being captured there, gives up castling
+CASTLING_KEPT = [15] * 64
+CASTLING_KEPT[4], CASTLING_KEPT[0], CASTLING_KEPT[7] = 15 & ~3, 15 & ~2, 15 & ~1
+CASTLING_KEPT[60], CASTLING_KEPT[56], CASTLING_KEPT[63] = 15 & ~12, 15 & ~8, 15 & ~4
+
+SQUARE_INDEX = {f"{Square.columns[x]}{y + 1}": y * 8 + x for y in range(8) for x in range(8)}
+
 class Board:
-    def __init__(self):
+    # Attributes computed from the pieces on the squares. load_fen drops them and
+    # __getattr__ rebuilds them on first use, so loading a position only pays for
+    # parsing it and the usual attribute lookups pay nothing extra.
+    _derived = ('zobrist_hash', 'attacks', 'king_squares')
+
+    def __init__(self, fen=None):
         # Initialize the board with squares and setup pieces
-        self.board = {Square.columns[x] + str(y + 1): Square(x, y) for x in range(8) for y in range(8)}
-        self.setup_board()
+        self.squares = [Square(x, y, self) for y in range(8) for x in range(8)]  # Indexed by y * 8 + x
+        self.castling_rights = 0
+        if fen is None:
+            self.setup_board()
+        else:
+            self.load_fen(fen)
+
+    def __getattr__(self, name):
+        if name in self._derived and 'squares' in self.__dict__:
+            self._rebuild()
+            return self.__dict__[name]
+        raise AttributeError(f"{type(self).__name__!r} object has no attribute {name!r}")
 
     def setup_board(self):
-        # Set up pawns
-        for i in range(8):
-            self.board[f"{Square.columns[i]}2"].piece = Pawn(Color.WHITE, self)
-            self.board[f"{Square.columns[i]}7"].piece = Pawn(Color.BLACK, self)
-
-        # Set up rooks
-        self.board["a1"].piece = Rook(Color.WHITE, self)
-        self.board["h1"].piece = Rook(Color.WHITE, self)
-        self.board["a8"].piece = Rook(Color.BLACK, self)
-        self.board["h8"].piece = Rook(Color.BLACK, self)
-
-        # Set up knights
-        self.board["b1"].piece = Knight(Color.WHITE, self)
-        self.board["g1"].piece = Knight(Color.WHITE, self)
-        self.board["b8"].piece = Knight(Color.BLACK, self)
-        self.board["g8"].piece = Knight(Color.BLACK, self)
-
-        # Set up bishops
-        self.board["c1"].piece = Bishop(Color.WHITE, self)
-        self.board["f1"].piece = Bishop(Color.WHITE, self)
-        self.board["c8"].piece = Bishop(Color.BLACK, self)
-        self.board["f8"].piece = Bishop(Color.BLACK, self)
-
-        # Set up queens
-        self.board["d1"].piece = Queen(Color.WHITE, self)
-        self.board["d8"].piece = Queen(Color.BLACK, self)
-
-        # Set up kings
-        self.board["e1"].piece = King(Color.WHITE, self)
-        self.board["e8"].piece = King(Color.BLACK, self)
+        self.load_fen(START_FEN)
+
+    def load_fen(self, fen):
+        """Replace the position with the placement and castling fields of a FEN string."""
+        fields = fen.split()
+        if not fields:
+            raise ValueError(f"Invalid FEN: {fen!r}")
+        castling = fields[2] if len(fields) > 2 else '-'
+        rights = CASTLING_FIELDS.get(castling)
+        if rights is None:
+            rights = sum(1 << right for right, char in enumerate('KQkq') if char in castling)
+        self.set_position(placement_pieces(fields[0]), rights)
+
+    def set_position(self, pieces, castling_rights=0):
+        """Replace the position with 64 pieces (or None) indexed by y * 8 + x."""
+        for square, piece in zip(self.squares, pieces):
+            square.piece = piece
+        self.castling_rights = castling_rights
+        for name in self._derived:
+            self.__dict__.pop(name, None)
+
+    @classmethod
+    def from_fen(cls, fen):
+        return cls(fen)
+
+    def to_fen(self):
+        """Return the placement field of the position in FEN."""
+        ranks = []
+        for y in range(7, -1, -1):
+            rank, empty = '', 0
+            for square in self.squares[y * 8:y * 8 + 8]:
+                if square.piece is None:
+                    empty += 1
+                    continue
+                if empty:
+                    rank += str(empty)
+                    empty = 0
+                rank += square.piece.fen_letter
+            ranks.append(rank + str(empty) if empty else rank)
+        return '/'.join(ranks)
+
+    def castling_fen(self):
+        return ''.join(char for right, char in enumerate('KQkq') if self.castling_rights & 1 << right) or '-'
+
+    def _rebuild(self):
+        zobrist_hash = 0
+        for index, square in enumerate(self.squares):
+            piece = square.piece
+            if piece is not None:
+                zobrist_hash ^= ZOBRIST_PIECES[type(piece), piece.color][index]
+        self.zobrist_hash = zobrist_hash  # Covers piece placement only, see Game.zobrist_hash
+        self._build_maps()
+
+    def _build_maps(self):
+        # Number of pieces of each color attacking every square, kept up to date by set_piece
+        self.attacks = {Color.WHITE: array('B', bytes(64)), Color.BLACK: array('B', bytes(64))}
+        self.king_squares = {Color.WHITE: None, Color.BLACK: None}
+        for square in self.squares:
+            piece = square.piece
+            if piece is not None:
+                self._add_attacks(square, piece, 1)
+                if isinstance(piece, King):
+                    self.king_squares[piece.color] = square
+
+    def clear(self):
+        for square in self.squares:
+            self.set_piece(square, None)
+        self.castling_rights = 0
 
     def get_square(self, name):
-        return self.board[name]
+        return self.squares[SQUARE_INDEX[name]]
+
+    def set_piece(self, square, piece):
+        # Every placement goes through here so the hash and the attack maps or bitboards stay in sync
+        old_piece = square.piece
+        index = square.index
+        if old_piece is not None:
+            self.zobrist_hash ^= ZOBRIST_PIECES[type(old_piece), old_piece.color][index]
+        if piece is not None:
+            self.zobrist_hash ^= ZOBRIST_PIECES[type(piece), piece.color][index]
+        self._place(square, old_piece, piece)
+        square.piece = piece
+
+    def _place(self, square, old_piece, piece):
+        if old_piece is not None:
+            self._add_attacks(square, old_piece, -1)
+            if isinstance(old_piece, King) and self.king_squares[old_piece.color] is square:
+                self.king_squares[old_piece.color] = None
+        if (old_piece is None) != (piece is None):
+            # Sliders looking through this square are blocked or released beyond it
+            self._update_rays_through(square, -1 if old_piece is None else 1)
+        if piece is not None:
+            self._add_attacks(square, piece, 1)
+            if isinstance(piece, King):
+                self.king_squares[piece.color] = square
+
+    def _add_attacks(self, square, piece, delta):
+        squares = self.squares
+        counts = self.attacks[piece.color]
+        if isinstance(piece, Pawn):
+            for index in PAWN_TARGETS[1 if piece.color == Color.WHITE else -1][square.index]:
+                counts[index] += delta
+            return
+
+        if piece.targets is not None:
+            for index in piece.targets[square.index]:
+                counts[index] += delta
+        rays = RAYS[square.index]
+        for direction in piece.rays:
+            for index in rays[direction]:
+                counts[index] += delta
+                if squares[index].piece is not None:
+                    break
+
+    def _update_rays_through(self, square, delta):
+        squares = self.squares
+        rays = RAYS[square.index]
+        for direction, ray in enumerate(rays):
+            # The nearest piece behind the square is the only one whose ray can pass through it
+            for behind in rays[OPPOSITE[direction]]:
+                piece = squares[behind].piece
+                if piece is not None:
+                    if direction in piece.rays:
+                        counts = self.attacks[piece.color]
+                        for index in ray:
+                            counts[index] += delta
+                            if squares[index].piece is not None:
+                                break
+                    break
 
     def is_valid_move(self, start_pos, end_pos):
-        start_square = self.board[start_pos]
-        end_square = self.board[end_pos]
+        start_square = self.get_square(start_pos)
+        end_square = self.get_square(end_pos)
         piece = start_square.piece
         if piece is None:
             return False
@@ -222,226 +478,595 @@ class Board:
         piece = start_square.piece
         if piece and isinstance(piece, King) and abs(start_square.x - end_square.x) == 2:
             if end_square.x == start_square.x + 2:  # Kingside castling
-                rook_square = self.get_square(Square.columns[start_square.x + 3] + str(start_square.y + 1))
-                new_rook_square = self.get_square(Square.columns[start_square.x + 1] + str(start_square.y + 1))
+                rook_square = self.squares[start_square.index + 3]
+                new_rook_square = self.squares[start_square.index + 1]
             elif end_square.x == start_square.x - 2:  # Queenside castling
-                rook_square = self.get_square(Square.columns[start_square.x - 4] + str(start_square.y + 1))
-                new_rook_square = self.get_square(Square.columns[start_square.x - 1] + str(start_square.y + 1))
+                rook_square = self.squares[start_square.index - 4]
+                new_rook_square = self.squares[start_square.index - 1]
             rook = rook_square.piece
-            rook_square.piece = None
-            new_rook_square.piece = rook
-            rook.has_moved = True
+            self.set_piece(rook_square, None)
+            self.set_piece(new_rook_square, rook)
 
-        end_square.piece = piece
-        start_square.piece = None
-        piece.has_moved = True
+        self.set_piece(end_square, piece)
+        self.set_piece(start_square, None)
 
     def print_board(self, perspective=Color.WHITE):
-        if perspective == Color.WHITE:
-            rows = range(8, 0, -1)
-            cols = Square.columns
-        else:
-            rows = range(1, 9)
-            cols = list(reversed(Square.columns))
-
-        print("  " + " ".join(cols))
-        for y in rows:
-            row = f"{y} "
-            for x in cols:
-                square = self.board[f"{x}{y}"]
-                row += (str(square.piece) if square.piece else '.') + " "
-            print(row + f" {y}")
-        print("  " + " ".join(cols))
-        
-    def is_path_clear(self, start_square, end_square):
-        start_x, start_y = start_square.x, start_square.y
-        end_x, end_y = end_square.x, end_square.y
+        from cli import print_board
+        print_board(self, perspective)
 
-        dx = end_x - start_x
-        dy = end_y - start_y
+    def is_path_clear(self, start_square, end_square):
+        squares = self.squares
+        for index in BETWEEN[start_square.index][end_square.index]:
+            if squares[index].piece is not None:
+                return False
 
-        steps = max(abs(dx), abs(dy))
-        step_x = dx // steps if steps != 0 else 0
-        step_y = dy // steps if steps != 0 else 0
+        return True
 
-        x, y = start_x, start_y
+    def find_king(self, color):
+        return self.king_squares[color]
 
-        for _ in range(steps - 1):
-            x += step_x
-            y += step_y
-            if self.board[Square.columns[x] + str(y + 1)].piece is not None:
-                return False
+    def squares_of(self, color):
+        """Return squares that include every square holding a piece of the given color."""
+        return self.squares
 
-        return True   
+    def is_square_attacked(self, square, color):
+        """Check if any piece of the given color attacks the square."""
+        return self.attacks[color][square.index] > 0
 
     def is_king_in_check(self, color):
-        king_square = None
-        for square in self.board.values():
-            piece = square.piece
-            if isinstance(piece, King) and piece.color == color:
-                king_square = square
-                break
-        
+        king_square = self.find_king(color)
         if king_square:
-            for square in self.board.values():
-                piece = square.piece
-                if piece and piece.color != color and piece.is_valid_move(square, king_square):
-                    return True
-
+            enemy = Color.BLACK if color == Color.WHITE else Color.WHITE
+            return self.is_square_attacked(king_square, enemy)
         return False
     
     def is_path_under_attack(self, start_square, end_square, color):
-        start_x, start_y = start_square.x, start_square.y
-        end_x, end_y = end_square.x, end_square.y
+        enemy = Color.BLACK if color == Color.WHITE else Color.WHITE
+        start, end = start_square.index, end_square.index
+        if start != end and LINE[start][end] == NO_LINE:
+            return False
 
-        if start_x == end_x:  # Vertical move
-            step = 1 if start_y < end_y else -1
-            for y in range(start_y, end_y + step, step):
-                square = self.get_square(Square.columns[start_x] + str(y + 1))
-                for sq in self.board.values():
-                    piece = sq.piece
-                    if piece and piece.color != color and piece.is_valid_move(sq, square):
-                        return True
-        elif start_y == end_y:  # Horizontal move
-            step = 1 if start_x < end_x else -1
-            for x in range(start_x, end_x + step, step):
-                square = self.get_square(Square.columns[x] + str(start_y + 1))
-                for sq in self.board.values():
-                    piece = sq.piece
-                    if piece and piece.color != color and piece.is_valid_move(sq, square):
-                        return True
-        elif abs(start_x - end_x) == abs(start_y - end_y):  # Diagonal move
-            step_x = 1 if start_x < end_x else -1
-            step_y = 1 if start_y < end_y else -1
-            x, y = start_x, start_y
-            while x != end_x + step_x and y != end_y + step_y:
-                square = self.get_square(Square.columns[x] + str(y + 1))
-                for sq in self.board.values():
-                    piece = sq.piece
-                    if piece and piece.color != color and piece.is_valid_move(sq, square):
-                        return True
-                x += step_x
-                y += step_y
+        for index in (start, *BETWEEN[start][end], end):
+            if self.is_square_attacked(self.squares[index], enemy):
+                return True
 
         return False
-    
-    def is_checkmate(self, color):
-        """Check if the given color is in checkmate."""
-        if not self.is_king_in_check(color):
-            return False
 
-        for square in self.board.values():
-            piece = square.piece
-            if piece and piece.color == color:
-                for x in range(8):
-                    for y in range(8):
-                        target_square = self.board[Square.columns[x] + str(y + 1)]
-                        if piece.is_valid_move(square, target_square):
-                            # Move piece temporarily
-                            original_piece = target_square.piece
-                            target_square.piece = piece
-                            square.piece = None
-
-                            # Check if king is still in check
-                            if not self.is_king_in_check(color):
-                                # Restore the pieces
-                                square.piece = piece
-                                target_square.piece = original_piece
-                                return False
-
-                            # Restore the pieces
-                            square.piece = piece
-                            target_square.piece = original_piece
+    def checks_and_pins(self, king_square, color):
+        """Find the pieces giving check to the king on king_square and the pieces pinned to it.
+
+        Returns the checking squares, the squares a non-king move must land on to
+        answer a single check (None when not in check) and a mapping of pinned
+        squares to the squares they may still move to.
+        """
+        squares = self.squares
+        index = king_square.index
+        checkers = []
+        block = set()
+        pins = {}
+
+        # A pawn checks from the squares a pawn of our own color on the king square would attack
+        for target in PAWN_TARGETS[1 if color == Color.WHITE else -1][index]:
+            square = squares[target]
+            if isinstance(square.piece, Pawn) and square.piece.color != color:
+                checkers.append(square)
+                block.add(square)
+
+        for target in KNIGHT_TARGETS[index]:
+            square = squares[target]
+            if isinstance(square.piece, Knight) and square.piece.color != color:
+                checkers.append(square)
+                block.add(square)
+
+        for direction, targets in enumerate(RAYS[index]):
+            ray = []
+            pinned = None
+            for target in targets:
+                square = squares[target]
+                ray.append(square)
+                piece = square.piece
+                if piece is not None:
+                    if piece.color == color:
+                        if pinned is not None:
+                            break
+                        pinned = square
+                    else:
+                        if direction in piece.rays:
+                            if pinned is None:
+                                checkers.append(square)
+                                block.update(ray)
+                            else:
+                                pins[pinned] = set(ray)
+                        break
+
+        return checkers, (block if checkers else None), pins
+
+    def legal_moves(self, color, last_move=None):
+        """Yield every legal move for the given color.
+
+        The board is changed temporarily while king and en passant moves are
+        checked, so consume the generator before making any of the moves.
+        """
+        enemy = Color.BLACK if color == Color.WHITE else Color.WHITE
+        king_square = self.find_king(color)
+        if king_square:
+            checkers, block, pins = self.checks_and_pins(king_square, color)
+        else:
+            checkers, block, pins = [], None, {}
 
-        return True
+        for square in self.squares_of(color):
+            piece = square.piece
+            if piece is None or piece.color != color:
+                continue
+
+            if square is king_square:
+                yield from self._king_moves(square, piece, enemy, last_move)
+                continue
+            if len(checkers) > 1:
+                continue
+
+            pin = pins.get(square)
+            is_pawn = isinstance(piece, Pawn)
+            for target in piece.candidate_squares(square, last_move):
+                if pin is not None and target not in pin:
+                    continue
+                if is_pawn and target.x != square.x and target.piece is None:
+                    # En passant removes two pieces from the capture rank, so play it out
+                    captured_square = self.squares[square.y * 8 + target.x]
+                    if not self._exposes_king(square, target, captured_square, color):
+                        yield Move(square, target, piece, captured_square.piece)
+                    continue
+                if block is not None and target not in block:
+                    continue
+                if is_pawn and target.y in (0, 7):
+                    for promotion in PROMOTION_PIECES.values():
+                        yield Move(square, target, piece, target.piece, promotion)
+                else:
+                    yield Move(square, target, piece, target.piece)
+
+    def _king_moves(self, king_square, king, enemy, last_move):
+        targets = list(king.candidate_squares(king_square, last_move))
+        # Lift the king so squares behind it on a checking ray count as attacked
+        self.set_piece(king_square, None)
+        safe = [target for target in targets if not self.is_square_attacked(target, enemy)]
+        self.set_piece(king_square, king)
+        for target in safe:
+            yield Move(king_square, target, king, target.piece)
+
+    def _exposes_king(self, start_square, end_square, captured_square, color):
+        piece = start_square.piece
+        captured_piece = captured_square.piece
+        self.set_piece(captured_square, None)
+        self.set_piece(end_square, piece)
+        self.set_piece(start_square, None)
+        in_check = self.is_king_in_check(color)
+        self.set_piece(start_square, piece)
+        self.set_piece(end_square, None)
+        self.set_piece(captured_square, captured_piece)
+        return in_check
+
+    def has_legal_move(self, color, last_move=None):
+        return next(self.legal_moves(color, last_move), None) is not None
+
+    def is_checkmate(self, color, last_move=None):
+        """Check if the given color is in checkmate."""
+        return self.is_king_in_check(color) and not self.has_legal_move(color, last_move)
 
-    def is_stalemate(self, color):
+    def is_stalemate(self, color, last_move=None):
         """Check if the given color is in stalemate."""
-        if self.is_king_in_check(color):
-            return False
+        return not self.is_king_in_check(color) and not self.has_legal_move(color, last_move)
 
-        for square in self.board.values():
-            piece = square.piece
-            if piece and piece.color == color:
-                for x in range(8):
-                    for y in range(8):
-                        target_square = self.board[Square.columns[x] + str(y + 1)]
-                        if piece.is_valid_move(square, target_square):
-                            # Move piece temporarily
-                            original_piece = target_square.piece
-                            target_square.piece = piece
-                            square.piece = None
-
-                            # Check if king is in check
-                            if not self.is_king_in_check(color):
-                                # Restore the pieces
-                                square.piece = piece
-                                target_square.piece = original_piece
-                                return False
-
-                            # Restore the pieces
-                            square.piece = piece
-                            target_square.piece = original_piece
+    def stats(self):
+        """Return an instrument.Snapshot of rule-check calls, empty unless instrument.enable() was called."""
+        from instrument import snapshot
+        return snapshot()
 
-        return True
+    def has_insufficient_material(self):
+        """Check if neither side can ever mate: bare kings, a single minor piece, or only bishops on one square color."""
+        minors = []
+        for square in self.squares:
+            piece = square.piece
+            if piece is None or isinstance(piece, King):
+                continue
+            if not isinstance(piece, (Knight, Bishop)):
+                return False
+            minors.append(square)
+        if len(minors) <= 1:
+            return True
+        return (all(isinstance(square.piece, Bishop) for square in minors) and
+                len({(square.x + square.y) % 2 for square in minors}) == 1)
     
+PIECE_LETTERS = {piece_type.letter: piece_type for piece_type in (Pawn, Knight, Bishop, Rook, Queen, King)}
+PROMOTION_PIECES = {'q': Queen, 'r': Rook, 'b': Bishop, 'n': Knight}
+# Pieces are shared, so a FEN letter maps straight to the instance to place
+FEN_PIECES = {'.': None}
+for _piece_type in PIECE_LETTERS.values():
+    FEN_PIECES[_piece_type.letter.upper()] = _piece_type(Color.WHITE)
+    FEN_PIECES[_piece_type.letter] = _piece_type(Color.BLACK)
+# Turns each digit of a FEN placement into that many empty squares and drops the rank separators
+FEN_EXPAND = str.maketrans({**{str(count): '.' * count for count in range(1, 9)}, '/': None})
+
+
+def expand_placement(placement):
+    """Return the placement field of a FEN as 64 characters indexed by y * 8 + x, '.' for empty squares."""
+    # Reverse the ranks so the expanded placement lines up with Board.squares
+    expanded = '/'.join(reversed(placement.split('/'))).translate(FEN_EXPAND)
+    if len(expanded) != 64:
+        raise ValueError(f"Invalid FEN placement: {placement!r}")
+    return expanded
+
+
+RANK_CACHE_SIZE = 65536
+_rank_pieces = {}  # Rank field of a FEN to its eight pieces, filled as ranks are loaded
+
+
+def placement_pieces(placement):
+    """Return the 64 pieces (or None) of a FEN placement field indexed by y * 8 + x."""
+    ranks = placement.split('/')
+    if len(ranks) != 8:
+        raise ValueError(f"Invalid FEN placement: {placement!r}")
+    pieces = []
+    # Most ranks of real positions repeat from one FEN to the next, so each is parsed once
+    for rank in reversed(ranks):
+        row = _rank_pieces.get(rank)
+        if row is None:
+            try:
+                row = tuple(map(FEN_PIECES.__getitem__, rank.translate(FEN_EXPAND)))
+            except KeyError:
+                raise ValueError(f"Invalid FEN placement: {placement!r}") from None
+            if len(row) != 8:
+                raise ValueError(f"Invalid FEN placement: {placement!r}")
+            if len(_rank_pieces) < RANK_CACHE_SIZE:
+                _rank_pieces[rank] = row
+        pieces += row
+    return pieces
+
+
+# Castling field of a FEN to the rights bits, for every field in the usual order
+CASTLING_FIELDS = {''.join(char for right, char in enumerate('KQkq') if rights & 1 << right) or '-': rights
+                   for rights in range(16)}
+
+# Side to move field of a FEN to the color, and the en passant targets open to that color
+FEN_TURNS = {'w': Color.WHITE, 'b': Color.BLACK}
+EN_PASSANT_TARGETS = {Color.WHITE: {f"{column}6" for column in Square.columns},
+                      Color.BLACK: {f"{column}3" for column in Square.columns}}
+
+
+def fen_turn(fields):
+    """Return the side to move and en passant target (a square name or None) of a split FEN, checking both."""
+    turn = FEN_TURNS.get(fields[1])
+    if turn is None:
+        raise ValueError(f"Invalid FEN side to move: {fields[1]!r}")
+    en_passant = fields[3]
+    if en_passant == '-':
+        return turn, None
+    if en_passant not in EN_PASSANT_TARGETS[turn]:
+        raise ValueError(f"Invalid FEN en passant square for {fields[1]} to move: {en_passant!r}")
+    return turn, en_passant
+
+
+START_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+STATUS_CACHE_SIZE = 1024  # Positions whose status each Game remembers
+
 class Move:
-    def __init__(self, start_pos, end_pos, piece, captured_piece=None):
+    __slots__ = ('start_pos', 'end_pos', 'piece', 'captured_piece', 'promotion', 'captured_square', 'rook_squares',
+                 'previous_last_move', 'previous_castling_rights', 'previous_halfmove_clock', 'previous_state_hash',
+                 'position_key')
+
+    def __init__(self, start_pos, end_pos, piece, captured_piece=None, promotion=None):
         self.start_pos = start_pos
         self.end_pos = end_pos
         self.piece = piece
         self.captured_piece = captured_piece
+        self.promotion = promotion  # Piece class a pawn turns into on the last rank
+
+        # Filled in by Game.make_move so the move can be undone exactly
+        self.captured_square = None  # Differs from end_pos for en passant
+        self.rook_squares = None  # (start, end) of the rook when castling
+        self.previous_last_move = None
+        self.previous_castling_rights = 0
+        self.previous_halfmove_clock = 0
+        self.previous_state_hash = 0
+        self.position_key = 0  # Game.zobrist_hash before the move, for repetition counts
+
+    def to_uci(self):
+        return f"{self.start_pos!r}{self.end_pos!r}{self.promotion.letter if self.promotion else ''}"
 
     def __repr__(self):
+        if self.promotion:
+            return f"{self.piece}{self.start_pos}->{self.end_pos}={self.promotion(self.piece.color)}"
         return f"{self.piece}{self.start_pos}->{self.end_pos}"
 
+# Bytes of one Move, and those a cached list of about 35 moves takes on average
+MOVE_SIZE = -(-sys.getsizeof(Move(None, None, None)) // 16) * 16
+MOVE_LIST_VALUE_SIZE = sys.getsizeof([None] * 35) + 35 * MOVE_SIZE
+
+
+def move_list_size(moves):
+    """Bytes a cached legal move list holds, to measure the values of a move cache with."""
+    return -(-sys.getsizeof(moves) // 16) * 16 + len(moves) * MOVE_SIZE
+
 class Game:
-    def __init__(self):
-        self.board = Board()
+    def __init__(self, board=None):
+        self.board = board if board is not None else Board()
         self.current_turn = Color.WHITE
         self.last_move = None  # Track the last move
+        self.move_stack = []  # Moves made so far, most recent last
+        self.halfmove_clock = 0  # Plies since the last capture or pawn move
+        self.fullmove_number = 1
+        self.state_hash = self._compute_state_hash()  # Zobrist keys not covered by the board
+        # Optional TranspositionTable for legal move lists, which stays within its budget when created as
+        # TranspositionTable(memory_mb, MOVE_LIST_VALUE_SIZE, move_list_size)
+        self.move_cache = None
+        self.position_counts = {}  # Times each position before a move in move_stack occurred
+        self.status_cache = None  # LRUCache of position statuses, created by status
+        self.searcher = None  # Created by best_move, keeps its tables between moves
+        self.book = None  # Optional book.OpeningBook that best_move consults before searching
+        self.tablebase = None  # Optional tablebase.Tablebase that best_move consults in endgames
+
+    @classmethod
+    def from_fen(cls, fen, board=None):
+        """Create a game from a FEN string, loading it into board if one is given."""
+        fields = fen.split()
+        if len(fields) < 4:
+            raise ValueError(f"Invalid FEN, expected at least four fields: {fen!r}")
+        turn, en_passant = fen_turn(fields)
+        if board is None:
+            board = Board(fen)
+        else:
+            board.load_fen(fen)
+        game = cls(board)
+        game._load_state(fields, turn, en_passant)
+        return game
+
+    def load_fen(self, fen):
+        """Replace the position with a FEN string, keeping this game's board and caches.
+
+        The move history is cleared. Loading many positions into one game this
+        way skips allocating a board and a game for each of them.
+        """
+        fields = fen.split()
+        if len(fields) < 4:
+            raise ValueError(f"Invalid FEN, expected at least four fields: {fen!r}")
+        turn, en_passant = fen_turn(fields)
+        self.board.load_fen(fen)
+        self.move_stack = []
+        self.position_counts = {}
+        self._load_state(fields, turn, en_passant)
+
+    def _load_state(self, fields, turn, en_passant):
+        board = self.board
+        self.current_turn = turn
+        self.last_move = None
+        if en_passant is not None:
+            # Recreate the double pawn push that allowed the capture
+            target = board.get_square(en_passant)
+            direction = -1 if target.y == 5 else 1
+            self.last_move = (board.squares[(target.y - direction) * 8 + target.x],
+                              board.squares[(target.y + direction) * 8 + target.x])
+        if len(fields) > 5:
+            self.halfmove_clock = int(fields[4])
+            self.fullmove_number = int(fields[5])
+        else:
+            self.halfmove_clock, self.fullmove_number = 0, 1
+        self.state_hash = self._compute_state_hash()
+
+    def to_fen(self):
+        en_passant = '-'
+        if self.last_move is not None:
+            start_square, end_square = self.last_move
+            if isinstance(end_square.piece, Pawn) and abs(start_square.y - end_square.y) == 2:
+                en_passant = f"{Square.columns[end_square.x]}{(start_square.y + end_square.y) // 2 + 1}"
+        turn = 'w' if self.current_turn == Color.WHITE else 'b'
+        return (f"{self.board.to_fen()} {turn} {self.board.castling_fen()} {en_passant} "
+                f"{self.halfmove_clock} {self.fullmove_number}")
+
+    @property
+    def zobrist_hash(self):
+        """Hash of the position: placement, side to move, castling rights and en passant file."""
+        return self.board.zobrist_hash ^ self.state_hash
+
+    def _compute_state_hash(self):
+        state_hash = ZOBRIST_CASTLING[self.board.castling_rights] ^ self._en_passant_key()
+        if self.current_turn == Color.BLACK:
+            state_hash ^= ZOBRIST_BLACK_TO_MOVE
+        return state_hash
+
+    def en_passant_file(self):
+        """Return the file an en passant capture can be made on, or None."""
+        if self.last_move is None:
+            return None
+        start_square, end_square = self.last_move
+        pawn = end_square.piece
+        if not isinstance(pawn, Pawn) or abs(start_square.y - end_square.y) != 2:
+            return None
+        for x in (end_square.x - 1, end_square.x + 1):
+            if 0 <= x < 8:
+                piece = self.board.squares[end_square.y * 8 + x].piece
+                if isinstance(piece, Pawn) and piece.color != pawn.color:
+                    return end_square.x
+        return None
+
+    def _en_passant_key(self):
+        file = self.en_passant_file()
+        return 0 if file is None else ZOBRIST_EN_PASSANT[file]
 
     def setup_board(self):
         self.board.setup_board()
 
     def switch_turn(self):
         self.current_turn = Color.BLACK if self.current_turn == Color.WHITE else Color.WHITE
+        self.state_hash ^= ZOBRIST_BLACK_TO_MOVE
 
     def undo_move(self):
-        self.make_move(self.last_move.end_pos,self.last_move.start_pos)
-        self.board[self.last_move.end_pos].piece = self.last_move.captured_piece 
-
-    def make_move(self, start_square, end_square):
+        """Take back the most recent make_move and return its Move record."""
+        if not self.move_stack:
+            return None
+        move = self.move_stack.pop()
+        self.board.set_piece(move.start_pos, move.piece)
+        self.board.set_piece(move.end_pos, None)
+        if move.captured_square is not None:
+            self.board.set_piece(move.captured_square, move.captured_piece)
+        if move.rook_squares is not None:
+            rook_square, new_rook_square = move.rook_squares
+            rook = new_rook_square.piece
+            self.board.set_piece(new_rook_square, None)
+            self.board.set_piece(rook_square, rook)
+        self.board.castling_rights = move.previous_castling_rights
+        self.halfmove_clock = move.previous_halfmove_clock
+        if move.piece.color == Color.BLACK:
+            self.fullmove_number -= 1
+        self.last_move = move.previous_last_move
+        self.state_hash = move.previous_state_hash
+        count = self.position_counts[move.position_key] - 1
+        if count:
+            self.position_counts[move.position_key] = count
+        else:
+            del self.position_counts[move.position_key]
+        return move
+
+    def push(self, move):
+        """Make a move from legal_moves and pass the turn to the other side."""
+        self.make_move(move.start_pos, move.end_pos, move.promotion)
+        self.switch_turn()
+
+    def pop(self):
+        """Take back the last pushed move, handing the turn back."""
+        self.switch_turn()
+        return self.undo_move()
+
+    def status(self):
+        """Return the Status of the game for the side to move.
+
+        Checkmate, stalemate, insufficient material and check depend only on the
+        position and are cached by zobrist_hash, so repeated queries cost a
+        dictionary lookup. The fifty-move rule and repetitions come from the clock
+        and the position history. When a tablebase is set and covers the position,
+        a game not yet over by the rules returns one of Status.DECIDED.
+        """
+        if self.status_cache is None:
+            self.status_cache = LRUCache(STATUS_CACHE_SIZE)
+        key = self.zobrist_hash
+        status = self.status_cache.get(key)
+        if status is None:
+            status = self._position_status()
+            self.status_cache.put(key, status)
+        if status in Status.OVER:
+            return status
+        if self.halfmove_clock >= 100:
+            return Status.FIFTY_MOVES
+        if self.repetition_count() >= 3:
+            return Status.THREEFOLD_REPETITION
+        if self.tablebase is not None:
+            outcome = self.tablebase.probe(self)
+            if outcome is not None:
+                return (Status.TABLEBASE_LOSS, Status.TABLEBASE_DRAW, Status.TABLEBASE_WIN)[outcome[0] + 1]
+        return status
+
+    def _position_status(self):
+        board = self.board
+        in_check = board.is_king_in_check(self.current_turn)
+        if not board.has_legal_move(self.current_turn, self.last_move):
+            return Status.CHECKMATE if in_check else Status.STALEMATE
+        if board.has_insufficient_material():
+            return Status.INSUFFICIENT_MATERIAL
+        return Status.CHECK if in_check else Status.IN_PROGRESS
+
+    def repetition_count(self):
+        """Return how many times the current position has occurred in this game."""
+        return self.position_counts.get(self.zobrist_hash, 0) + 1
+
+    def legal_moves(self):
+        if self.move_cache is None:
+            return list(self.board.legal_moves(self.current_turn, self.last_move))
+        # Cached lists are shared between calls, so callers must not modify them
+        key = self.zobrist_hash
+        moves = self.move_cache.probe(key)
+        if moves is None:
+            moves = list(self.board.legal_moves(self.current_turn, self.last_move))
+            self.move_cache.store(key, moves)
+        return moves
+
+    def make_move(self, start_square, end_square, promotion=None):
         piece = start_square.piece
+        move = Move(start_square, end_square, piece, end_square.piece)
+        if end_square.piece is not None:
+            move.captured_square = end_square
+        move.previous_last_move = self.last_move
+        move.previous_castling_rights = self.board.castling_rights
+        move.previous_halfmove_clock = self.halfmove_clock
+        move.previous_state_hash = self.state_hash
+        move.position_key = self.zobrist_hash
+        self.position_counts[move.position_key] = self.position_counts.get(move.position_key, 0) + 1
+        previous_keys = ZOBRIST_CASTLING[move.previous_castling_rights] ^ self._en_passant_key()
+
         if isinstance(piece, King) and abs(start_square.x - end_square.x) == 2:
             # Handle castling
             rook_square = self.board.get_square('a' + str(start_square.y + 1)) if end_square.x < start_square.x else self.board.get_square('h' + str(start_square.y + 1))
             new_rook_square = self.board.get_square(Square.columns[start_square.x - 1] + str(start_square.y + 1)) if end_square.x < start_square.x else self.board.get_square(Square.columns[start_square.x + 1] + str(start_square.y + 1))
             rook = rook_square.piece
-            rook_square.piece = None
-            new_rook_square.piece = rook
-            rook.has_moved = True
+            move.rook_squares = (rook_square, new_rook_square)
+            self.board.set_piece(rook_square, None)
+            self.board.set_piece(new_rook_square, rook)
 
         # Handle en passant capture
         if isinstance(piece, Pawn):
             direction = 1 if piece.color == Color.WHITE else -1
             if abs(start_square.x - end_square.x) == 1 and start_square.y + direction == end_square.y and end_square.piece is None:
                 en_passant_square = self.board.get_square(Square.columns[end_square.x] + str(start_square.y + 1))
-                en_passant_square.piece = None
-
-        end_square.piece = piece
-        start_square.piece = None
-        piece.has_moved = True
+                move.captured_piece = en_passant_square.piece
+                move.captured_square = en_passant_square
+                self.board.set_piece(en_passant_square, None)
+
+            # Handle promotion, defaulting to a queen
+            if end_square.y in (0, 7):
+                move.promotion = promotion or Queen
+                piece = move.promotion(piece.color)
+
+        self.board.set_piece(end_square, piece)
+        self.board.set_piece(start_square, None)
+        self.board.castling_rights &= (CASTLING_KEPT[start_square.index] &
+                                       CASTLING_KEPT[end_square.index])
         self.last_move = (start_square, end_square)  # Update the last move
-
-    def play_move(self, start_pos, end_pos):
+        if isinstance(move.piece, Pawn) or move.captured_piece is not None:
+            self.halfmove_clock = 0
+        else:
+            self.halfmove_clock += 1
+        if move.piece.color == Color.BLACK:
+            self.fullmove_number += 1
+        self.state_hash ^= previous_keys ^ ZOBRIST_CASTLING[self.board.castling_rights] ^ self._en_passant_key()
+        self.move_stack.append(move)
+        return move
+
+    def best_move(self, depth=None, time_limit=None):
+        """Search for the best move for the side to move.
+
+        Searches to depth plies, or deepens until time_limit seconds have passed,
+        and returns a SearchResult with the move, score, nodes and principal variation.
+        A move from the opening book or the endgame tablebase, when there is one,
+        is returned unsearched at depth 0.
+        """
+        from search import SearchResult, Searcher
+        if self.book is not None:
+            move = self.book.choose(self)
+            if move is not None:
+                return SearchResult(move, 0, 0, 0, 0.0, [move])
+        if self.tablebase is not None:
+            found = self.tablebase.best_move(self)
+            if found is not None:
+                return SearchResult(found[0], found[1], 0, 0, 0.0, [found[0]])
+        if self.searcher is None:
+            self.searcher = Searcher()
+        return self.searcher.search(self, depth, time_limit)
+
+    def play_move(self, start_pos, end_pos, promotion=None):
         start_square = self.board.get_square(start_pos)
         end_square = self.board.get_square(end_pos)
         piece = start_square.piece
 
         if piece and piece.color == self.current_turn:
             if piece.is_valid_move(start_square, end_square, self.last_move):  # Pass the last move to the pawn's is_valid_move method
-                self.make_move(start_square, end_square)
+                self.make_move(start_square, end_square, promotion)
                 if self.board.is_king_in_check(self.current_turn):
                     self.undo_move()
                     return False
@@ -449,38 +1074,17 @@ class Game:
                 return True
         return False
 
+    def stats(self):
+        return self.board.stats()
+
     def print_board(self):
         self.board.print_board(self.current_turn)
 
     def play(self):
-        f = Figlet(font = "slant")
-        print(f.renderText("Welcome to Chess!"))
-        self.print_board()
-        while True:
-            if self.board.is_checkmate(self.current_turn):
-                print(f.renderText(f"{self.current_turn} is in checkmate. Game over!"))
-                break
-            elif self.board.is_stalemate(self.current_turn):
-                print("Stalemate. Game over!")
-                break
-
-            if self.board.is_king_in_check(self.current_turn):
-                print(f"{self.current_turn}'s king is in check")
-
-            command = input(f"{self.current_turn}'s turn. Enter your move (e.g., e2 e4) or 'end' to quit: ").strip()
-            if len(command.split()) == 2:
-                start_pos, end_pos = command.split()
-                if self.play_move(start_pos, end_pos):
-                    print(f"Moved from {start_pos} to {end_pos}.")
-                else:
-                    print("Invalid move. Try again.")
-            elif command.lower() == "end":
-                print(f.renderText("Game ended by user."))
-                break
-            else:
-                print("Invalid command. Try again.")
-            self.print_board()
+        """Play at the terminal, see cli.py."""
+        from cli import play
+        play(self)
 
 if __name__ == "__main__":
-    game = Game()
-    game.play()
+    from cli import main
+    main()
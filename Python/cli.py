@@ -0,0 +1,99 @@
+"""Terminal front end: board rendering, banners and the interactive game.
+
+The rules in chess.py import nothing for display. Banners use pyfiglet when it
+is installed, imported the first time one is drawn, and fall back to plain
+text when it is not.
+
+    python cli.py
+    python cli.py --fen "<fen>"
+"""
+import argparse
+
+from chess import PROMOTION_PIECES, START_FEN, Color, Game, Square, Status
+
+BANNER_FONT = "slant"
+_figlet = None  # Created by banner on first use, False when pyfiglet is missing
+
+
+def banner(text):
+    """Return text as a figlet banner, or unchanged when pyfiglet is not installed."""
+    global _figlet
+    if _figlet is None:
+        try:
+            from pyfiglet import Figlet
+        except ImportError:
+            _figlet = False
+        else:
+            _figlet = Figlet(font=BANNER_FONT)
+    return _figlet.renderText(text) if _figlet else text
+
+
+def render_board(board, perspective=Color.WHITE):
+    """Return the board as text, seen from perspective's side."""
+    if perspective == Color.WHITE:
+        rows = range(8, 0, -1)
+        cols = Square.columns
+    else:
+        rows = range(1, 9)
+        cols = list(reversed(Square.columns))
+
+    lines = ["  " + " ".join(cols)]
+    for y in rows:
+        row = f"{y} "
+        for x in cols:
+            square = board.get_square(f"{x}{y}")
+            row += (str(square.piece) if square.piece else '.') + " "
+        lines.append(row + f" {y}")
+    lines.append("  " + " ".join(cols))
+    return "\n".join(lines)
+
+
+def print_board(board, perspective=Color.WHITE):
+    print(render_board(board, perspective))
+
+
+def play(game, read=input):
+    """Play a game at the terminal, reading moves with read until it ends or the user types 'end'."""
+    print(banner("Welcome to Chess!"))
+    print_board(game.board, game.current_turn)
+    while True:
+        status = game.status()
+        if status == Status.CHECKMATE:
+            print(banner(f"{game.current_turn} is in checkmate. Game over!"))
+            break
+        elif status == Status.STALEMATE:
+            print("Stalemate. Game over!")
+            break
+        elif status in Status.OVER:
+            print(f"Draw by {status}. Game over!")
+            break
+
+        if status == Status.CHECK:
+            print(f"{game.current_turn}'s king is in check")
+
+        command = read(f"{game.current_turn}'s turn. Enter your move (e.g., e2 e4, or e7 e8 q to promote) or 'end' to quit: ").strip()
+        parts = command.split()
+        if len(parts) == 2 or (len(parts) == 3 and parts[2].lower() in PROMOTION_PIECES):
+            start_pos, end_pos = parts[:2]
+            promotion = PROMOTION_PIECES[parts[2].lower()] if len(parts) == 3 else None
+            if game.play_move(start_pos, end_pos, promotion):
+                print(f"Moved from {start_pos} to {end_pos}.")
+            else:
+                print("Invalid move. Try again.")
+        elif command.lower() == "end":
+            print(banner("Game ended by user."))
+            break
+        else:
+            print("Invalid command. Try again.")
+        print_board(game.board, game.current_turn)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Play chess at the terminal.")
+    parser.add_argument("--fen", default=START_FEN, help="position to start from")
+    args = parser.parse_args()
+    play(Game.from_fen(args.fen))
+
+
+if __name__ == "__main__":
+    main()
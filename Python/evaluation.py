@@ -0,0 +1,90 @@
+"""Material and piece-square table evaluation."""
+from chess import Bishop, Color, King, Knight, Pawn, Queen, Rook
+
+PIECE_VALUES = {Pawn: 100, Knight: 320, Bishop: 330, Rook: 500, Queen: 900, King: 0}
+
+# Tables are written from white's point of view, rank 8 first, as they are
+# usually printed. Black pieces read them mirrored.
+PIECE_SQUARE_TABLES = {
+    Pawn: [
+        0, 0, 0, 0, 0, 0, 0, 0,
+        50, 50, 50, 50, 50, 50, 50, 50,
+        10, 10, 20, 30, 30, 20, 10, 10,
+        5, 5, 10, 25, 25, 10, 5, 5,
+        0, 0, 0, 20, 20, 0, 0, 0,
+        5, -5, -10, 0, 0, -10, -5, 5,
+        5, 10, 10, -20, -20, 10, 10, 5,
+        0, 0, 0, 0, 0, 0, 0, 0,
+    ],
+    Knight: [
+        -50, -40, -30, -30, -30, -30, -40, -50,
+        -40, -20, 0, 0, 0, 0, -20, -40,
+        -30, 0, 10, 15, 15, 10, 0, -30,
+        -30, 5, 15, 20, 20, 15, 5, -30,
+        -30, 0, 15, 20, 20, 15, 0, -30,
+        -30, 5, 10, 15, 15, 10, 5, -30,
+        -40, -20, 0, 5, 5, 0, -20, -40,
+        -50, -40, -30, -30, -30, -30, -40, -50,
+    ],
+    Bishop: [
+        -20, -10, -10, -10, -10, -10, -10, -20,
+        -10, 0, 0, 0, 0, 0, 0, -10,
+        -10, 0, 5, 10, 10, 5, 0, -10,
+        -10, 5, 5, 10, 10, 5, 5, -10,
+        -10, 0, 10, 10, 10, 10, 0, -10,
+        -10, 10, 10, 10, 10, 10, 10, -10,
+        -10, 5, 0, 0, 0, 0, 5, -10,
+        -20, -10, -10, -10, -10, -10, -10, -20,
+    ],
+    Rook: [
+        0, 0, 0, 0, 0, 0, 0, 0,
+        5, 10, 10, 10, 10, 10, 10, 5,
+        -5, 0, 0, 0, 0, 0, 0, -5,
+        -5, 0, 0, 0, 0, 0, 0, -5,
+        -5, 0, 0, 0, 0, 0, 0, -5,
+        -5, 0, 0, 0, 0, 0, 0, -5,
+        -5, 0, 0, 0, 0, 0, 0, -5,
+        0, 0, 0, 5, 5, 0, 0, 0,
+    ],
+    Queen: [
+        -20, -10, -10, -5, -5, -10, -10, -20,
+        -10, 0, 0, 0, 0, 0, 0, -10,
+        -10, 0, 5, 5, 5, 5, 0, -10,
+        -5, 0, 5, 5, 5, 5, 0, -5,
+        0, 0, 5, 5, 5, 5, 0, -5,
+        -10, 5, 5, 5, 5, 5, 0, -10,
+        -10, 0, 5, 0, 0, 0, 0, -10,
+        -20, -10, -10, -5, -5, -10, -10, -20,
+    ],
+    King: [
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -20, -30, -30, -40, -40, -30, -30, -20,
+        -10, -20, -20, -20, -20, -20, -20, -10,
+        20, 20, 0, 0, 0, 0, 20, 20,
+        20, 30, 10, 0, 0, 10, 30, 20,
+    ],
+}
+
+# Value plus table bonus for a piece of each type and color, indexed by y * 8 + x
+SQUARE_SCORES = {}
+for _piece_type, _table in PIECE_SQUARE_TABLES.items():
+    SQUARE_SCORES[_piece_type, Color.WHITE] = [
+        PIECE_VALUES[_piece_type] + _table[(7 - index // 8) * 8 + index % 8] for index in range(64)]
+    SQUARE_SCORES[_piece_type, Color.BLACK] = [
+        PIECE_VALUES[_piece_type] + _table[index] for index in range(64)]
+
+
+def evaluate(board, color):
+    """Score the position in centipawns from the point of view of the given color."""
+    score = 0
+    for index, square in enumerate(board.squares):
+        piece = square.piece
+        if piece is not None:
+            if piece.color == Color.WHITE:
+                score += SQUARE_SCORES[type(piece), Color.WHITE][index]
+            else:
+                score -= SQUARE_SCORES[type(piece), Color.BLACK][index]
+    return score if color == Color.WHITE else -score
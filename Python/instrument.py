@@ -0,0 +1,190 @@
+"""Opt-in call counts and timings for the rule checks, plus cProfile reports.
+
+enable() swaps the rule-check methods of Board, Game and the piece classes
+(and their subclasses, such as BitboardBoard) for wrappers that count calls and
+add up time, and disable() puts the original methods back. While disabled
+nothing is wrapped, so the hot paths run exactly the code they always do.
+Times are inclusive: Rook.is_valid_move includes the Board.is_path_clear
+call it makes. Counters are per process and shared by every board.
+
+    python instrument.py --profile replay.prof replay games.pgn
+    python instrument.py search "<fen>" --depth 4
+"""
+import argparse
+import cProfile
+import functools
+import io
+import pstats
+import sys
+import time
+from contextlib import contextmanager
+
+from chess import Board, Game, Piece
+from pgn import ReplayStats, read_games, replay_games
+
+# Methods wrapped on each class that defines them. Generators such as
+# legal_moves and candidate_squares are left out, as calling them does no work.
+HOOKS = {
+    Board: ('is_path_clear', 'is_king_in_check', 'is_path_under_attack', 'is_square_attacked',
+            'checks_and_pins', 'has_legal_move', 'is_checkmate', 'is_stalemate', 'has_insufficient_material'),
+    Piece: ('is_valid_move', 'can_castle'),
+    Game: ('make_move', 'undo_move', 'play_move', 'status'),
+}
+
+_counters = {}  # 'Class.method' -> [calls, nanoseconds]
+_originals = {}  # (class, method name) -> the unwrapped function
+
+
+def _subclasses(cls):
+    yield cls
+    for subclass in cls.__subclasses__():
+        yield from _subclasses(subclass)
+
+
+def _wrap(function, counter):
+    perf_counter_ns = time.perf_counter_ns
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        start = perf_counter_ns()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            counter[0] += 1
+            counter[1] += perf_counter_ns() - start
+    return wrapper
+
+
+def enable():
+    """Start counting. Classes defined after this call are not instrumented."""
+    if _originals:
+        return
+    for base, names in HOOKS.items():
+        for cls in _subclasses(base):
+            for name in names:
+                function = cls.__dict__.get(name)
+                if function is None:
+                    continue
+                _originals[cls, name] = function
+                counter = _counters.setdefault(f"{cls.__name__}.{name}", [0, 0])
+                setattr(cls, name, _wrap(function, counter))
+
+
+def disable():
+    """Stop counting and restore the original methods. The totals are kept."""
+    for (cls, name), function in _originals.items():
+        setattr(cls, name, function)
+    _originals.clear()
+
+
+def is_enabled():
+    return bool(_originals)
+
+
+def reset():
+    for counter in _counters.values():
+        counter[0] = counter[1] = 0
+
+
+@contextmanager
+def instrumented():
+    """Count calls for the duration of a with block, restoring the previous state after."""
+    was_enabled = is_enabled()
+    enable()
+    try:
+        yield
+    finally:
+        if not was_enabled:
+            disable()
+
+
+class Snapshot:
+    """Call counts and seconds at one moment, by function and by piece class."""
+
+    def __init__(self, counters):
+        # Only functions that were called are listed
+        self.functions = {name: (calls, nanoseconds / 1e9)
+                          for name, (calls, nanoseconds) in counters.items() if calls}
+
+    @property
+    def pieces(self):
+        """Totals for each piece class over its wrapped methods."""
+        piece_names = {cls.__name__ for cls in _subclasses(Piece)}
+        totals = {}
+        for name, (calls, seconds) in self.functions.items():
+            owner = name.split('.', 1)[0]
+            if owner in piece_names:
+                total_calls, total_seconds = totals.get(owner, (0, 0.0))
+                totals[owner] = (total_calls + calls, total_seconds + seconds)
+        return totals
+
+    def as_dict(self):
+        """Plain nested dicts, ready for a metrics exporter or JSON."""
+        return {
+            'functions': {name: {'calls': calls, 'seconds': seconds} for name, (calls, seconds) in self.functions.items()},
+            'pieces': {name: {'calls': calls, 'seconds': seconds} for name, (calls, seconds) in self.pieces.items()},
+        }
+
+    def __str__(self):
+        lines = [f"{'function':36} {'calls':>10} {'seconds':>10} {'us/call':>9}"]
+        for name, (calls, seconds) in sorted(self.functions.items(), key=lambda item: -item[1][1]):
+            lines.append(f"{name:36} {calls:10d} {seconds:10.4f} {seconds / calls * 1e6:9.2f}")
+        return '\n'.join(lines)
+
+
+def snapshot():
+    return Snapshot(_counters)
+
+
+def profile(function, *args, path=None, sort='cumulative', limit=25, stream=None, **kwargs):
+    """Run function under cProfile and return (its result, pstats.Stats).
+
+    The raw profile is written to path if given, for snakeviz or pstats later,
+    and the top limit entries by sort are printed to stream if given.
+    """
+    profiler = cProfile.Profile()
+    result = profiler.runcall(function, *args, **kwargs)
+    if path is not None:
+        profiler.dump_stats(path)
+    stats = pstats.Stats(profiler, stream=stream or io.StringIO())
+    if stream is not None:
+        stats.sort_stats(sort).print_stats(limit)
+    return result, stats
+
+
+def _replay(path):
+    stats = ReplayStats()
+    for _ in replay_games(read_games(path), stats):
+        pass
+    return f"{stats.games} games, {stats.moves} moves"
+
+
+def _search(fen, depth):
+    result = Game.from_fen(fen).best_move(depth)
+    return f"best {result.move.to_uci() if result.move else None}, {result.nodes} nodes"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Count rule-check calls for a PGN replay or a search.")
+    parser.add_argument("--profile", metavar="PATH", help="also run under cProfile and write the stats to PATH")
+    parser.add_argument("--limit", type=int, default=25, help="pstats entries to print")
+    commands = parser.add_subparsers(dest="command", required=True)
+    replay_parser = commands.add_parser("replay")
+    replay_parser.add_argument("path")
+    search_parser = commands.add_parser("search")
+    search_parser.add_argument("fen")
+    search_parser.add_argument("--depth", type=int, default=3)
+    args = parser.parse_args()
+
+    function, function_args = (_replay, (args.path,)) if args.command == "replay" else (_search, (args.fen, args.depth))
+    with instrumented():
+        summary = function(*function_args)
+    print(summary)
+    print(snapshot())
+    if args.profile:
+        # Profiled separately so the wrappers do not show up in the profile
+        profile(function, *function_args, path=args.profile, limit=args.limit, stream=sys.stdout)
+
+
+if __name__ == "__main__":
+    main()
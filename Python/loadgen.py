@@ -0,0 +1,134 @@
+"""Load generator for server.py: many concurrent games, reporting moves/s and move latency.
+
+Each pair of clients plays knight moves back and forth, which the server
+draws by threefold repetition after eight plies, and starts a new game
+whenever one ends. Latency is the time from sending a
+MOVE to receiving the BOARD update for it.
+
+    python loadgen.py --local --games 200 --moves 50
+    python loadgen.py --host 127.0.0.1 --port 8765
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+# Knights out and back again, legal from the start position forever
+SHUFFLE = ("g1f3", "g8f6", "f3g1", "f6g8")
+
+
+class Client:
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.ended = False  # Saw END for the current game
+
+    @classmethod
+    async def connect(cls, host, port):
+        return cls(*await asyncio.open_connection(host, port))
+
+    async def send(self, line):
+        self.writer.write(line.encode() + b"\n")
+        await self.writer.drain()
+
+    async def expect(self, *kinds):
+        """Read lines until one starts with any of kinds and return it split into words."""
+        while True:
+            line = await self.reader.readline()
+            if not line:
+                raise ConnectionError("server closed the connection")
+            parts = line.decode().split()
+            if parts and parts[0] == "END":
+                self.ended = True
+            if parts and parts[0] in kinds:
+                return parts
+
+    async def close(self):
+        await self.send("QUIT")
+        self.writer.close()
+
+
+async def play_pair(host, port, moves, plies_per_game, latencies):
+    white, black = await Client.connect(host, port), await Client.connect(host, port)
+    played = 0
+    try:
+        while played < moves:
+            white.ended = black.ended = False
+            await white.send("NEW white")
+            game_id = (await white.expect("GAME"))[1]
+            await black.send(f"JOIN {game_id}")
+            await black.expect("GAME")
+            await white.expect("BOARD")
+            await black.expect("BOARD")
+            for ply in range(plies_per_game):
+                if played >= moves:
+                    break
+                mover, other = (white, black) if ply % 2 == 0 else (black, white)
+                start = time.perf_counter()
+                await mover.send(f"MOVE {SHUFFLE[ply % 4]}")
+                reply = await mover.expect("BOARD", "ERROR", "END")
+                if reply[0] != "BOARD":
+                    break  # The server ended the game, usually a draw by repetition
+                latencies.append(time.perf_counter() - start)
+                await other.expect("BOARD", "END")
+                played += 1
+            # Resigning a game that is already over is refused, which is harmless
+            await white.send("RESIGN")
+            for client in (white, black):
+                if not client.ended:
+                    await client.expect("END")
+    finally:
+        await white.close()
+        await black.close()
+    return played
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+async def run(args):
+    server = None
+    host, port = args.host, args.port
+    if args.local:
+        # The server gets its own process so it does not share a core with the clients
+        server = await asyncio.create_subprocess_exec(
+            sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "server.py"),
+            "--host", host, "--port", "0", stdout=asyncio.subprocess.PIPE)
+        port = int((await server.stdout.readline()).decode().rsplit(":", 1)[1])
+
+    latencies = []
+    try:
+        start = time.perf_counter()
+        counts = await asyncio.gather(*(play_pair(host, port, args.moves, args.plies, latencies)
+                                        for _ in range(args.games)))
+        elapsed = time.perf_counter() - start
+    finally:
+        if server is not None:
+            server.terminate()
+            await server.wait()
+
+    moves = sum(counts)
+    print(f"{args.games} concurrent games, {moves} moves in {elapsed:.2f}s: {moves / elapsed:.0f} moves/s")
+    if latencies:
+        print(f"latency p50 {percentile(latencies, 0.5) * 1000:.2f} ms  "
+              f"p99 {percentile(latencies, 0.99) * 1000:.2f} ms  "
+              f"mean {statistics.mean(latencies) * 1000:.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--local", action="store_true", help="start a server for the run")
+    parser.add_argument("--games", type=int, default=100, help="concurrent games")
+    parser.add_argument("--moves", type=int, default=40, help="moves each pair of clients plays")
+    parser.add_argument("--plies", type=int, default=40, help="plies before a game is resigned and restarted")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
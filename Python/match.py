@@ -0,0 +1,402 @@
+"""Self-play matches between two engine configurations.
+
+Every opening is played twice, once with each engine as white, so neither
+side gets the easier half of the start positions. Openings come from a file
+of FENs or are walked out of an opening book. Games run one per task in worker
+processes and are written to the PGN output as soon as each one finishes.
+
+A game ends by the rules, through Game.status (checkmate, stalemate, threefold
+repetition, the fifty-move rule and insufficient material), or is adjudicated:
+
+    move cap      drawn after max_plies plies
+    resignation   lost once the engines' last resign_plies scores all give
+                  one side at least resign_score
+    draw          drawn once the last draw_plies scores are all within
+                  draw_score, from ply draw_after on
+    tablebase     decided by the endgame tables as soon as they cover it
+
+Results are counted for the first engine, and the report gives games per
+second, nodes per second for each engine and the Elo difference with a 95%
+confidence interval.
+
+    python match.py --engine name=d3,depth=3 --engine name=d2,depth=2 --games 200 --pgn match.pgn
+    python match.py --engine depth=2 --engine time=0.05,hash=4 --book openings.bin --book-plies 8
+    python match.py --engine depth=2 --engine depth=2,tablebase=tables --fens openings.epd --workers 8
+"""
+import argparse
+import math
+import os
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from book import OpeningBook
+from chess import START_FEN, Color, Game, Status
+from pgn import PGNGame, encode_san, format_game
+from search import Searcher
+from tablebase import Tablebase
+
+# Spellings accepted in an engine description, and the Engine argument each sets
+ENGINE_OPTIONS = {'name': ('name', str), 'depth': ('depth', int), 'time': ('time_limit', float),
+                  'hash': ('memory_mb', float), 'tablebase': ('tablebase', str)}
+
+
+class Engine:
+    """One side of a match: how deep or how long it searches, its hash size and optional endgame tables."""
+
+    def __init__(self, name=None, depth=None, time_limit=None, memory_mb=16, tablebase=None):
+        if depth is None and time_limit is None:
+            depth = 2
+        self.name = name or (f"depth {depth}" if depth else f"{time_limit}s")
+        self.depth = depth
+        self.time_limit = time_limit
+        self.memory_mb = memory_mb
+        self.tablebase = tablebase  # Directory of tables, see tablebase.py
+
+    @classmethod
+    def parse(cls, description):
+        """Create an Engine from text such as 'name=new,depth=3,hash=8' or 'time=0.1,tablebase=tables'."""
+        settings = {}
+        for item in filter(None, description.split(',')):
+            key, _, value = item.partition('=')
+            if key.strip() not in ENGINE_OPTIONS:
+                raise ValueError(f"unknown engine option {key!r}, expected one of {', '.join(ENGINE_OPTIONS)}")
+            argument, convert = ENGINE_OPTIONS[key.strip()]
+            settings[argument] = convert(value.strip())
+        return cls(**settings)
+
+    def __repr__(self):
+        return f"Engine({self.name!r})"
+
+
+class Adjudication:
+    def __init__(self, max_plies=400, resign_score=None, resign_plies=6, draw_score=None, draw_plies=16,
+                 draw_after=60, tablebase=None):
+        self.max_plies = max_plies
+        self.resign_score = resign_score  # None leaves resignation off
+        self.resign_plies = resign_plies
+        self.draw_score = draw_score  # None leaves draw adjudication off
+        self.draw_plies = draw_plies
+        self.draw_after = draw_after
+        self.tablebase = tablebase  # Directory of tables that decide covered positions
+
+    def decide(self, scores):
+        """Return (result, reason) from the scores of the moves so far, white's point of view, or None."""
+        if self.resign_score is not None and len(scores) >= self.resign_plies:
+            recent = scores[-self.resign_plies:]
+            if None not in recent:
+                if min(recent) >= self.resign_score:
+                    return '1-0', 'resignation'
+                if max(recent) <= -self.resign_score:
+                    return '0-1', 'resignation'
+        if (self.draw_score is not None and len(scores) >= max(self.draw_after, self.draw_plies) and
+                all(score is not None and abs(score) <= self.draw_score for score in scores[-self.draw_plies:])):
+            return '1/2-1/2', 'draw adjudication'
+        return None
+
+
+class GameRecord:
+    """A finished game as it comes back from a worker."""
+
+    def __init__(self, round_number, fen, white, black):
+        self.round = round_number
+        self.fen = fen
+        self.white = white
+        self.black = black
+        self.moves = []  # SAN
+        self.result = '*'
+        self.reason = None
+        self.nodes = {Color.WHITE: 0, Color.BLACK: 0}
+        self.search_time = {Color.WHITE: 0.0, Color.BLACK: 0.0}  # Seconds spent in search
+
+    def pgn_game(self):
+        game = PGNGame(0)
+        game.headers.update(Event='Self-play match', Round=str(self.round), White=self.white, Black=self.black)
+        if self.fen != START_FEN:
+            game.headers.update(SetUp='1', FEN=self.fen)
+        game.headers.update(PlyCount=str(len(self.moves)), Termination=self.reason)
+        game.moves = self.moves
+        game.result = self.result
+        return game
+
+
+_tablebases = {}  # Tablebases opened by this worker process, by directory
+
+
+def _open_tablebase(directory):
+    if directory is None:
+        return None
+    if directory not in _tablebases:
+        _tablebases[directory] = Tablebase(directory)
+    return _tablebases[directory]
+
+
+def play_game(round_number, fen, white, black, adjudication):
+    """Play one game between two Engines from fen and return its GameRecord."""
+    game = Game.from_fen(fen)
+    record = GameRecord(round_number, fen, white.name, black.name)
+    # Fresh searchers every game, so a result does not depend on the games a worker played before
+    sides = {Color.WHITE: (white, Searcher(white.memory_mb), _open_tablebase(white.tablebase)),
+             Color.BLACK: (black, Searcher(black.memory_mb), _open_tablebase(black.tablebase))}
+    referee = _open_tablebase(adjudication.tablebase)
+    scores = []  # Score of every move from white's point of view, None when it was not searched
+    while True:
+        game.tablebase = referee
+        status = game.status()
+        if status == Status.CHECKMATE:
+            record.result, record.reason = ('0-1' if game.current_turn == Color.WHITE else '1-0'), status
+            break
+        if status in Status.OVER:
+            record.result, record.reason = '1/2-1/2', status
+            break
+        if len(record.moves) >= adjudication.max_plies:
+            record.result, record.reason = '1/2-1/2', 'move cap'
+            break
+        if status in Status.DECIDED:
+            wdl = {Status.TABLEBASE_WIN: 1, Status.TABLEBASE_DRAW: 0, Status.TABLEBASE_LOSS: -1}[status]
+            wdl = wdl if game.current_turn == Color.WHITE else -wdl
+            record.result, record.reason = {1: '1-0', 0: '1/2-1/2', -1: '0-1'}[wdl], 'tablebase'
+            break
+        decided = adjudication.decide(scores)
+        if decided is not None:
+            record.result, record.reason = decided
+            break
+
+        color = game.current_turn
+        engine, game.searcher, game.tablebase = sides[color]
+        result = game.best_move(engine.depth, engine.time_limit)
+        record.nodes[color] += result.nodes
+        record.search_time[color] += result.elapsed
+        scores.append((result.score if color == Color.WHITE else -result.score) if result.depth else None)
+        record.moves.append(encode_san(game, result.move))
+        game.push(result.move)
+    return record
+
+
+def elo_difference(wins, draws, losses, z=1.96):
+    """Return (difference, low, high): the Elo difference a score implies and its confidence interval.
+
+    The interval comes from the standard error of the mean game score, z
+    standard errors either side (1.96 for 95%), turned into Elo. A score of
+    0 or 1 gives an infinite difference.
+    """
+    games = wins + draws + losses
+    if not games:
+        return 0.0, -math.inf, math.inf
+    score = (wins + draws / 2) / games
+    variance = (wins * (1 - score) ** 2 + draws * (0.5 - score) ** 2 + losses * score ** 2) / games
+    error = z * math.sqrt(variance / games)
+    return _elo(score), _elo(score - error), _elo(score + error)
+
+
+def _elo(score):
+    if score <= 0:
+        return -math.inf
+    if score >= 1:
+        return math.inf
+    return 400 * math.log10(score / (1 - score))
+
+
+class MatchStats:
+    """Running totals of a match, with wins, draws and losses counted for the first engine."""
+
+    def __init__(self, first, second):
+        self.names = (first.name, second.name)
+        self.wins = self.draws = self.losses = 0
+        self.reasons = Counter()
+        self.nodes = [0, 0]
+        self.search_time = [0.0, 0.0]
+        self.elapsed = 0.0
+        self.failures = []  # (round, fen, error) of every game that raised instead of finishing
+
+    @property
+    def games(self):
+        return self.wins + self.draws + self.losses
+
+    def add(self, record, first_color):
+        second_color = Color.BLACK if first_color == Color.WHITE else Color.WHITE
+        points = {'1-0': 1.0, '0-1': 0.0}.get(record.result, 0.5)
+        points = points if first_color == Color.WHITE else 1.0 - points
+        if points == 1.0:
+            self.wins += 1
+        elif points == 0.0:
+            self.losses += 1
+        else:
+            self.draws += 1
+        self.reasons[record.reason] += 1
+        for index, color in enumerate((first_color, second_color)):
+            self.nodes[index] += record.nodes[color]
+            self.search_time[index] += record.search_time[color]
+
+    @property
+    def games_per_second(self):
+        return self.games / self.elapsed if self.elapsed else 0.0
+
+    def nps(self, index):
+        """Average nodes per second of search for engine index (0 or 1)."""
+        return self.nodes[index] / self.search_time[index] if self.search_time[index] else 0.0
+
+    def elo(self):
+        return elo_difference(self.wins, self.draws, self.losses)
+
+    def __str__(self):
+        difference, low, high = self.elo()
+        score = (self.wins + self.draws / 2) / self.games if self.games else 0.0
+        lines = [f"{self.names[0]} vs {self.names[1]}: +{self.wins} ={self.draws} -{self.losses} "
+                 f"({score:.1%} of {self.games} games)",
+                 f"Elo difference {difference:+.1f}, 95% interval [{low:+.1f}, {high:+.1f}]",
+                 f"{self.games} games in {self.elapsed:.1f}s, {self.games_per_second:.2f} games/s"]
+        for index, name in enumerate(self.names):
+            lines.append(f"{name}: {self.nodes[index]} nodes, {self.nps(index):.0f} nodes/s")
+        lines.append("endings: " + ", ".join(f"{reason} {count}" for reason, count in self.reasons.most_common()))
+        for round_number, fen, error in self.failures:
+            lines.append(f"round {round_number} failed from {fen}: {error}")
+        return "\n".join(lines)
+
+
+def run_match(first, second, openings, games=None, workers=None, adjudication=None, output=None, progress=None):
+    """Play games between two Engines and return the MatchStats.
+
+    Game i starts from openings[i // 2 % len(openings)] with the first engine
+    white in even games, and games defaults to two per opening. Each finished
+    game is written to output, a text file, and progress, if given, is called
+    with (done, total, stats) after it. Every opening is parsed up front, a bad
+    one raising ValueError before any game starts, and a game that raises in
+    its worker is kept in stats.failures with its round and FEN.
+    """
+    for number, fen in enumerate(openings, 1):
+        try:
+            Game.from_fen(fen)
+        except ValueError as error:
+            raise ValueError(f"opening {number}: {error}") from None
+    adjudication = adjudication if adjudication is not None else Adjudication()
+    games = games if games is not None else 2 * len(openings)
+    stats = MatchStats(first, second)
+    start = time.perf_counter()
+    with ProcessPoolExecutor(workers) as executor:
+        futures = {}
+        for index in range(games):
+            fen = openings[index // 2 % len(openings)]
+            white, black = (first, second) if index % 2 == 0 else (second, first)
+            future = executor.submit(play_game, index + 1, fen, white, black, adjudication)
+            futures[future] = (index + 1, fen, Color.WHITE if index % 2 == 0 else Color.BLACK)
+        for future in as_completed(futures):
+            round_number, fen, first_color = futures[future]
+            try:
+                record = future.result()
+            except Exception as error:
+                # One broken game is reported and left out of the score rather than ending the match
+                stats.failures.append((round_number, fen, f"{type(error).__name__}: {error}"))
+            else:
+                stats.add(record, first_color)
+                if output is not None:
+                    output.write(format_game(record.pgn_game()))
+                    output.flush()
+            stats.elapsed = time.perf_counter() - start
+            if progress is not None:
+                progress(stats.games + len(stats.failures), games, stats)
+    stats.elapsed = time.perf_counter() - start
+    return stats
+
+
+def read_fens(path):
+    """Return the positions in a file of one FEN or EPD per line, skipping blanks and # comments.
+
+    An EPD line has four position fields followed by operations such as
+    'bm e5;' instead of the move counters, and only those four are kept.
+    """
+    openings = []
+    with open(path) as file:
+        for line in file:
+            fields = line.split()
+            if not fields or fields[0].startswith('#'):
+                continue
+            if len(fields) > 4 and not fields[4].isdigit():
+                fields = fields[:4]
+            openings.append(' '.join(fields[:6]))
+    return openings
+
+
+def book_openings(path, count, plies=8, seed=None):
+    """Walk up to count different lines of at most plies book moves from the start, weighted as the book is."""
+    openings, seen = [], set()
+    with OpeningBook(path, seed) as book:
+        for _ in range(count * 20):
+            game = Game()
+            for _ in range(plies):
+                move = book.choose(game)
+                if move is None:
+                    break
+                game.push(move)
+            if game.zobrist_hash not in seen:
+                seen.add(game.zobrist_hash)
+                openings.append(game.to_fen())
+                if len(openings) == count:
+                    break
+    return openings
+
+
+def print_progress(done, total, stats):
+    difference, _, _ = stats.elo()
+    print(f"\r{done}/{total} games +{stats.wins} ={stats.draws} -{stats.losses} Elo {difference:+.1f}",
+          end="\n" if done == total else "", file=sys.stderr, flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Play two engine configurations against each other.")
+    parser.add_argument("--engine", action="append", required=True, metavar="OPTIONS",
+                        help=f"engine options as key=value pairs ({', '.join(ENGINE_OPTIONS)}), given twice")
+    parser.add_argument("--games", type=int, help="games to play (default: two per opening)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="worker processes (default: all cores)")
+    parser.add_argument("--fens", help="file of start positions, one FEN or EPD per line")
+    parser.add_argument("--book", help="opening book to walk start positions out of, see book.py")
+    parser.add_argument("--book-plies", type=int, default=8, help="book moves per opening")
+    parser.add_argument("--openings", type=int, default=50, help="openings to walk out of the book")
+    parser.add_argument("--seed", type=int, help="random seed for the book walks")
+    parser.add_argument("--pgn", help="file the games are written to as they finish, '-' for stdout")
+    parser.add_argument("--max-plies", type=int, default=400, help="plies after which a game is drawn")
+    parser.add_argument("--resign-score", type=int, help="score that ends a game, off by default")
+    parser.add_argument("--resign-plies", type=int, default=6)
+    parser.add_argument("--draw-score", type=int, help="score within which a long game is drawn, off by default")
+    parser.add_argument("--draw-plies", type=int, default=16)
+    parser.add_argument("--draw-after", type=int, default=60)
+    parser.add_argument("--tablebase", help="directory of endgame tables that adjudicate games")
+    parser.add_argument("--progress", action="store_true", help="report finished games on stderr")
+    args = parser.parse_args()
+
+    if len(args.engine) != 2:
+        parser.error("give --engine exactly twice")
+    try:
+        first, second = (Engine.parse(description) for description in args.engine)
+    except ValueError as error:
+        parser.error(str(error))
+    if first.name == second.name:
+        first.name, second.name = f"{first.name} (1)", f"{second.name} (2)"
+    if args.fens:
+        openings = read_fens(args.fens)
+    elif args.book:
+        openings = book_openings(args.book, args.openings, args.book_plies, args.seed)
+    else:
+        openings = [START_FEN]
+    adjudication = Adjudication(args.max_plies, args.resign_score, args.resign_plies, args.draw_score,
+                                args.draw_plies, args.draw_after, args.tablebase)
+
+    output = None
+    if args.pgn == '-':
+        output = sys.stdout
+    elif args.pgn:
+        output = open(args.pgn, 'w')
+    try:
+        stats = run_match(first, second, openings, args.games, args.workers, adjudication, output,
+                          print_progress if args.progress else None)
+    except ValueError as error:
+        parser.error(str(error))
+    finally:
+        if output is not None and output is not sys.stdout:
+            output.close()
+    print(stats, file=sys.stderr if output is sys.stdout else sys.stdout)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""Spread perft, search and PGN replay over several processes.
+
+Move generation is pure Python, so threads would share one core. Work is
+split instead into independent pieces, root moves for perft and search and
+ranges of games for PGN archives, and run in a ProcessPoolExecutor. Every
+worker keeps its own board for all the tasks it runs, and results are merged
+in task order so they do not depend on which worker finished first.
+
+    python parallel.py perft --depth 5 --workers 4
+    python parallel.py search --fen "..." --depth 4
+    python parallel.py replay games.pgn --chunk-size 500 --progress
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from chess import START_FEN, Game
+from perft import BACKENDS, perft
+from pgn import ReplayStats, game_offsets, read_games, replay_games
+from search import Searcher
+
+# The board each worker process plays on, created by _init_worker
+_board = None
+
+
+def _init_worker(backend):
+    global _board
+    _board = BACKENDS[backend]()
+
+
+def _game_after(fen, uci):
+    game = Game.from_fen(fen, _board)
+    for move in game.legal_moves():
+        if move.to_uci() == uci:
+            game.push(move)
+            return game
+    raise ValueError(f"{uci} is not legal in {fen}")
+
+
+def _perft_task(fen, uci, depth):
+    return perft(_game_after(fen, uci), depth)
+
+
+def _search_task(fen, uci, depth):
+    # A fresh searcher per task, so the score does not depend on which tasks
+    # the worker ran before
+    return -Searcher().search(_game_after(fen, uci), depth).score
+
+
+def _replay_task(path, start, end):
+    stats = ReplayStats()
+    for _ in replay_games(read_games(path, start=start, end=end), stats, _board):
+        pass
+    return stats
+
+
+def run_tasks(function, tasks, workers=None, backend="dict", progress=None):
+    """Run function(*task) for every task in worker processes and return the results in task order.
+
+    progress, if given, is called with (done, total) as tasks finish.
+    """
+    results = [None] * len(tasks)
+    with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(backend,)) as executor:
+        futures = {executor.submit(function, *task): index for index, task in enumerate(tasks)}
+        for done, future in enumerate(as_completed(futures), 1):
+            results[futures[future]] = future.result()
+            if progress is not None:
+                progress(done, len(tasks))
+    return results
+
+
+def root_moves(fen):
+    return [move.to_uci() for move in Game.from_fen(fen).legal_moves()]
+
+
+def parallel_divide(fen, depth, workers=None, backend="dict", progress=None):
+    """Return the perft count below each root move, like perft.divide, computed in parallel."""
+    moves = root_moves(fen)
+    if depth <= 1:
+        return {uci: 1 for uci in moves}
+    counts = run_tasks(_perft_task, [(fen, uci, depth - 1) for uci in moves], workers, backend, progress)
+    return dict(zip(moves, counts))
+
+
+def parallel_perft(fen, depth, workers=None, backend="dict", progress=None):
+    if depth == 0:
+        return 1
+    return sum(parallel_divide(fen, depth, workers, backend, progress).values())
+
+
+def parallel_search(fen, depth, workers=None, backend="dict", progress=None):
+    """Search every root move to depth - 1 in its own task.
+
+    Returns (uci, score) pairs best first; equal scores keep move generation
+    order, so the result is the same whatever the worker count.
+    """
+    if depth < 2:
+        raise ValueError("parallel search needs a depth of at least 2")
+    moves = root_moves(fen)
+    scores = run_tasks(_search_task, [(fen, uci, depth - 1) for uci in moves], workers, backend, progress)
+    return sorted(zip(moves, scores), key=lambda pair: -pair[1])
+
+
+def parallel_replay(path, workers=None, chunk_size=1000, backend="dict", progress=None):
+    """Replay a PGN archive split into chunks of chunk_size games and return the merged ReplayStats."""
+    start = time.perf_counter()
+    offsets = game_offsets(path)
+    bounds = offsets[::chunk_size] + [None]
+    tasks = [(path, bounds[index], bounds[index + 1]) for index in range(len(bounds) - 1)]
+    merged = ReplayStats()
+    for stats in run_tasks(_replay_task, tasks, workers, backend, progress):
+        merged.games += stats.games
+        merged.moves += stats.moves
+        merged.results.update(stats.results)
+        merged.errors.extend(stats.errors)
+    merged.elapsed = time.perf_counter() - start
+    return merged
+
+
+def print_progress(done, total):
+    print(f"\r{done}/{total} tasks", end="\n" if done == total else "", file=sys.stderr, flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run perft, search or PGN replay on several processes.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="worker processes (default: all cores)")
+    parser.add_argument("--backend", choices=BACKENDS, default="dict")
+    parser.add_argument("--progress", action="store_true", help="report finished tasks on stderr")
+    commands = parser.add_subparsers(dest="command", required=True)
+    for name in ("perft", "search"):
+        command = commands.add_parser(name)
+        command.add_argument("--fen", default=START_FEN)
+        command.add_argument("--depth", type=int, default=4)
+    replay = commands.add_parser("replay")
+    replay.add_argument("path")
+    replay.add_argument("--chunk-size", type=int, default=1000, help="games per task")
+    args = parser.parse_args()
+
+    progress = print_progress if args.progress else None
+    start = time.perf_counter()
+    if args.command == "perft":
+        nodes = parallel_perft(args.fen, args.depth, args.workers, args.backend, progress)
+        elapsed = time.perf_counter() - start
+        print(f"nodes {nodes} time {elapsed:.3f}s nps {nodes / elapsed:.0f} workers {args.workers}")
+    elif args.command == "search":
+        scores = parallel_search(args.fen, args.depth, args.workers, args.backend, progress)
+        print(f"best {scores[0][0]} score {scores[0][1]} time {time.perf_counter() - start:.3f}s")
+    else:
+        stats = parallel_replay(args.path, args.workers, args.chunk_size, args.backend, progress)
+        for error in stats.errors:
+            print(error, file=sys.stderr)
+        print(stats)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""Perft: count the leaf nodes of the legal move tree to a fixed depth.
+
+Node counts for the standard test positions are known exactly, so any
+difference points at a move generation bug (castling, en passant and
+promotion are the usual suspects), and the timing gives nodes per second.
+
+    python perft.py --depth 3
+    python perft.py --position kiwipete --depth 2 --divide
+    python perft.py --fen "8/8/8/8/8/8/8/K6k w - - 0 1" --depth 4 --backend bitboard
+"""
+import argparse
+import time
+
+from bitboard import BitboardBoard
+from chess import Board, Game
+
+# Reference positions with their node counts for depth 1, 2, 3, ...
+POSITIONS = {
+    "start": ("rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",
+              [20, 400, 8902, 197281]),
+    "kiwipete": ("r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+                 [48, 2039, 97862]),
+    "position3": ("8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+                  [14, 191, 2812, 43238]),
+    "position4": ("r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+                  [6, 264, 9467]),
+    "position5": ("rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8",
+                  [44, 1486, 62379]),
+    "position6": ("r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+                  [46, 2079, 89890]),
+}
+
+BACKENDS = {"dict": Board, "bitboard": BitboardBoard}
+
+
+def perft(game, depth):
+    if depth == 0:
+        return 1
+    moves = game.legal_moves()
+    if depth == 1:
+        return len(moves)
+    nodes = 0
+    for move in moves:
+        game.push(move)
+        nodes += perft(game, depth - 1)
+        game.pop()
+    return nodes
+
+
+def divide(game, depth):
+    """Return the perft count below each root move, keyed by its UCI name."""
+    counts = {}
+    for move in game.legal_moves():
+        game.push(move)
+        counts[move.to_uci()] = perft(game, depth - 1)
+        game.pop()
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Count legal move tree nodes and report nodes per second.")
+    parser.add_argument("--depth", type=int, default=3)
+    parser.add_argument("--position", choices=POSITIONS, default="start")
+    parser.add_argument("--fen", help="run from this FEN instead of a named position")
+    parser.add_argument("--backend", choices=BACKENDS, default="dict")
+    parser.add_argument("--divide", action="store_true", help="print the node count below each root move")
+    args = parser.parse_args()
+
+    fen = args.fen or POSITIONS[args.position][0]
+    game = Game.from_fen(fen, BACKENDS[args.backend]())
+
+    start = time.perf_counter()
+    if args.divide:
+        counts = divide(game, args.depth)
+        for name, count in sorted(counts.items()):
+            print(f"{name}: {count}")
+        nodes = sum(counts.values())
+    else:
+        nodes = perft(game, args.depth)
+    elapsed = time.perf_counter() - start
+
+    print(f"nodes {nodes} time {elapsed:.3f}s nps {nodes / elapsed:.0f}" if elapsed else f"nodes {nodes}")
+    if not args.fen:
+        expected = POSITIONS[args.position][1]
+        if 0 < args.depth <= len(expected) and nodes != expected[args.depth - 1]:
+            print(f"MISMATCH: expected {expected[args.depth - 1]}")
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,364 @@
+"""Streaming PGN reader, writer and game replayer.
+
+Games are read one at a time from a file or a memory map, so archives of any
+size can be replayed in constant memory. Each game's moves are decoded from
+SAN and played through Game.play_move, and games that are malformed or contain
+an illegal move are reported with the byte offset where they start.
+format_game writes a PGNGame back out as text.
+"""
+import argparse
+import mmap
+import re
+import sys
+import time
+from collections import Counter
+
+from chess import PIECE_LETTERS, PROMOTION_PIECES, START_FEN, Color, Game, King, Pawn
+
+RESULTS = ('1-0', '0-1', '1/2-1/2', '*')
+
+TAG_PATTERN = re.compile(r'\[\s*(\w+)\s+"((?:[^"\\]|\\.)*)"\s*\]')
+TOKEN_PATTERN = re.compile(r'\{[^}]*\}?|;[^\n]*|\$\d+|[()]|\d+\.+|[^\s(){};$]+')
+SAN_PATTERN = re.compile(r'([KQRBN])?([a-h])?([1-8])?x?([a-h][1-8])(?:=?([QRBNqrbn]))?')
+GAME_START_PATTERN = re.compile(rb'(?:\A|\n[ \t\r]*\n)[ \t\r\n]*\[')
+CASTLING = {'O-O': 6, 'O-O-O': 2, '0-0': 6, '0-0-0': 2}
+
+
+class PGNError(Exception):
+    def __init__(self, message, offset):
+        super().__init__(message, offset)  # Both kept in args so the error pickles between processes
+        self.message = message
+        self.offset = offset
+
+    def __str__(self):
+        return f"offset {self.offset}: {self.message}"
+
+
+class PGNGame:
+    def __init__(self, offset):
+        self.offset = offset  # Byte offset of the game in the file
+        self.headers = {}
+        self.moves = []  # SAN moves of the main line
+        self.result = None
+        self.error = None  # Set when the text could not be parsed
+
+    def __repr__(self):
+        return f"PGNGame({self.headers.get('White', '?')} - {self.headers.get('Black', '?')}, {len(self.moves)} moves)"
+
+
+def read_games(source, use_mmap=True, start=0, end=None):
+    """Yield the games in a PGN file, given as a path or a binary file object.
+
+    start and end limit reading to the games beginning in that byte range;
+    both should fall on game boundaries, see game_offsets.
+    """
+    if not isinstance(source, (str, bytes)) and not hasattr(source, '__fspath__'):
+        source.seek(start)
+        yield from _read_lines(source, end)
+        return
+    with open(source, 'rb') as file:
+        if use_mmap:
+            try:
+                data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:  # Empty files cannot be mapped
+                return
+            with data:
+                data.seek(start)
+                yield from _read_lines(data, end)
+        else:
+            file.seek(start)
+            yield from _read_lines(file, end)
+
+
+def game_offsets(path):
+    """Return the byte offset of every game in a PGN file without parsing the games."""
+    with open(path, 'rb') as file:
+        try:
+            data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            return []
+        with data:
+            # A game starts with its first tag, on the first line or after a blank line
+            offsets = [match.end() - 1 for match in GAME_START_PATTERN.finditer(data)]
+    return offsets
+
+
+def _read_lines(source, end=None):
+    # Both file objects and memory maps have readline and tell
+    game = None
+    movetext = []
+    in_comment = False
+    while True:
+        offset = source.tell()
+        if end is not None and offset >= end and not in_comment:
+            break
+        raw = source.readline()
+        if not raw:
+            break
+        line = raw.decode('latin-1').strip()
+
+        if in_comment:
+            movetext.append(line)
+            in_comment = '}' not in line
+            continue
+        if not line:
+            if movetext:
+                yield _finish(game, movetext)
+                game, movetext = None, []
+            continue
+        if line[0] == '%':
+            continue
+        if line[0] == '[':
+            if movetext:
+                # A new game started without the usual blank line
+                yield _finish(game, movetext)
+                game, movetext = None, []
+            if game is None:
+                game = PGNGame(offset)
+            match = TAG_PATTERN.match(line)
+            if match is None:
+                game.error = game.error or f"malformed tag {line!r}"
+            else:
+                game.headers[match.group(1)] = match.group(2).replace('\\"', '"').replace('\\\\', '\\')
+            continue
+
+        if game is None:
+            game = PGNGame(offset)
+        movetext.append(line)
+        if '{' in line:
+            in_comment = line.rfind('{') > line.rfind('}')
+    if game is not None:
+        yield _finish(game, movetext)
+
+
+def _finish(game, movetext):
+    depth = 0
+    for token in TOKEN_PATTERN.findall('\n'.join(movetext)):
+        first = token[0]
+        if first == '{':
+            if token[-1] != '}':
+                game.error = game.error or "unterminated comment"
+        elif first == '(':
+            depth += 1
+        elif first == ')':
+            depth -= 1
+            if depth < 0:
+                game.error = game.error or "unbalanced ')'"
+                depth = 0
+        elif depth or first in ';$' or token[-1] == '.':
+            continue
+        elif token in RESULTS:
+            game.result = token
+        else:
+            game.moves.append(token)
+    if depth:
+        game.error = game.error or "unterminated variation"
+    return game
+
+
+def decode_san(game, san):
+    """Return the start square, end square and promotion class of a SAN move in the game's position."""
+    board = game.board
+    color = game.current_turn
+    text = san.rstrip('+#!?')
+    if text in CASTLING:
+        rank = 0 if color == Color.WHITE else 7
+        return board.squares[rank * 8 + 4], board.squares[rank * 8 + CASTLING[text]], None
+
+    match = SAN_PATTERN.fullmatch(text)
+    if match is None:
+        raise ValueError(f"cannot read move {san!r}")
+    letter, from_file, from_rank, target, promotion = match.groups()
+    piece_type = PIECE_LETTERS[letter.lower()] if letter else Pawn
+    end_square = board.get_square(target)
+    candidates = []
+    for square in _origins(board, piece_type, color, end_square, from_file):
+        piece = square.piece
+        if (type(piece) is piece_type and piece.color == color and
+                (from_file is None or square.x == ord(from_file) - ord('a')) and
+                (from_rank is None or square.y == int(from_rank) - 1) and
+                piece.is_valid_move(square, end_square, game.last_move)):
+            candidates.append(square)
+    if len(candidates) > 1:
+        # SAN leaves out what is needed only to tell pinned pieces apart
+        candidates = [square for square in candidates
+                      if not board._exposes_king(square, end_square, end_square, color)]
+    if len(candidates) != 1:
+        raise ValueError(f"{'ambiguous' if candidates else 'illegal'} move {san!r}")
+    return candidates[0], end_square, PROMOTION_PIECES[promotion.lower()] if promotion else None
+
+
+def _origins(board, piece_type, color, end_square, from_file):
+    # Squares a piece of the given type could have come from to reach end_square
+    if piece_type is King:
+        return [board.find_king(color)]
+    if piece_type is Pawn:
+        back = -8 if color == Color.WHITE else 8
+        index = end_square.y * 8 + end_square.x + back
+        if not 0 <= index < 64:
+            return []
+        if from_file is not None:
+            return [board.squares[index - end_square.x + ord(from_file) - ord('a')]]
+        if 0 <= index + back < 64 and board.squares[index].piece is None:
+            return [board.squares[index], board.squares[index + back]]
+        return [board.squares[index]]
+    # Other pieces move the same way in both directions, so an enemy piece
+    # standing on end_square reaches exactly the squares ours could start from
+    enemy = Color.BLACK if color == Color.WHITE else Color.WHITE
+    return piece_type(enemy).candidate_squares(end_square)
+
+
+def encode_san(game, move):
+    """Return the SAN text of a move from game.legal_moves(), with check and mate marks."""
+    piece = move.piece
+    start_square, end_square = move.start_pos, move.end_pos
+    if isinstance(piece, King) and abs(start_square.x - end_square.x) == 2:
+        text = 'O-O' if end_square.x == 6 else 'O-O-O'
+    else:
+        capture = move.captured_piece is not None
+        if isinstance(piece, Pawn):
+            text = f"{repr(start_square)[0]}x{end_square!r}" if capture else repr(end_square)
+            if move.promotion:
+                text += '=' + move.promotion.letter.upper()
+        else:
+            rivals = [other.start_pos for other in game.legal_moves()
+                      if other.end_pos is end_square and type(other.piece) is type(piece) and
+                      other.start_pos is not start_square]
+            prefix = ''
+            if rivals:
+                if all(square.x != start_square.x for square in rivals):
+                    prefix = repr(start_square)[0]
+                elif all(square.y != start_square.y for square in rivals):
+                    prefix = repr(start_square)[1]
+                else:
+                    prefix = repr(start_square)
+            text = f"{piece.letter.upper()}{prefix}{'x' if capture else ''}{end_square!r}"
+    game.push(move)
+    if game.board.is_king_in_check(game.current_turn):
+        text += '#' if not game.board.has_legal_move(game.current_turn, game.last_move) else '+'
+    game.pop()
+    return text
+
+
+def _quote(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"')
+
+
+def format_game(pgn_game, width=80):
+    """Return a PGNGame as PGN text, the seven standard tags first, ending with a blank line."""
+    result = pgn_game.result or '*'
+    tags = dict.fromkeys(('Event', 'Site', 'Date', 'Round', 'White', 'Black', 'Result'), '?')
+    tags.update(pgn_game.headers, Result=result)
+    lines = [f'[{name} "{_quote(value)}"]' for name, value in tags.items()]
+    lines.append('')
+
+    fields = tags.get('FEN', START_FEN).split()
+    number = int(fields[5]) if len(fields) > 5 else 1
+    black = len(fields) > 1 and fields[1] == 'b'
+    tokens = []
+    for san in pgn_game.moves:
+        if not black:
+            tokens.append(f"{number}.")
+        elif not tokens:
+            tokens.append(f"{number}...")
+        tokens.append(san)
+        if black:
+            number += 1
+        black = not black
+    tokens.append(result)
+
+    line = ''
+    for token in tokens:
+        if line and len(line) + 1 + len(token) > width:
+            lines.append(line)
+            line = token
+        else:
+            line = f"{line} {token}" if line else token
+    lines.append(line)
+    return '\n'.join(lines) + '\n\n'
+
+
+def replay(pgn_game, board=None):
+    """Play a parsed game through the rules and return the resulting Game.
+
+    Raises PGNError with the game's offset if it is malformed or has an illegal move.
+    """
+    if pgn_game.error:
+        raise PGNError(pgn_game.error, pgn_game.offset)
+    try:
+        game = Game.from_fen(pgn_game.headers.get('FEN', START_FEN), board)
+    except ValueError as error:
+        raise PGNError(str(error), pgn_game.offset) from None
+    for ply, san in enumerate(pgn_game.moves):
+        try:
+            start_square, end_square, promotion = decode_san(game, san)
+        except ValueError as error:
+            raise PGNError(f"ply {ply + 1}: {error}", pgn_game.offset) from None
+        if not game.play_move(repr(start_square), repr(end_square), promotion):
+            raise PGNError(f"ply {ply + 1}: illegal move {san!r}", pgn_game.offset)
+    return game
+
+
+class ReplayStats:
+    def __init__(self):
+        self.games = 0
+        self.moves = 0
+        self.results = Counter()
+        self.errors = []  # PGNError for every game that could not be replayed
+        self.elapsed = 0.0
+
+    @property
+    def games_per_second(self):
+        return self.games / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def moves_per_second(self):
+        return self.moves / self.elapsed if self.elapsed else 0.0
+
+    def __repr__(self):
+        return (f"{self.games} games, {self.moves} moves, {len(self.errors)} errors in {self.elapsed:.2f}s: "
+                f"{self.games_per_second:.1f} games/s, {self.moves_per_second:.0f} moves/s")
+
+
+def replay_games(games, stats=None, board=None):
+    """Replay every game, yielding (PGNGame, Game) pairs and recording failures in stats.
+
+    When a board is given every game is played on it in turn, so each Game is
+    only valid until the next one is yielded.
+    """
+    stats = stats if stats is not None else ReplayStats()
+    start = time.perf_counter()
+    for pgn_game in games:
+        try:
+            game = replay(pgn_game, board)
+        except PGNError as error:
+            stats.errors.append(error)
+        else:
+            stats.games += 1
+            stats.moves += len(pgn_game.moves)
+            stats.results[pgn_game.result or '*'] += 1
+            stats.elapsed = time.perf_counter() - start
+            yield pgn_game, game
+    stats.elapsed = time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay the games of a PGN file and report throughput.")
+    parser.add_argument("path")
+    parser.add_argument("--no-mmap", action="store_true", help="read the file with ordinary buffered reads")
+    args = parser.parse_args()
+
+    stats = ReplayStats()
+    reported = 0
+    for _ in replay_games(read_games(args.path, use_mmap=not args.no_mmap), stats):
+        while reported < len(stats.errors):
+            print(stats.errors[reported], file=sys.stderr)
+            reported += 1
+    for error in stats.errors[reported:]:
+        print(error, file=sys.stderr)
+    print(stats)
+    print(" ".join(f"{result} {count}" for result, count in stats.results.most_common()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,232 @@
+"""Immutable, hashable position snapshots.
+
+A Position holds the placement as eight 8-byte ranks of FEN letters ('.' for
+an empty square), a1 first, together with the side to move, castling rights,
+en passant square and move clocks. apply_move returns a new Position and
+rebuilds only the ranks the move touches; the others are shared with the
+position it came from. The key is the same Zobrist hash as Game.zobrist_hash,
+kept up to date with a few XORs per move, so positions hash in constant time
+and can be looked up in opening books and transposition tables.
+
+Positions pickle as a few bytes objects and ints instead of a Board with its
+64 squares, so they suit caches, analysis workers and messages between
+processes. Turn one back into a Board or Game to generate legal moves:
+
+    position = Position.from_game(game)
+    after = apply_move(position, "e2e4")
+    game = after.to_game()
+"""
+from chess import (CASTLING_KEPT, FEN_PIECES, PROMOTION_PIECES, SQUARE_INDEX, START_FEN, ZOBRIST_BLACK_TO_MOVE,
+                   ZOBRIST_CASTLING, ZOBRIST_EN_PASSANT, ZOBRIST_PIECES, Board, Color, Game, Pawn, Queen, Square,
+                   expand_placement, fen_turn)
+
+EMPTY = ord('.')
+WHITE_PAWN, BLACK_PAWN = ord('P'), ord('p')
+WHITE_KING, BLACK_KING = ord('K'), ord('k')
+# Zobrist keys of each FEN letter by square
+LETTER_KEYS = {ord(letter): ZOBRIST_PIECES[type(piece), piece.color]
+               for letter, piece in FEN_PIECES.items() if piece is not None}
+
+
+def _en_passant_file(ranks, target, turn):
+    """Return the file of target if the side to move has a pawn that can capture there, or None."""
+    if target is None or target >> 3 not in (2, 5):
+        return None
+    # The pawn that moved two squares stands one rank past the target
+    rank = ranks[3 if target >> 3 == 2 else 4]
+    x = target & 7
+    capturer = BLACK_PAWN if turn == Color.BLACK else WHITE_PAWN
+    if (x > 0 and rank[x - 1] == capturer) or (x < 7 and rank[x + 1] == capturer):
+        return x
+    return None
+
+
+def _state_key(castling_rights, en_passant_file, turn):
+    key = ZOBRIST_CASTLING[castling_rights]
+    if en_passant_file is not None:
+        key ^= ZOBRIST_EN_PASSANT[en_passant_file]
+    if turn == Color.BLACK:
+        key ^= ZOBRIST_BLACK_TO_MOVE
+    return key
+
+
+class Position:
+    """One position, immutable once made. Positions that differ only in their move clocks compare equal."""
+
+    __slots__ = ('ranks', 'turn', 'castling_rights', 'en_passant', 'halfmove_clock', 'fullmove_number',
+                 'en_passant_file', 'key')
+
+    def __init__(self, ranks, turn=Color.WHITE, castling_rights=0, en_passant=None, halfmove_clock=0,
+                 fullmove_number=1, key=None):
+        ranks = tuple(ranks)
+        if len(ranks) != 8 or any(len(rank) != 8 for rank in ranks):
+            raise ValueError("A position needs eight ranks of eight squares")
+        en_passant_file = _en_passant_file(ranks, en_passant, turn)
+        if key is None:
+            key = _state_key(castling_rights, en_passant_file, turn)
+            for index, letter in enumerate(b''.join(ranks)):
+                if letter != EMPTY:
+                    key ^= LETTER_KEYS[letter][index]
+        set_slot = object.__setattr__
+        set_slot(self, 'ranks', ranks)
+        set_slot(self, 'turn', turn)
+        set_slot(self, 'castling_rights', castling_rights)
+        set_slot(self, 'en_passant', en_passant)  # Square index a pawn just skipped, as in FEN
+        set_slot(self, 'halfmove_clock', halfmove_clock)
+        set_slot(self, 'fullmove_number', fullmove_number)
+        set_slot(self, 'en_passant_file', en_passant_file)  # Only set when a capture is possible
+        set_slot(self, 'key', key)  # Equal to Game.zobrist_hash
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    __delattr__ = __setattr__
+
+    def __reduce__(self):
+        return (type(self), (self.ranks, self.turn, self.castling_rights, self.en_passant, self.halfmove_clock,
+                             self.fullmove_number, self.key))
+
+    def __hash__(self):
+        return self.key
+
+    def __eq__(self, other):
+        if not isinstance(other, Position):
+            return NotImplemented
+        return (self.key == other.key and self.ranks == other.ranks and self.turn == other.turn and
+                self.castling_rights == other.castling_rights and self.en_passant_file == other.en_passant_file)
+
+    def __repr__(self):
+        return f"Position({self.to_fen()!r})"
+
+    def __getitem__(self, index):
+        """Return the FEN letter on a square index, or None when it is empty."""
+        letter = self.ranks[index >> 3][index & 7]
+        return None if letter == EMPTY else chr(letter)
+
+    @property
+    def placement(self):
+        """All 64 squares as one bytes object indexed by y * 8 + x."""
+        return b''.join(self.ranks)
+
+    @classmethod
+    def from_fen(cls, fen):
+        fields = fen.split()
+        if len(fields) < 4:
+            raise ValueError(f"Invalid FEN, expected at least four fields: {fen!r}")
+        turn, en_passant = fen_turn(fields)
+        placement = expand_placement(fields[0]).encode('ascii')
+        if any(letter != EMPTY and letter not in LETTER_KEYS for letter in placement):
+            raise ValueError(f"Invalid FEN placement: {fields[0]!r}")
+        return cls([placement[y * 8:y * 8 + 8] for y in range(8)], turn,
+                   sum(1 << right for right, char in enumerate('KQkq') if char in fields[2]),
+                   None if en_passant is None else SQUARE_INDEX[en_passant],
+                   int(fields[4]) if len(fields) > 5 else 0,
+                   int(fields[5]) if len(fields) > 5 else 1)
+
+    @classmethod
+    def from_board(cls, board, turn=Color.WHITE, en_passant=None, halfmove_clock=0, fullmove_number=1):
+        """Snapshot a Board, which holds neither the side to move nor the move clocks."""
+        placement = bytes(EMPTY if square.piece is None else ord(square.piece.fen_letter) for square in board.squares)
+        return cls([placement[y * 8:y * 8 + 8] for y in range(8)], turn, board.castling_rights, en_passant,
+                   halfmove_clock, fullmove_number)
+
+    @classmethod
+    def from_game(cls, game):
+        en_passant = None
+        if game.last_move is not None:
+            # Written after every double pawn push, as Game.to_fen does
+            start_square, end_square = game.last_move
+            if isinstance(end_square.piece, Pawn) and abs(start_square.y - end_square.y) == 2:
+                en_passant = (start_square.index + end_square.index) // 2
+        return cls.from_board(game.board, game.current_turn, en_passant, game.halfmove_clock, game.fullmove_number)
+
+    def to_fen(self):
+        ranks = []
+        for rank in reversed(self.ranks):
+            text = rank.decode('ascii')
+            for count in range(8, 0, -1):
+                text = text.replace('.' * count, str(count))
+            ranks.append(text)
+        castling = ''.join(char for right, char in enumerate('KQkq') if self.castling_rights & 1 << right) or '-'
+        en_passant = '-' if self.en_passant is None else repr(Square(self.en_passant & 7, self.en_passant >> 3))
+        return (f"{'/'.join(ranks)} {'w' if self.turn == Color.WHITE else 'b'} {castling} {en_passant} "
+                f"{self.halfmove_clock} {self.fullmove_number}")
+
+    def to_board(self, board=None):
+        """Return a Board holding the placement and castling rights, reusing board if given."""
+        board = board if board is not None else Board()
+        board.set_position([FEN_PIECES[chr(letter)] for letter in self.placement], self.castling_rights)
+        return board
+
+    def to_game(self, board=None):
+        """Return a Game at this position, without the moves that led to it."""
+        game = Game(self.to_board(board))
+        game.current_turn = self.turn
+        if self.en_passant is not None:
+            # Recreate the double pawn push that allowed the capture, as Game.from_fen does
+            direction = -1 if self.en_passant >> 3 == 5 else 1
+            game.last_move = (game.board.squares[self.en_passant - 8 * direction],
+                              game.board.squares[self.en_passant + 8 * direction])
+        game.halfmove_clock = self.halfmove_clock
+        game.fullmove_number = self.fullmove_number
+        game.state_hash = game._compute_state_hash()
+        return game
+
+
+def apply_move(position, move):
+    """Return the Position after a move, given as a Move from Game.legal_moves or a UCI string such as 'e7e8q'.
+
+    Like Game.make_move, the move is assumed to be legal; only a missing piece
+    or one of the wrong color is refused.
+    """
+    if isinstance(move, str):
+        start, end = SQUARE_INDEX[move[:2]], SQUARE_INDEX[move[2:4]]
+        promotion = PROMOTION_PIECES[move[4].lower()] if len(move) > 4 else None
+    else:
+        start, end, promotion = move.start_pos.index, move.end_pos.index, move.promotion
+    ranks = position.ranks
+    piece = ranks[start >> 3][start & 7]
+    white = position.turn == Color.WHITE
+    if piece == EMPTY or (piece < 97) != white:  # Upper case letters are white
+        raise ValueError(f"No {position.turn} piece on {Square(start & 7, start >> 3)!r}")
+    captured = ranks[end >> 3][end & 7]
+    changes = {start: EMPTY, end: piece}
+    key = position.key ^ LETTER_KEYS[piece][start]
+    if captured != EMPTY:
+        key ^= LETTER_KEYS[captured][end]
+    en_passant = None
+    if piece in (WHITE_PAWN, BLACK_PAWN):
+        if end == position.en_passant and start & 7 != end & 7:
+            taken = (start & ~7) | (end & 7)  # The pawn captured en passant sits beside the one capturing
+            changes[taken] = EMPTY
+            key ^= LETTER_KEYS[ranks[taken >> 3][taken & 7]][taken]
+        elif abs(end - start) == 16:
+            en_passant = (start + end) // 2
+        elif end >> 3 in (0, 7):
+            letter = (promotion or Queen).letter
+            changes[end] = ord(letter.upper() if white else letter)
+    elif piece in (WHITE_KING, BLACK_KING) and abs(end - start) == 2:
+        rook_start, rook_end = (start + 3, start + 1) if end > start else (start - 4, start - 1)
+        rook = ranks[rook_start >> 3][rook_start & 7]
+        changes[rook_start], changes[rook_end] = EMPTY, rook
+        key ^= LETTER_KEYS[rook][rook_start] ^ LETTER_KEYS[rook][rook_end]
+    key ^= LETTER_KEYS[changes[end]][end]
+
+    new_ranks = list(ranks)
+    for y in {index >> 3 for index in changes}:
+        rank = bytearray(ranks[y])
+        for index, letter in changes.items():
+            if index >> 3 == y:
+                rank[index & 7] = letter
+        new_ranks[y] = bytes(rank)
+    turn = Color.BLACK if white else Color.WHITE
+    castling_rights = position.castling_rights & CASTLING_KEPT[start] & CASTLING_KEPT[end]
+    en_passant_file = _en_passant_file(new_ranks, en_passant, turn)
+    key ^= (_state_key(position.castling_rights, position.en_passant_file, position.turn) ^
+            _state_key(castling_rights, en_passant_file, turn))
+    return Position(new_ranks, turn, castling_rights, en_passant,
+                    0 if piece in (WHITE_PAWN, BLACK_PAWN) or captured != EMPTY else position.halfmove_clock + 1,
+                    position.fullmove_number + (0 if white else 1), key)
+
+
+START_POSITION = Position.from_fen(START_FEN)
@@ -0,0 +1,284 @@
+"""Alpha-beta (negamax) search with iterative deepening over a Game.
+
+Moves are ordered transposition table move first, then captures by most
+valuable victim / least valuable attacker, then killer moves and the history
+heuristic. Leaves are resolved with a captures-only quiescence search, bounded
+by delta pruning and a cap on its length. Depth 1 always completes, so a time
+limited search returns a searched move even when the limit is very short.
+"""
+import argparse
+import time
+
+from chess import Game
+from evaluation import PIECE_VALUES, evaluate
+from transposition import TranspositionTable
+
+MATE_SCORE = 100000
+MAX_PLY = 64
+INFINITY = MATE_SCORE + 1
+
+EXACT, LOWER_BOUND, UPPER_BOUND = 0, 1, 2
+
+# How many nodes to search between looks at the clock. At about 10k nodes per
+# second this overshoots a deadline by a few milliseconds at most.
+TIME_CHECK_INTERVAL = 32
+# Captures that cannot lift the score to alpha even with this much positional
+# gain on top of the captured material are skipped in quiescence
+DELTA_MARGIN = 200
+# Plies of captures searched past the horizon before the static score is used
+QUIESCENCE_PLIES = 6
+
+
+class SearchTimeout(Exception):
+    pass
+
+
+class SearchResult:
+    def __init__(self, move, score, depth, nodes, elapsed, pv):
+        self.move = move
+        self.score = score
+        self.depth = depth
+        self.nodes = nodes
+        self.elapsed = elapsed
+        self.pv = pv  # Principal variation, starting with move
+
+    @property
+    def nps(self):
+        return int(self.nodes / self.elapsed) if self.elapsed else 0
+
+    def __repr__(self):
+        pv = " ".join(move.to_uci() for move in self.pv)
+        return f"depth {self.depth} score {self.score} nodes {self.nodes} nps {self.nps} pv {pv}"
+
+
+def move_key(move):
+    return (move.start_pos, move.end_pos, move.promotion)
+
+
+class Searcher:
+    def __init__(self, memory_mb=16):
+        self.table = TranspositionTable(memory_mb)
+        self.history = {}
+        self.killers = [[None, None] for _ in range(MAX_PLY + 1)]
+        self.nodes = 0
+        self.deadline = None
+
+    def search(self, game, depth=None, time_limit=None):
+        """Search the position to the given depth or until time_limit seconds have passed."""
+        max_depth = depth or (MAX_PLY if time_limit else 4)
+        start = time.perf_counter()
+        self.deadline = start + time_limit if time_limit else None
+        self.nodes = 0
+        self.table.new_search()
+        self.killers = [[None, None] for _ in range(MAX_PLY + 1)]
+
+        moves = game.legal_moves()
+        if not moves:
+            return SearchResult(None, self._terminal_score(game, 0), 0, 0, 0.0, [])
+
+        # Fall back to the best-ordered move if not even depth 1 finishes in time
+        result = SearchResult(self._order(game, moves, None, 0)[0], 0, 0, 0, 0.0, [])
+        root_ply = len(game.move_stack)
+        deadline, self.deadline = self.deadline, None
+        for current_depth in range(1, max_depth + 1):
+            if current_depth == 2:
+                self.deadline = deadline
+            try:
+                score, pv = self._root(game, current_depth)
+            except SearchTimeout:
+                # Unwind the moves that were on the board when time ran out
+                while len(game.move_stack) > root_ply:
+                    game.pop()
+                break
+            result = SearchResult(pv[0], score, current_depth, self.nodes, time.perf_counter() - start, pv)
+            if abs(score) >= MATE_SCORE - MAX_PLY:
+                break
+        result.nodes = self.nodes
+        result.elapsed = time.perf_counter() - start
+        return result
+
+    def _root(self, game, depth):
+        alpha, beta = -INFINITY, INFINITY
+        best_pv = []
+        # Positions earlier in the game count as repetitions too, not only those on the searched line
+        path = set(game.position_counts)
+        path.add(game.zobrist_hash)
+        entry = self.table.probe(game.zobrist_hash)
+        hash_move = entry[2] if entry else None
+        for move in self._order(game, game.legal_moves(), hash_move, 0):
+            game.push(move)
+            child_key = game.zobrist_hash
+            if child_key in path:
+                score, pv = 0, []
+            else:
+                path.add(child_key)
+                score, pv = self._negamax(game, depth - 1, -beta, -alpha, 1, path)
+                score = -score
+                path.discard(child_key)
+            game.pop()
+            if score > alpha or not best_pv:
+                alpha = max(alpha, score)
+                best_pv = [move] + pv
+        self.table.store(game.zobrist_hash, (alpha, EXACT, move_key(best_pv[0]), depth), depth)
+        return alpha, best_pv
+
+    def _negamax(self, game, depth, alpha, beta, ply, path):
+        self._count_node()
+        if depth <= 0:
+            return self._quiescence(game, alpha, beta, ply, 0), []
+
+        key = game.zobrist_hash
+        original_alpha = alpha
+        entry = self.table.probe(key)
+        hash_move = None
+        if entry is not None:
+            stored_score, flag, hash_move, stored_depth = entry
+            if stored_depth >= depth:
+                score = self._score_from_table(stored_score, ply)
+                if (flag == EXACT or (flag == LOWER_BOUND and score >= beta) or
+                        (flag == UPPER_BOUND and score <= alpha)):
+                    return score, []
+
+        moves = game.legal_moves()
+        if not moves:
+            return self._terminal_score(game, ply), []
+
+        best_score, best_pv, best_move = -INFINITY, [], None
+        for move in self._order(game, moves, hash_move, ply):
+            game.push(move)
+            child_key = game.zobrist_hash
+            if child_key in path:
+                score, pv = 0, []  # Repeating a position of the game or the current line is a draw
+            else:
+                path.add(child_key)
+                score, pv = self._negamax(game, depth - 1, -beta, -alpha, ply + 1, path)
+                score = -score
+                path.discard(child_key)
+            game.pop()
+
+            if score > best_score:
+                best_score, best_pv, best_move = score, [move] + pv, move
+            if score > alpha:
+                alpha = score
+            if alpha >= beta:
+                if move.captured_piece is None:
+                    self._record_cutoff(move, ply, depth)
+                break
+
+        if best_score <= original_alpha:
+            flag = UPPER_BOUND
+        elif best_score >= beta:
+            flag = LOWER_BOUND
+        else:
+            flag = EXACT
+        self.table.store(key, (self._score_to_table(best_score, ply), flag, move_key(best_move), depth), depth)
+        return best_score, best_pv
+
+    def _quiescence(self, game, alpha, beta, ply, depth):
+        in_check = game.board.is_king_in_check(game.current_turn)
+        if not in_check or depth >= QUIESCENCE_PLIES:
+            # The side to move can usually do at least as well as the static score
+            stand_pat = evaluate(game.board, game.current_turn)
+            if stand_pat >= beta or ply >= MAX_PLY or depth >= QUIESCENCE_PLIES:
+                return stand_pat
+            alpha = max(alpha, stand_pat)
+
+        moves = game.legal_moves()
+        if not moves:
+            return self._terminal_score(game, ply)
+        if not in_check:
+            # Out of check only captures and promotions that could still raise alpha are searched
+            moves = [move for move in moves if (move.captured_piece is not None or move.promotion) and
+                     stand_pat + self._gain(move) + DELTA_MARGIN > alpha]
+        elif ply >= MAX_PLY:
+            return evaluate(game.board, game.current_turn)
+
+        for move in self._order(game, moves, None, ply):
+            game.push(move)
+            self._count_node()
+            score = -self._quiescence(game, -beta, -alpha, ply + 1, depth + 1)
+            game.pop()
+            if score >= beta:
+                return score
+            alpha = max(alpha, score)
+        return alpha
+
+    @staticmethod
+    def _gain(move):
+        gain = PIECE_VALUES[type(move.captured_piece)] if move.captured_piece is not None else 0
+        if move.promotion:
+            gain += PIECE_VALUES[move.promotion] - PIECE_VALUES[type(move.piece)]
+        return gain
+
+    def _order(self, game, moves, hash_move, ply):
+        killers = self.killers[min(ply, MAX_PLY)]
+
+        def priority(move):
+            key = move_key(move)
+            if key == hash_move:
+                return 1000000
+            if move.captured_piece is not None or move.promotion:
+                victim = PIECE_VALUES[type(move.captured_piece)] if move.captured_piece else 0
+                promotion = PIECE_VALUES[move.promotion] if move.promotion else 0
+                return 100000 + 10 * (victim + promotion) - PIECE_VALUES[type(move.piece)]
+            if key == killers[0]:
+                return 90000
+            if key == killers[1]:
+                return 80000
+            return self.history.get((type(move.piece), move.piece.color, move.end_pos), 0)
+
+        return sorted(moves, key=priority, reverse=True)
+
+    def _record_cutoff(self, move, ply, depth):
+        key = move_key(move)
+        killers = self.killers[min(ply, MAX_PLY)]
+        if killers[0] != key:
+            killers[1] = killers[0]
+            killers[0] = key
+        history_key = (type(move.piece), move.piece.color, move.end_pos)
+        # Kept below the killer move bonus so killers still sort first
+        self.history[history_key] = min(self.history.get(history_key, 0) + depth * depth, 79999)
+
+    def _terminal_score(self, game, ply):
+        if game.board.is_king_in_check(game.current_turn):
+            return -MATE_SCORE + ply
+        return 0
+
+    def _count_node(self):
+        self.nodes += 1
+        if self.deadline is not None and self.nodes % TIME_CHECK_INTERVAL == 0:
+            if time.perf_counter() >= self.deadline:
+                raise SearchTimeout
+
+    # Mate scores are stored relative to the node so they stay right when the
+    # same position is reached at another ply
+    @staticmethod
+    def _score_to_table(score, ply):
+        if score >= MATE_SCORE - MAX_PLY:
+            return score + ply
+        if score <= -MATE_SCORE + MAX_PLY:
+            return score - ply
+        return score
+
+    @staticmethod
+    def _score_from_table(score, ply):
+        if score >= MATE_SCORE - MAX_PLY:
+            return score - ply
+        if score <= -MATE_SCORE + MAX_PLY:
+            return score + ply
+        return score
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Search a position and print the best move found.")
+    parser.add_argument("--fen", help="position to search, the start position by default")
+    parser.add_argument("--depth", type=int)
+    parser.add_argument("--time", type=float, dest="time_limit", help="seconds to search for")
+    args = parser.parse_args()
+
+    game = Game.from_fen(args.fen) if args.fen else Game()
+    print(game.best_move(args.depth, args.time_limit))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,373 @@
+"""Asyncio TCP server hosting many games at once.
+
+Clients speak a line based protocol, one command per line:
+
+    NEW [white|black] [engine DEPTH]   start a game, optionally against the engine
+                                       (DEPTH is capped at max_engine_depth)
+    JOIN ID                            take the free side of an open game
+    MOVE e2e4 | MOVE e2 e4 [q]         play a move
+    RESIGN                             give up the current game
+    QUIT                               close the connection
+
+and the server answers with
+
+    GAME ID COLOR       you are playing COLOR in game ID
+    BOARD FEN           the position after every move, sent to both players
+    ERROR MESSAGE       the last command was refused
+    END RESULT REASON   the game is over (1-0, 0-1, 1/2-1/2 or * when abandoned),
+                        REASON is checkmate, stalemate, threefold-repetition,
+                        fifty-move-rule, insufficient-material, resignation,
+                        disconnected, idle, shutdown or engine-error
+
+END is always the last line sent for a game. A command line longer than
+MAX_LINE bytes is dropped with an ERROR.
+
+Moves are checked with Game.play_move in a thread pool and engine moves are
+searched in a process pool, so neither a long search nor a burst of moves on
+one game holds up the event loop for the others. Each engine move is limited to
+engine_time seconds and runs as its own task, so the player can still resign
+or quit while it is being searched. The engine plays from an
+opening book and endgame tablebases first when they are given. Games nobody
+has moved in for idle_timeout seconds are closed.
+"""
+import argparse
+import asyncio
+import itertools
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from book import OpeningBook
+from chess import PROMOTION_PIECES, SQUARE_INDEX, Color, Game, Status
+from tablebase import Tablebase
+
+MAX_LINE = 4096  # Longest command line a client may send, in bytes
+
+
+def parse_move(parts):
+    """Return (start, end, promotion class) from 'e2e4', 'e7e8q' or 'e2 e4 q', or None."""
+    if len(parts) == 1 and len(parts[0]) in (4, 5):
+        parts = [parts[0][:2], parts[0][2:4]] + ([parts[0][4]] if len(parts[0]) == 5 else [])
+    if len(parts) not in (2, 3) or parts[0] not in SQUARE_INDEX or parts[1] not in SQUARE_INDEX:
+        return None
+    if len(parts) == 3 and parts[2].lower() not in PROMOTION_PIECES:
+        return None
+    return parts[0], parts[1], PROMOTION_PIECES[parts[2].lower()] if len(parts) == 3 else None
+
+
+def play_and_check(game, start, end, promotion):
+    """Play a move and return (legal, (result, reason) if the game is over else None)."""
+    if not game.play_move(start, end, promotion):
+        return False, None
+    return True, game_over(game)
+
+
+def game_over(game):
+    status = game.status()
+    if status == Status.CHECKMATE:
+        return ('0-1' if game.current_turn == Color.WHITE else '1-0'), 'checkmate'
+    if status in Status.OVER:
+        return '1/2-1/2', status.replace(' ', '-')  # Reasons are a single word on the wire
+    return None
+
+
+_books = {}  # Opening books mapped by this worker process, by path
+_tablebases = {}  # Tablebases opened by this worker process, by directory
+
+
+def engine_move(fen, depth, time_limit=None, book_path=None, tablebase_path=None):
+    # Runs in a worker process, so only the FEN travels between processes
+    game = Game.from_fen(fen)
+    if book_path is not None:
+        if book_path not in _books:
+            _books[book_path] = OpeningBook(book_path)
+        game.book = _books[book_path]
+    if tablebase_path is not None:
+        if tablebase_path not in _tablebases:
+            _tablebases[tablebase_path] = Tablebase(tablebase_path)
+        game.tablebase = _tablebases[tablebase_path]
+    move = game.best_move(depth, time_limit).move
+    return move.to_uci() if move else None
+
+
+class Player:
+    def __init__(self, writer):
+        self.writer = writer
+        self.session = None
+        self.color = None
+
+    def send(self, line):
+        # Pushes do not wait for the client to read them, a slow reader only grows its own buffer
+        if not self.writer.is_closing():
+            self.writer.write(line.encode() + b"\n")
+
+
+class Session:
+    def __init__(self, game_id, game, now):
+        self.id = game_id
+        self.game = game
+        self.players = {Color.WHITE: None, Color.BLACK: None}
+        self.engine_color = None
+        self.engine_depth = None
+        self.engine_task = None  # Searching the engine's move, when it is the engine's turn
+        self.lock = asyncio.Lock()  # One move at a time per game, and no move once it is over
+        self.last_active = now
+        self.over = False
+
+    def broadcast(self, line):
+        for player in self.players.values():
+            if player is not None:
+                player.send(line)
+
+    @property
+    def started(self):
+        return all(player is not None or color == self.engine_color for color, player in self.players.items())
+
+
+class GameServer:
+    def __init__(self, host="127.0.0.1", port=8765, idle_timeout=300.0, engine_workers=None, move_workers=None,
+                 book=None, tablebase=None, max_engine_depth=4, engine_time=2.0):
+        self.host = host
+        self.port = port
+        self.idle_timeout = idle_timeout
+        self.max_engine_depth = max_engine_depth  # Deepest search a client may ask for
+        self.engine_time = engine_time  # Seconds the engine may search each move
+        self.book = book  # Path of an opening book for engine moves
+        self.tablebase = tablebase  # Directory of endgame tables for engine moves
+        self.sessions = {}
+        self.moves_played = 0
+        self._ids = itertools.count(1)
+        self._move_pool = ThreadPoolExecutor(move_workers)
+        self._engine_workers = engine_workers
+        self._engine_pool = None  # Started with the first engine game
+        self._server = None
+        self._sweeper = None
+        self._writers = set()
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port, limit=MAX_LINE)
+        self.port = self._server.sockets[0].getsockname()[1]
+        self._sweeper = asyncio.create_task(self._expire_idle())
+        return self
+
+    async def serve_forever(self):
+        if self._server is None:
+            await self.start()
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def close(self):
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        for session in list(self.sessions.values()):
+            if session.engine_task is not None:
+                session.engine_task.cancel()
+            await self._finish(session, '*', 'shutdown')
+        for writer in list(self._writers):
+            writer.close()
+        self._move_pool.shutdown(wait=False)
+        if self._engine_pool is not None:
+            self._engine_pool.shutdown(wait=False, cancel_futures=True)
+
+    async def _handle(self, reader, writer):
+        player = Player(writer)
+        self._writers.add(writer)
+        skipping = False  # Reading the rest of a line that was too long
+        try:
+            while True:
+                try:
+                    line = await reader.readuntil(b"\n")
+                except asyncio.IncompleteReadError as error:
+                    line = error.partial  # The connection closed, maybe partway through a line
+                except asyncio.LimitOverrunError as error:
+                    await reader.readexactly(error.consumed)
+                    if not skipping:
+                        player.send(f"ERROR line longer than {MAX_LINE} bytes")
+                        await writer.drain()
+                    skipping = True
+                    continue
+                if not line:
+                    break
+                if skipping:
+                    skipping = False
+                    continue
+                parts = line.decode(errors="replace").split()
+                if not parts:
+                    continue
+                command = parts[0].upper()
+                if command == "QUIT":
+                    break
+                handler = self.COMMANDS.get(command)
+                if handler is None:
+                    player.send(f"ERROR unknown command {parts[0]}")
+                else:
+                    await handler(self, player, parts[1:])
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            if player.session is not None and not player.session.over:
+                await self._finish(player.session, '*', 'disconnected')
+            self._writers.discard(writer)
+            writer.close()
+
+    async def _new(self, player, args):
+        if player.session is not None and not player.session.over:
+            player.send("ERROR already in a game")
+            return
+        color = Color.BLACK if args and args[0].lower() == Color.BLACK else Color.WHITE
+        loop = asyncio.get_running_loop()
+        session = Session(str(next(self._ids)), Game(), loop.time())
+        if "engine" in (arg.lower() for arg in args):
+            depth = args[-1]
+            session.engine_color = Color.BLACK if color == Color.WHITE else Color.WHITE
+            session.engine_depth = min(max(int(depth), 1) if depth.isdigit() else 2, self.max_engine_depth)
+        self.sessions[session.id] = session
+        self._seat(session, player, color)
+        if session.started:
+            session.broadcast(f"BOARD {session.game.to_fen()}")
+            self._engine_turn(session)
+
+    async def _join(self, player, args):
+        session = self.sessions.get(args[0]) if args else None
+        if session is None or session.over:
+            player.send("ERROR no such game")
+            return
+        if player.session is not None and not player.session.over:
+            player.send("ERROR already in a game")
+            return
+        free = [color for color, seated in session.players.items() if seated is None and color != session.engine_color]
+        if not free:
+            player.send("ERROR game is full")
+            return
+        self._seat(session, player, free[0])
+        session.broadcast(f"BOARD {session.game.to_fen()}")
+
+    async def _move(self, player, args):
+        session = player.session
+        if session is None or session.over:
+            player.send("ERROR not in a game")
+            return
+        move = parse_move(args)
+        if move is None:
+            player.send("ERROR cannot read move")
+            return
+        async with session.lock:
+            if session.over:
+                player.send("ERROR not in a game")
+                return
+            if not session.started:
+                player.send("ERROR waiting for an opponent")
+                return
+            if session.game.current_turn != player.color:
+                player.send("ERROR not your turn")
+                return
+            if not await self._play(session, *move):
+                player.send("ERROR illegal move")
+                return
+        self._engine_turn(session)
+
+    async def _resign(self, player, args):
+        session = player.session
+        if session is None or session.over:
+            player.send("ERROR not in a game")
+            return
+        await self._finish(session, '0-1' if player.color == Color.WHITE else '1-0', 'resignation')
+
+    COMMANDS = {"NEW": _new, "JOIN": _join, "MOVE": _move, "RESIGN": _resign}
+
+    def _seat(self, session, player, color):
+        session.players[color] = player
+        player.session = session
+        player.color = color
+        player.send(f"GAME {session.id} {color}")
+
+    async def _play(self, session, start, end, promotion):
+        loop = asyncio.get_running_loop()
+        legal, over = await loop.run_in_executor(self._move_pool, play_and_check, session.game, start, end, promotion)
+        if not legal:
+            return False
+        self.moves_played += 1
+        session.last_active = loop.time()
+        session.broadcast(f"BOARD {session.game.to_fen()}")
+        if over is not None:
+            self._end(session, *over)
+        return True
+
+    def _engine_turn(self, session):
+        if session.over or session.game.current_turn != session.engine_color:
+            return
+        session.engine_task = asyncio.create_task(self._engine_move(session))
+
+    async def _engine_move(self, session):
+        if self._engine_pool is None:
+            self._engine_pool = ProcessPoolExecutor(self._engine_workers)
+        loop = asyncio.get_running_loop()
+        try:
+            uci = await loop.run_in_executor(self._engine_pool, engine_move, session.game.to_fen(), session.engine_depth,
+                                             self.engine_time, self.book, self.tablebase)
+        except Exception:
+            await self._finish(session, '*', 'engine-error')
+            return
+        async with session.lock:
+            if not session.over and uci is not None:
+                await self._play(session, *parse_move([uci]))
+
+    async def _finish(self, session, result, reason):
+        # Waits for a move being played to be sent first, so END is always the last line of a game
+        async with session.lock:
+            self._end(session, result, reason)
+
+    def _end(self, session, result, reason):
+        # The caller holds session.lock
+        if session.over:
+            return
+        session.over = True
+        session.broadcast(f"END {result} {reason}")
+        self.sessions.pop(session.id, None)
+        for player in session.players.values():
+            if player is not None:
+                player.session = None
+
+    async def _expire_idle(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(min(self.idle_timeout / 4, 5.0))
+            now = loop.time()
+            for session in list(self.sessions.values()):
+                if now - session.last_active > self.idle_timeout:
+                    await self._finish(session, '*', 'idle')
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Host chess games over TCP.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--idle-timeout", type=float, default=300.0, help="seconds before an idle game is closed")
+    parser.add_argument("--engine-workers", type=int, help="processes for engine moves")
+    parser.add_argument("--max-engine-depth", type=int, default=4, help="deepest search a client may ask for")
+    parser.add_argument("--engine-time", type=float, default=2.0, help="seconds the engine may search each move")
+    parser.add_argument("--book", help="opening book the engine plays from, see book.py")
+    parser.add_argument("--tablebase", help="directory of endgame tables the engine plays from, see tablebase.py")
+    args = parser.parse_args()
+
+    server = GameServer(args.host, args.port, args.idle_timeout, args.engine_workers, book=args.book,
+                        tablebase=args.tablebase, max_engine_depth=args.max_engine_depth, engine_time=args.engine_time)
+
+    async def run():
+        await server.start()
+        print(f"Serving on {server.host}:{server.port}", flush=True)
+        try:
+            await server.serve_forever()
+        finally:
+            await server.close()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
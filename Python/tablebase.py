@@ -0,0 +1,598 @@
+"""Endgame tablebases for up to four pieces, generated by retrograde analysis.
+
+A table covers one material signature such as KQvK or KRvKP, always stored
+with the stronger side as white; positions with the colors swapped are looked
+up mirrored. Boards are first flipped left to right, and top to bottom when
+there are no pawns, so that the white king stands on files a-d (and ranks 1-4).
+Every position then gets one byte, at index
+
+    (side to move * slots + white king slot) << 6(n - 1) | square of piece 1 << 6(n - 2) | ... | square of piece n - 1
+
+with white's pieces first, each side in KQRBNP order, holding
+
+    0          draw
+    1 - 253    mate in (byte - 1) plies, won for the side to move when odd
+    254        stalemate
+    255        not a legal position
+
+Generation starts from the mates and stalemates and works backwards through
+unmoves, one ply at a time, so the first time a position is reached is its
+distance to mate. Captures and promotions lead into smaller tables, which are
+generated first. Tables are read back through mmap, lazily per signature.
+Positions with an en passant capture are not stored: during generation a
+double push that allows one leads to a separate unstored copy of the position
+that also has the capture, and probes of such positions look one ply ahead.
+Positions with castling rights are not covered.
+
+    python tablebase.py generate tables KQvK KRvK KPvK
+    python tablebase.py generate tables --all 3
+    python tablebase.py probe tables "8/8/8/4k3/8/8/8/KQ6 w - - 0 1"
+"""
+import argparse
+import itertools
+import mmap
+import os
+import time
+
+from chess import Color, Game
+from search import MATE_SCORE
+from tables import (BETWEEN_MASKS, KING_MASKS, KING_TARGETS, KNIGHT_MASKS, KNIGHT_TARGETS, LINE, NO_LINE,
+                    PAWN_MASKS, PAWN_TARGETS, RAYS)
+
+MAX_PIECES = 4
+ORDER = 'KQRBNP'
+VALUES = {'K': 0, 'Q': 9, 'R': 5, 'B': 3, 'N': 3, 'P': 1}
+SLIDER_RAYS = {'Q': (0, 1, 2, 3, 4, 5, 6, 7), 'R': (0, 1, 2, 3), 'B': (4, 5, 6, 7)}
+PROMOTION_LETTERS = 'QRBN'
+DRAW, STALEMATE, INVALID = 0, 254, 255
+MAX_PLIES = 252
+EXTENSION = '.tb'
+WHITE, BLACK = 0, 1  # Colors inside the tables, also the side to move bit
+FORWARD = (1, -1)  # Pawn direction by color
+
+
+def signature(white, black):
+    return f"{white}v{black}"
+
+
+def _sorted(letters):
+    return ''.join(sorted(letters, key=ORDER.index))
+
+
+def _strength(letters):
+    return sum(VALUES[letter] for letter in letters), len(letters), tuple(-ORDER.index(letter) for letter in letters)
+
+
+def canonical(white, black):
+    """Return (white, black, flipped): the stored orientation of a material pair."""
+    white, black = _sorted(white), _sorted(black)
+    if _strength(white) >= _strength(black):
+        return white, black, False
+    return black, white, True
+
+
+def all_signatures(pieces=MAX_PIECES):
+    """Every canonical signature of up to the given number of pieces, each after the tables it needs."""
+    found = set()
+    for extra in range(1, pieces - 1):
+        for count in range(extra + 1):
+            for white in itertools.combinations_with_replacement(ORDER[1:], count):
+                for black in itertools.combinations_with_replacement(ORDER[1:], extra - count):
+                    found.add(signature(*canonical('K' + ''.join(white), 'K' + ''.join(black))[:2]))
+    # Captures need fewer pieces and promotions fewer pawns
+    return sorted(found, key=lambda name: (len(name), name.count('P'), name))
+
+
+def subtables(name):
+    """The signatures of the smaller tables a signature's captures and promotions lead to."""
+    sides = name.split('v')
+    found = set()
+    for color in (WHITE, BLACK):
+        side, other = sides[color], sides[color ^ 1]
+        captured = {other[:i] + other[i + 1:] for i in range(1, len(other))}
+        promoted = {side.replace('P', letter, 1) for letter in PROMOTION_LETTERS} if 'P' in side else set()
+        for pair in {(side, rest) for rest in captured} | {(new, rest) for new in promoted for rest in captured | {other}}:
+            white, black = pair if color == WHITE else pair[::-1]
+            if len(white) + len(black) > 2:
+                found.add(signature(*canonical(white, black)[:2]))
+    return sorted(found)
+
+
+class Layout:
+    """Where the positions of one signature are stored in its table."""
+
+    def __init__(self, name):
+        white, black = name.split('v')
+        self.name = name
+        self.letters = white + black
+        self.colors = [WHITE] * len(white) + [BLACK] * len(black)
+        self.count = len(self.letters)
+        self.pawnless = 'P' not in self.letters
+        self.slots = 16 if self.pawnless else 32  # Squares the white king is kept on
+        self.rest = 6 * (self.count - 1)  # Bits for the other pieces
+        self.shifts = [self.rest] + [6 * (self.count - 1 - i) for i in range(1, self.count)]
+        self.size = 2 * self.slots << self.rest
+
+    def index(self, squares, turn):
+        king = squares[0]
+        # XOR with 7 flips the files and with 56 the ranks
+        flip = (7 if king & 7 >= 4 else 0) | (56 if self.pawnless and king >= 32 else 0)
+        king ^= flip
+        index = turn * self.slots + (king >> 3) * 4 + (king & 7)
+        for i in range(1, self.count):
+            index = index << 6 | squares[i] ^ flip
+        return index
+
+    def squares(self, index):
+        """Return (squares, turn) of the position stored at index."""
+        turn, slot = divmod(index >> self.rest, self.slots)
+        squares = [(slot >> 2) * 8 + (slot & 3)]
+        for shift in self.shifts[1:]:
+            squares.append(index >> shift & 63)
+        return squares, turn
+
+
+def _attacked(target, by, letters, colors, squares, occupied, skip=-1):
+    """Check if a piece of color by attacks target, ignoring the piece at position skip."""
+    for i, letter in enumerate(letters):
+        if colors[i] != by or i == skip:
+            continue
+        square = squares[i]
+        if letter == 'K':
+            if KING_MASKS[square] >> target & 1:
+                return True
+        elif letter == 'N':
+            if KNIGHT_MASKS[square] >> target & 1:
+                return True
+        elif letter == 'P':
+            if PAWN_MASKS[FORWARD[by]][square] >> target & 1:
+                return True
+        elif LINE[square][target] in SLIDER_RAYS[letter] and not BETWEEN_MASKS[square][target] & occupied:
+            return True
+    return False
+
+
+def _targets(letter, square, occupied):
+    """Squares a piece other than a pawn reaches, empty or not."""
+    if letter == 'K':
+        return KING_TARGETS[square]
+    if letter == 'N':
+        return KNIGHT_TARGETS[square]
+    targets = []
+    rays = RAYS[square]
+    for direction in SLIDER_RAYS[letter]:
+        for target in rays[direction]:
+            targets.append(target)
+            if occupied >> target & 1:
+                break
+    return targets
+
+
+def _pawn_targets(color, square, occupied, enemies):
+    forward = FORWARD[color]
+    targets = [target for target in PAWN_TARGETS[forward][square] if enemies >> target & 1]
+    ahead = square + 8 * forward
+    if not occupied >> ahead & 1:
+        targets.append(ahead)
+        if square >> 3 == (1 if color == WHITE else 6) and not occupied >> (ahead + 8 * forward) & 1:
+            targets.append(ahead + 8 * forward)
+    return targets
+
+
+def _origins(letter, color, square, occupied):
+    """Empty squares the piece on square could have come from without capturing or promoting."""
+    if letter == 'P':
+        forward = FORWARD[color]
+        rank = square >> 3
+        if rank == (1 if color == WHITE else 6) or rank in (0, 7):
+            return ()
+        behind = square - 8 * forward
+        if occupied >> behind & 1:
+            return ()
+        if rank == (3 if color == WHITE else 4) and not occupied >> (behind - 8 * forward) & 1:
+            return (behind, behind - 8 * forward)
+        return (behind,)
+    return [origin for origin in _targets(letter, square, occupied) if not occupied >> origin & 1]
+
+
+def _split(letters, colors):
+    return (''.join(letter for letter, color in zip(letters, colors) if color == WHITE),
+            ''.join(letter for letter, color in zip(letters, colors) if color == BLACK))
+
+
+class Tablebase:
+    """Tables in a directory, each mapped the first time a position needs it."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._tables = {}  # Signature -> mmap, or None when the file is missing
+        self._layouts = {}
+
+    def __reduce__(self):
+        # Pickled as its directory so each process maps the files itself
+        return (type(self), (self.directory,))
+
+    def close(self):
+        for data in self._tables.values():
+            if data is not None:
+                data.close()
+        self._tables.clear()
+
+    def path(self, name):
+        return os.path.join(self.directory, name + EXTENSION)
+
+    def layout(self, name):
+        if name not in self._layouts:
+            self._layouts[name] = Layout(name)
+        return self._layouts[name]
+
+    def table(self, name):
+        if name not in self._tables:
+            data = None
+            if os.path.exists(self.path(name)):
+                with open(self.path(name), 'rb') as table_file:
+                    data = mmap.mmap(table_file.fileno(), 0, access=mmap.ACCESS_READ)
+            self._tables[name] = data
+        return self._tables[name]
+
+    def value(self, letters, colors, squares, turn):
+        """Return the byte stored for pieces on squares with turn to move, or None if the table is missing."""
+        white, black = _split(letters, colors)
+        if len(white) + len(black) == 2:
+            return DRAW
+        white, black, flipped = canonical(white, black)
+        name = signature(white, black)
+        data = self.table(name)
+        if data is None:
+            return None
+        pieces = sorted(zip(colors, letters, squares), key=lambda piece: (piece[0] ^ flipped, ORDER.index(piece[1])))
+        ordered = [square ^ 56 if flipped else square for _, _, square in pieces]
+        return data[self.layout(name).index(ordered, turn ^ flipped)]
+
+    def probe_value(self, game):
+        """Return the table byte for the game's position, or None when it is not covered."""
+        board = game.board
+        if board.castling_rights:
+            return None
+        if game.en_passant_file() is not None:
+            return self._value_by_moves(game)
+        letters, colors, squares = [], [], []
+        for square in board.squares:
+            piece = square.piece
+            if piece is not None:
+                if len(letters) == MAX_PIECES:
+                    return None
+                letters.append(piece.letter.upper())
+                colors.append(WHITE if piece.color == Color.WHITE else BLACK)
+                squares.append(square.index)
+        return self.value(letters, colors, squares, WHITE if game.current_turn == Color.WHITE else BLACK)
+
+    def _value_by_moves(self, game):
+        # Positions with an en passant capture are not stored, so score their moves instead
+        best = None
+        for move in game.legal_moves():
+            game.push(move)
+            reply = self.probe_value(game)
+            game.pop()
+            if reply is None or reply == INVALID:
+                return None
+            # Mates for the side to move in the child become mates against us one ply later
+            if reply in (DRAW, STALEMATE):
+                value = DRAW
+            elif reply > MAX_PLIES:
+                return None
+            else:
+                value = reply + 1
+            if best is None or _better(value, best):
+                best = value
+        return best
+
+    def probe(self, game):
+        """Return (wdl, plies) for the side to move, or None when the position is not covered.
+
+        wdl is 1 for a win, 0 for a draw and -1 for a loss, and plies is the
+        distance to mate, 0 for a checkmate or stalemate and None for other draws.
+        """
+        value = self.probe_value(game)
+        if value is None or value == INVALID:
+            return None
+        if value == DRAW:
+            return 0, None
+        if value == STALEMATE:
+            return 0, 0
+        plies = value - 1
+        return (1 if plies % 2 else -1), plies
+
+    def best_move(self, game):
+        """Return (move, score) playing the fastest win, a draw or the slowest loss, or None."""
+        outcome = self.probe(game)
+        if outcome is None or outcome[1] == 0:
+            return None
+        best = None
+        for move in game.legal_moves():
+            game.push(move)
+            reply = self.probe(game)
+            game.pop()
+            if reply is None:
+                return None
+            wdl, plies = reply
+            # Score from the mover's side: mates found sooner and lost later are better
+            score = 0 if wdl == 0 else (MATE_SCORE - plies - 1 if wdl < 0 else -(MATE_SCORE - plies - 1))
+            if best is None or score > best[1]:
+                best = (move, score)
+        return best
+
+
+def _better(value, other):
+    """Check if a table byte is better than another for the side to move."""
+    def rank(value):
+        if value == DRAW:
+            return 0
+        plies = value - 1
+        return 1000 - plies if plies % 2 else -1000 + plies
+    return rank(value) > rank(other)
+
+
+def generate(name, tablebase, progress=None):
+    """Generate the table for a canonical signature such as 'KQvK' and write it to the tablebase directory.
+
+    The smaller tables reached by captures and promotions, see subtables, must
+    already be there, and a missing one raises FileNotFoundError at once.
+    Returns the counts of (won, drawn, lost) positions for the side to move.
+    """
+    layout = tablebase.layout(name)
+    letters, colors, count, shifts = layout.letters, layout.colors, layout.count, layout.shifts
+    size = layout.size
+    turn_offset = layout.slots << layout.rest  # Added to an index to give black the move
+    kings = (0, letters.index('K', 1))
+    pawns = [i for i, letter in enumerate(letters) if letter == 'P']
+
+    values = bytearray(size)  # Final bytes, 0 until decided
+    counters = bytearray(size)  # Moves not yet known to lose, for positions that may be lost
+    slowest = bytearray(size)  # Longest win the opponent has after a capture or promotion
+    buckets = [[] for _ in range(MAX_PLIES + 2)]  # Positions decided at each distance to mate
+    # Positions where the side to move can capture en passant get a copy past the end of
+    # the arrays, reached only by the double push. twins maps a position to its copy and
+    # twin_bases holds (position, pushed pawn) for each copy.
+    twins = {}
+    twin_bases = []
+
+    def leave_table(turn, removed, squares, moved, target, promotion):
+        # Value of the smaller table reached by a capture and/or promotion, for the opponent
+        child_letters, child_colors, child_squares = [], [], []
+        for i in range(count):
+            if i == removed:
+                continue
+            child_letters.append(promotion if i == moved and promotion else letters[i])
+            child_colors.append(colors[i])
+            child_squares.append(target if i == moved else squares[i])
+        value = tablebase.value(child_letters, child_colors, child_squares, turn ^ 1)
+        if value is None:
+            raise FileNotFoundError(f"{name} needs the {signature(*canonical(*_split(child_letters, child_colors))[:2])}"
+                                    f" table in {tablebase.directory}")
+        return value
+
+    # Checked before the scan rather than when the first capture needs them
+    for child in subtables(name):
+        if not os.path.exists(tablebase.path(child)):
+            raise FileNotFoundError(f"{name} needs the {child} table in {tablebase.directory}")
+
+    started = time.perf_counter()
+    for index in range(size):
+        squares, turn = layout.squares(index)
+        occupied = 0
+        for square in squares:
+            occupied |= 1 << square
+        if (occupied.bit_count() != count or
+                any(squares[i] < 8 or squares[i] >= 56 for i in pawns) or
+                _attacked(squares[kings[turn ^ 1]], turn, letters, colors, squares, occupied)):
+            values[index] = INVALID
+            continue
+
+        own = 0
+        for i in range(count):
+            if colors[i] == turn:
+                own |= 1 << squares[i]
+        king = squares[kings[turn]]
+        in_check = _attacked(king, turn ^ 1, letters, colors, squares, occupied)
+        moves = in_table = blocked = 0
+        fastest_win = None
+        for i in range(count):
+            if colors[i] != turn:
+                continue
+            letter, start = letters[i], squares[i]
+            if letter == 'P':
+                candidates = _pawn_targets(turn, start, occupied, occupied & ~own)
+            else:
+                candidates = [target for target in _targets(letter, start, occupied) if not own >> target & 1]
+            # Out of check, only the king itself or a piece in line with it can uncover an attack
+            checked = in_check or i == kings[turn] or LINE[king][start] != NO_LINE
+            for target in candidates:
+                captured = -1
+                if occupied >> target & 1:
+                    captured = squares.index(target)
+                if checked:
+                    moved_squares = squares[:]
+                    moved_squares[i] = target
+                    if _attacked(moved_squares[kings[turn]], turn ^ 1, letters, colors, moved_squares,
+                                 occupied & ~(1 << start) | 1 << target, captured):
+                        continue
+                promotions = PROMOTION_LETTERS if letter == 'P' and target >> 3 in (0, 7) else None
+                if captured < 0 and promotions is None:
+                    moves += 1
+                    in_table += 1
+                    continue
+                for promotion in promotions or (None,):
+                    moves += 1
+                    value = leave_table(turn, captured, squares, i, target, promotion)
+                    if value in (DRAW, STALEMATE):
+                        blocked = 1
+                    elif (value - 1) % 2 == 0:  # The opponent is mated or loses
+                        blocked = 1
+                        if fastest_win is None or value - 1 < fastest_win:
+                            fastest_win = value - 1
+                    else:
+                        slowest[index] = max(slowest[index], value - 1)
+        # A way out of the table that does not lose keeps the position from ever counting as lost
+        counters[index] = in_table + blocked
+        if fastest_win is not None:
+            buckets[fastest_win + 1].append(index)
+        if moves == 0:
+            if in_check:
+                buckets[0].append(index)
+            else:
+                values[index] = STALEMATE
+        elif counters[index] == 0:
+            buckets[slowest[index] + 1].append(index)
+
+        for j in pawns:
+            # The opponent's pawn may just have made a double push past one of ours
+            pushed = squares[j]
+            back = -8 * FORWARD[turn ^ 1]
+            if (colors[j] == turn or pushed >> 3 != (3 if turn == BLACK else 4) or
+                    occupied >> (pushed + back) & 1 or occupied >> (pushed + 2 * back) & 1):
+                continue
+            passed = pushed + back
+            captures = []
+            for k in pawns:
+                start = squares[k]
+                if colors[k] != turn or start >> 3 != pushed >> 3 or abs((start & 7) - (pushed & 7)) != 1:
+                    continue
+                moved_squares = squares[:]
+                moved_squares[k] = passed
+                if not _attacked(king, turn ^ 1, letters, colors, moved_squares,
+                                 occupied & ~(1 << start) & ~(1 << pushed) | 1 << passed, j):
+                    captures.append(leave_table(turn, j, squares, k, passed, None))
+            if not captures:
+                continue
+            twin = size + len(twin_bases)
+            twins[index] = twin
+            twin_bases.append((index, j))
+            twin_blocked, twin_win, twin_slowest = blocked, fastest_win, slowest[index]
+            for value in captures:
+                if value in (DRAW, STALEMATE):
+                    twin_blocked = 1
+                elif (value - 1) % 2 == 0:
+                    twin_blocked = 1
+                    if twin_win is None or value - 1 < twin_win:
+                        twin_win = value - 1
+                else:
+                    twin_slowest = max(twin_slowest, value - 1)
+            values.append(0)
+            counters.append(in_table + twin_blocked)
+            slowest.append(twin_slowest)
+            if twin_win is not None:
+                buckets[twin_win + 1].append(twin)
+            elif counters[twin] == 0:
+                buckets[twin_slowest + 1].append(twin)
+        if progress is not None and index % 262144 == 0:
+            progress(name, 'moves', index, size, time.perf_counter() - started)
+
+    for plies, bucket in enumerate(buckets):
+        if bucket and plies > MAX_PLIES:
+            raise ValueError(f"{name} has mates longer than {MAX_PLIES} plies")
+        for index in bucket:
+            if values[index]:
+                continue
+            values[index] = plies + 1
+            if index >= size:
+                # Only the double push that allowed the capture leads to a copy
+                stored, j = twin_bases[index - size]
+                squares, turn = layout.squares(stored)
+                mover = turn ^ 1
+                base = stored + turn_offset if mover else stored - turn_offset
+                parents = [base + ((-16 * FORWARD[mover]) << shifts[j])]
+            else:
+                squares, turn = layout.squares(index)
+                mover = turn ^ 1
+                # Unmoves hand the move back, and only the white king can leave the stored corner
+                base = index + turn_offset if mover else index - turn_offset
+                occupied = 0
+                for square in squares:
+                    occupied |= 1 << square
+                pushed = twin_bases[twins[index] - size][1] if index in twins else -1
+                parents = []
+                for i in range(count):
+                    if colors[i] != mover:
+                        continue
+                    start = squares[i]
+                    for origin in _origins(letters[i], mover, start, occupied):
+                        if i == 0:
+                            squares[0] = origin
+                            parents.append(layout.index(squares, mover))
+                            squares[0] = start
+                        elif i != pushed or origin != start - 16 * FORWARD[mover]:
+                            parents.append(base + ((origin - start) << shifts[i]))
+            for parent in parents:
+                for previous in (parent, twins[parent]) if parent in twins else (parent,):
+                    if values[previous]:
+                        continue
+                    if plies % 2 == 0:
+                        # The mover can reach a lost position for the opponent
+                        buckets[plies + 1].append(previous)
+                    else:
+                        counters[previous] -= 1
+                        if counters[previous] == 0:
+                            buckets[max(plies, slowest[previous]) + 1].append(previous)
+    if progress is not None:
+        progress(name, 'done', size, size, time.perf_counter() - started)
+
+    os.makedirs(tablebase.directory, exist_ok=True)
+    del values[size:]
+    with open(tablebase.path(name), 'wb') as output:
+        output.write(values)
+    tablebase._tables.pop(name, None)
+    won = sum(1 for value in values if value not in (DRAW, STALEMATE, INVALID) and value % 2 == 0)
+    lost = sum(1 for value in values if value not in (DRAW, STALEMATE, INVALID) and value % 2 == 1)
+    return won, values.count(DRAW) + values.count(STALEMATE), lost
+
+
+def generate_all(names, tablebase, progress=None):
+    """Generate the named tables missing from the directory, in order, and return the names generated."""
+    generated = []
+    for name in names:
+        white, black = name.split('v')
+        name = signature(*canonical(white, black)[:2])
+        if not os.path.exists(tablebase.path(name)):
+            generate(name, tablebase, progress)
+            generated.append(name)
+    return generated
+
+
+def _print_progress(name, stage, done, total, elapsed):
+    print(f"\r{name:8} {done / total:6.1%} {elapsed:7.1f}s", end="\n" if stage == 'done' else "", flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate or probe endgame tablebases.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    generate_parser = commands.add_parser("generate")
+    generate_parser.add_argument("directory")
+    generate_parser.add_argument("names", nargs="*", help="signatures such as KQvK, after the tables they need")
+    generate_parser.add_argument("--all", type=int, metavar="PIECES", help="every signature of up to PIECES pieces")
+    probe_parser = commands.add_parser("probe")
+    probe_parser.add_argument("directory")
+    probe_parser.add_argument("fen")
+    args = parser.parse_args()
+
+    tablebase = Tablebase(args.directory)
+    if args.command == "generate":
+        if args.all and not 3 <= args.all <= MAX_PIECES:
+            parser.error(f"--all takes 3 to {MAX_PIECES} pieces")
+        generated = generate_all(all_signatures(args.all) if args.all else args.names, tablebase, _print_progress)
+        print(f"{len(generated)} tables written to {args.directory}")
+        return
+    game = Game.from_fen(args.fen)
+    outcome = tablebase.probe(game)
+    if outcome is None:
+        print("not in the tablebase")
+        return
+    wdl, plies = outcome
+    print({1: f"win, mate in {plies} plies", 0: "draw", -1: f"loss, mate in {plies} plies"}[wdl])
+    best = tablebase.best_move(game)
+    if best is not None:
+        print(f"best move {best[0].to_uci()}")
+
+
+if __name__ == "__main__":
+    main()
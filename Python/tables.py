@@ -0,0 +1,80 @@
+"""Move tables precomputed once per process and shared by every Board.
+
+Squares are numbered 0-63 as ``y * 8 + x`` (a1 = 0, h8 = 63). For every square
+the tables list the squares a knight or king reaches, the squares along each
+of the eight rays and, for every pair of squares on a common line, the squares
+strictly between them, both as index tuples and as 64-bit masks. Everything is
+built from plain loops at import, which takes a few milliseconds, so no
+cached copy is written to disk.
+"""
+
+KNIGHT_OFFSETS = ((1, 2), (2, 1), (2, -1), (1, -2), (-1, -2), (-2, -1), (-2, 1), (-1, 2))
+KING_OFFSETS = ((1, 0), (1, 1), (0, 1), (-1, 1), (-1, 0), (-1, -1), (0, -1), (1, -1))
+ROOK_DIRECTIONS = ((0, 1), (1, 0), (0, -1), (-1, 0))
+BISHOP_DIRECTIONS = ((1, 1), (-1, 1), (1, -1), (-1, -1))
+# Rays are numbered in this order, orthogonal first, like Queen.directions
+DIRECTIONS = ROOK_DIRECTIONS + BISHOP_DIRECTIONS
+DIRECTION_INDEX = {direction: number for number, direction in enumerate(DIRECTIONS)}
+OPPOSITE = [DIRECTION_INDEX[-dx, -dy] for dx, dy in DIRECTIONS]
+NO_LINE = -1
+
+
+def _targets(offsets):
+    table = []
+    for index in range(64):
+        x, y = index % 8, index // 8
+        table.append(tuple((y + dy) * 8 + x + dx for dx, dy in offsets if 0 <= x + dx < 8 and 0 <= y + dy < 8))
+    return table
+
+
+def _ray(index, dx, dy):
+    x, y = index % 8 + dx, index // 8 + dy
+    ray = []
+    while 0 <= x < 8 and 0 <= y < 8:
+        ray.append(y * 8 + x)
+        x += dx
+        y += dy
+    return tuple(ray)
+
+
+def _mask(indices):
+    mask = 0
+    for index in indices:
+        mask |= 1 << index
+    return mask
+
+
+KNIGHT_TARGETS = _targets(KNIGHT_OFFSETS)
+KING_TARGETS = _targets(KING_OFFSETS)
+# Squares a pawn attacks, keyed by the direction it moves in (1 for white, -1 for black)
+PAWN_TARGETS = {1: _targets(((-1, 1), (1, 1))), -1: _targets(((-1, -1), (1, -1)))}
+KNIGHT_MASKS = [_mask(targets) for targets in KNIGHT_TARGETS]
+KING_MASKS = [_mask(targets) for targets in KING_TARGETS]
+PAWN_MASKS = {direction: [_mask(targets) for targets in table] for direction, table in PAWN_TARGETS.items()}
+
+# RAYS[square][direction] runs from next to the square out to the edge of the board
+RAYS = [tuple(_ray(index, dx, dy) for dx, dy in DIRECTIONS) for index in range(64)]
+RAY_MASKS = [[_mask(ray) for ray in rays] for rays in RAYS]
+
+
+def _lines():
+    # LINE[start][end] is the direction from start to end, or NO_LINE when they are
+    # not on a common rank, file or diagonal. BETWEEN[start][end] holds the squares
+    # strictly between them and is empty when there are none or there is no line.
+    line, between, between_masks = [], [], []
+    for rays in RAYS:
+        directions, squares, masks = [NO_LINE] * 64, [()] * 64, [0] * 64
+        for direction, ray in enumerate(rays):
+            mask = 0
+            for step, end in enumerate(ray):
+                directions[end] = direction
+                squares[end] = ray[:step]
+                masks[end] = mask
+                mask |= 1 << end
+        line.append(directions)
+        between.append(squares)
+        between_masks.append(masks)
+    return line, between, between_masks
+
+
+LINE, BETWEEN, BETWEEN_MASKS = _lines()
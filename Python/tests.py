@@ -1,5 +1,32 @@
+import asyncio
+import contextlib
+import io
+import pickle
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
 import unittest
-from chess import Color, Game
+from unittest import mock
+from batch import decode, encode, encode_fens, evaluate_batch, from_planes, to_planes
+from bitboard import BitboardBoard
+from book import OpeningBook, build_book, collect, decode_move, write_book
+import cli
+from chess import MOVE_LIST_VALUE_SIZE, START_FEN, Board, Color, Game, Knight, Queen, Rook, Status, move_list_size
+from evaluation import evaluate
+import instrument
+from loadgen import Client
+from match import Adjudication, Engine, elo_difference, play_game, read_fens, run_match
+from parallel import parallel_divide, parallel_perft, parallel_replay, parallel_search
+from perft import POSITIONS, divide, perft
+from pgn import PGNError, PGNGame, ReplayStats, encode_san, format_game, read_games, replay, replay_games
+from position import START_POSITION, Position, apply_move
+from server import GameServer, play_and_check
+from tablebase import Tablebase, all_signatures, canonical, generate, subtables
+from tables import BETWEEN, BETWEEN_MASKS, KNIGHT_TARGETS, LINE, NO_LINE, RAYS
+from transposition import LRUCache, TranspositionTable
 
 class TestGame(unittest.TestCase):
     def test_play_move(self):
@@ -14,6 +41,1125 @@ class TestGame(unittest.TestCase):
         game.play_move("e7", "e5")
         self.assertEqual(game.current_turn, Color.WHITE)
 
+class TestLegalMoves(unittest.TestCase):
+    def test_initial_position(self):
+        game = Game()
+        self.assertEqual(len(game.legal_moves()), 20)
+
+    def test_castling(self):
+        game = Game()
+        for start_pos, end_pos in [("e2", "e4"), ("e7", "e5"), ("g1", "f3"), ("b8", "c6"), ("f1", "c4"), ("g8", "f6")]:
+            game.play_move(start_pos, end_pos)
+        self.assertIn("e1->g1", [repr(move)[1:] for move in game.legal_moves()])
+        self.assertTrue(game.play_move("e1", "g1"))
+        self.assertIsInstance(game.board.get_square("f1").piece, Rook)
+        self.assertIsNone(game.board.get_square("h1").piece)
+
+    def test_en_passant(self):
+        game = Game()
+        for start_pos, end_pos in [("e2", "e4"), ("a7", "a6"), ("e4", "e5"), ("d7", "d5")]:
+            game.play_move(start_pos, end_pos)
+        self.assertIn("e5->d6", [repr(move)[1:] for move in game.legal_moves()])
+        self.assertTrue(game.play_move("e5", "d6"))
+        self.assertIsNone(game.board.get_square("d5").piece)
+
+    def test_promotion(self):
+        game = Game()
+        for start_pos, end_pos in [("h2", "h4"), ("g7", "g5"), ("h4", "g5"), ("f7", "f6"), ("g5", "g6"),
+                                   ("f6", "f5"), ("g6", "h7"), ("f5", "f4")]:
+            game.play_move(start_pos, end_pos)
+        promotions = [move.promotion for move in game.legal_moves() if move.end_pos == game.board.get_square("g8")]
+        self.assertEqual(len(promotions), 4)
+        self.assertTrue(game.play_move("h7", "g8", Knight))
+        self.assertIsInstance(game.board.get_square("g8").piece, Knight)
+
+    def test_check_evasions(self):
+        game = Game()
+        for start_pos, end_pos in [("e2", "e4"), ("d7", "d6"), ("d2", "d4"), ("e8", "d7"), ("f1", "b5")]:
+            game.play_move(start_pos, end_pos)
+        self.assertTrue(game.board.is_king_in_check(Color.BLACK))
+        moves = [repr(move)[1:] for move in game.legal_moves()]
+        self.assertIn("c7->c6", moves)
+        self.assertNotIn("a7->a6", moves)
+
+    def test_pinned_pieces_move_along_pin(self):
+        for board in (Board(), BitboardBoard()):
+            game = Game.from_fen("6k1/8/8/8/1b2r3/8/3BR3/4K3 w - - 0 1", board)
+            pinned = sorted(move.to_uci() for move in game.legal_moves() if move.to_uci()[:2] in ("d2", "e2"))
+            self.assertEqual(pinned, ["d2b4", "d2c3", "e2e3", "e2e4"])
+
+class TestUndo(unittest.TestCase):
+    def snapshot(self, game):
+        board = game.board
+        pieces = [square.piece for square in board.squares]
+        return pieces, board.castling_rights, game.current_turn, game.last_move, [list(counts) for counts in board.attacks.values()]
+
+    def test_unwind_every_move(self):
+        for name in ("kiwipete", "position4", "position5"):
+            game = Game.from_fen(POSITIONS[name][0])
+            before = self.snapshot(game)
+            for move in game.legal_moves():
+                game.push(move)
+                for reply in game.legal_moves():
+                    game.push(reply)
+                    game.pop()
+                game.pop()
+                self.assertEqual(self.snapshot(game), before, move)
+
+    def test_undo_castling(self):
+        game = Game.from_fen("r3k2r/8/8/8/8/8/8/R3K2R w KQkq - 0 1")
+        game.play_move("e1", "c1")
+        self.assertIsNotNone(game.undo_move())
+        self.assertIsInstance(game.board.get_square("a1").piece, Rook)
+        self.assertEqual(game.board.castling_rights, 15)
+        self.assertIsNone(game.undo_move())
+
+    def test_rejects_move_into_check(self):
+        game = Game.from_fen("4k3/8/8/8/8/8/4r3/4K3 w - - 0 1")
+        self.assertFalse(game.play_move("e1", "f2"))
+        self.assertEqual(repr(game.board.find_king(Color.WHITE)), "e1")
+        self.assertEqual(game.move_stack, [])
+
+class TestZobrist(unittest.TestCase):
+    def play(self, moves, game=None):
+        game = game or Game()
+        for start_pos, end_pos in moves:
+            self.assertTrue(game.play_move(start_pos, end_pos))
+        return game
+
+    def test_transpositions_match(self):
+        first = self.play([("g1", "f3"), ("g8", "f6"), ("b1", "c3")])
+        second = self.play([("b1", "c3"), ("g8", "f6"), ("g1", "f3")])
+        self.assertEqual(first.zobrist_hash, second.zobrist_hash)
+        self.assertNotEqual(first.zobrist_hash, Game().zobrist_hash)
+
+    def test_incremental_matches_fen(self):
+        game = self.play([("e2", "e4"), ("g8", "f6"), ("e4", "e5"), ("d7", "d5")])
+        fen = "rnbqkb1r/ppp1pppp/5n2/3pP3/8/8/PPPP1PPP/RNBQKBNR w KQkq d6 0 3"
+        self.assertEqual(game.zobrist_hash, Game.from_fen(fen).zobrist_hash)
+        self.play([("e1", "e2"), ("f6", "g8"), ("e2", "e1"), ("g8", "f6")], game)
+        # Same placement, but castling rights and the en passant capture are gone
+        self.assertEqual(game.board.zobrist_hash, Game.from_fen(fen).board.zobrist_hash)
+        self.assertEqual(game.zobrist_hash, Game.from_fen(fen.replace("KQkq d6", "kq -")).zobrist_hash)
+
+    def test_undo_restores_hash(self):
+        game = Game.from_fen(POSITIONS["kiwipete"][0])
+        before = game.zobrist_hash
+        for move in game.legal_moves():
+            game.push(move)
+            game.pop()
+            self.assertEqual(game.zobrist_hash, before, move)
+
+    def test_move_cache(self):
+        game = Game()
+        game.move_cache = TranspositionTable(1, MOVE_LIST_VALUE_SIZE, move_list_size)
+        moves = game.legal_moves()
+        self.assertIs(game.legal_moves(), moves)
+        game.play_move("e2", "e4")
+        self.assertEqual(len(game.legal_moves()), 20)
+        self.assertEqual(game.move_cache.hits, 1)
+
+class TestPosition(unittest.TestCase):
+    def test_moves_match_game(self):
+        for name in ("kiwipete", "position3", "position4"):
+            game = Game.from_fen(POSITIONS[name][0])
+            position = Position.from_game(game)
+            for move in game.legal_moves():
+                after = apply_move(position, move)
+                game.push(move)
+                self.assertEqual((after.to_fen(), after.key), (game.to_fen(), game.zobrist_hash), move.to_uci())
+                self.assertEqual(after, Position.from_fen(game.to_fen()))
+                game.pop()
+            self.assertEqual(position, Position.from_game(game))
+
+    def test_shares_untouched_ranks(self):
+        after = apply_move(START_POSITION, "g1f3")
+        # Only the first and third ranks are rebuilt
+        self.assertEqual(sum(rank is old for rank, old in zip(after.ranks, START_POSITION.ranks)), 6)
+        castled = apply_move(Position.from_fen(POSITIONS["kiwipete"][0]), "e1g1")
+        self.assertEqual(castled[6], "K")
+        self.assertEqual((castled[5], castled.castling_rights), ("R", 12))
+
+    def test_en_passant_and_promotion(self):
+        position = apply_move(Position.from_fen("4k3/8/8/8/5p2/8/4P3/4K3 w - - 0 1"), "e2e4")
+        self.assertEqual(position.en_passant_file, 4)
+        captured = apply_move(position, "f4e3")
+        self.assertEqual((captured[28], captured[20]), (None, "p"))
+        self.assertEqual(captured.key, Game.from_fen(captured.to_fen()).zobrist_hash)
+        promoted = apply_move(Position.from_fen("4k3/1P6/8/8/8/8/8/4K3 w - - 3 40"), "b7b8n")
+        self.assertEqual((promoted[57], promoted.halfmove_clock), ("N", 0))
+        with self.assertRaises(ValueError):
+            apply_move(promoted, "e1e2")  # Black to move
+
+    def test_immutable_hashable_and_round_trips(self):
+        position = Position.from_fen(POSITIONS["kiwipete"][0])
+        with self.assertRaises(AttributeError):
+            position.turn = Color.BLACK
+        clocks_moved = Position.from_fen(POSITIONS["kiwipete"][0].replace("0 1", "7 30"))
+        self.assertEqual(len({position, clocks_moved, pickle.loads(pickle.dumps(position))}), 1)
+        game = position.to_game()
+        self.assertEqual(game.to_fen(), POSITIONS["kiwipete"][0])
+        self.assertEqual(len(game.legal_moves()), 48)
+        board = Board()
+        self.assertIs(position.to_board(board), board)
+        self.assertEqual(board.zobrist_hash, Game.from_fen(POSITIONS["kiwipete"][0]).board.zobrist_hash)
+
+
+class TestTranspositionTable(unittest.TestCase):
+    def test_memory_budget(self):
+        squares = Game().board.squares
+        tracemalloc.start()
+        table = TranspositionTable(memory_mb=1)
+        for key in range(table.size):
+            table.store(key * 7919 + 2 ** 40, (1000 + key, 0, (squares[12], squares[28], None), 3), 3)
+        used = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        self.assertEqual(len(table), table.size)
+        self.assertLess(used, 1024 * 1024)
+        self.assertGreater(used, 0.9 * 1024 * 1024)
+
+    def test_move_cache_memory_budget(self):
+        game = Game.from_fen(POSITIONS["kiwipete"][0])
+
+        def walk(depth):
+            moves = game.legal_moves()
+            if depth:
+                for move in moves:
+                    game.push(move)
+                    walk(depth - 1)
+                    game.pop()
+
+        tracemalloc.start()
+        game.move_cache = table = TranspositionTable(1, MOVE_LIST_VALUE_SIZE, move_list_size)
+        walk(2)  # Far more lists than fit, so the table fills up to its budget
+        used = tracemalloc.get_traced_memory()[0]
+        game.move_cache = table = None
+        used -= tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        self.assertLess(used, 1024 * 1024)
+        self.assertGreater(used, 0.9 * 1024 * 1024)
+
+    def test_replacement(self):
+        table = TranspositionTable(memory_mb=0)
+        self.assertEqual(table.size, 1)
+        table.store(1, "deep", depth=5)
+        self.assertFalse(table.store(2, "shallow", depth=1))
+        self.assertEqual(table.probe(1), "deep")
+        self.assertIsNone(table.probe(1, depth=6))
+        table.new_search()
+        self.assertTrue(table.store(2, "shallow", depth=1))
+        self.assertIsNone(table.probe(1))
+        self.assertEqual(table.probe(2), "shallow")
+
+class TestSearch(unittest.TestCase):
+    def test_finds_mate_in_one(self):
+        game = Game.from_fen("6k1/5ppp/8/8/8/8/5PPP/3R2K1 w - - 0 1")
+        result = game.best_move(depth=3)
+        self.assertEqual(result.move.to_uci(), "d1d8")
+        self.assertGreater(result.score, 90000)
+
+    def test_wins_hanging_queen(self):
+        game = Game.from_fen("4k3/8/8/3q4/8/8/3R4/4K3 w - - 0 1")
+        result = game.best_move(depth=2)
+        self.assertEqual(result.move.to_uci(), "d2d5")
+        self.assertEqual(result.pv[0], result.move)
+
+    def test_search_leaves_game_untouched(self):
+        game = Game.from_fen(POSITIONS["kiwipete"][0])
+        before = game.zobrist_hash
+        result = game.best_move(depth=1)
+        self.assertEqual(game.zobrist_hash, before)
+        self.assertEqual(game.move_stack, [])
+        self.assertGreater(result.nodes, 0)
+        self.assertTrue(game.play_move(repr(result.move.start_pos), repr(result.move.end_pos)))
+
+    def test_time_limit(self):
+        game = Game()
+        start = time.perf_counter()
+        result = game.best_move(time_limit=0.3)
+        self.assertLess(time.perf_counter() - start, 1.0)
+        self.assertIn(result.move.to_uci(), [move.to_uci() for move in game.legal_moves()])
+
+    def test_short_time_limit_still_searches(self):
+        game = Game.from_fen(POSITIONS["kiwipete"][0])
+        start = time.perf_counter()
+        result = game.best_move(time_limit=0.05)
+        self.assertLess(time.perf_counter() - start, 0.5)
+        self.assertGreaterEqual(result.depth, 1)
+        self.assertEqual(result.pv[0], result.move)
+
+    def test_repeating_game_position_is_a_draw(self):
+        game = Game.from_fen("7k/8/8/8/8/Q7/8/7K b - - 0 1")
+        for move in ("h8g8", "h1g1", "g8h8"):
+            game.play_move(move[:2], move[2:])
+        # Kh1 would repeat the start position, which gives up the win
+        result = game.best_move(depth=2)
+        self.assertNotEqual(result.move.to_uci(), "g1h1")
+        self.assertGreater(result.score, 500)
+        game.play_move("g1", "h1")
+        # Kg8 repeats the position after black's first move, the loser's way out
+        self.assertEqual((game.best_move(depth=2).score, Game.from_fen(game.to_fen()).best_move(depth=2).score < -500),
+                         (0, True))
+
+class TestStatus(unittest.TestCase):
+    def play(self, game, moves):
+        for move in moves.split():
+            self.assertTrue(game.play_move(move[:2], move[2:]), move)
+
+    def test_checkmate_stalemate_and_check(self):
+        game = Game()
+        self.assertEqual(game.status(), Status.IN_PROGRESS)
+        self.play(game, "e2e4 f7f6 d2d4 g7g5")
+        self.assertEqual(game.status(), Status.IN_PROGRESS)
+        self.play(game, "d1h5")
+        self.assertEqual(game.status(), Status.CHECKMATE)
+        self.assertEqual(Game.from_fen("7k/5Q2/6K1/8/8/8/8/8 b - - 0 1").status(), Status.STALEMATE)
+        self.assertEqual(Game.from_fen("4k3/8/8/8/8/8/8/4K2R b K - 0 1").status(), Status.IN_PROGRESS)
+        self.assertEqual(Game.from_fen("4k3/8/8/8/8/8/8/4R1K1 b - - 0 1").status(), Status.CHECK)
+
+    def test_status_is_cached_per_position(self):
+        game = Game()
+        game.status()
+        game.status()
+        self.assertEqual((game.status_cache.hits, game.status_cache.misses), (1, 1))
+        self.play(game, "g1f3 g8f6 f3g1 f6g8")
+        self.assertEqual(game.status(), Status.IN_PROGRESS)
+        self.assertEqual(game.status_cache.hits, 2)
+
+    def test_threefold_repetition(self):
+        game = Game()
+        self.play(game, "g1f3 g8f6 f3g1 f6g8")
+        self.assertEqual(game.repetition_count(), 2)
+        self.assertEqual(game.status(), Status.IN_PROGRESS)
+        self.play(game, "g1f3 g8f6 f3g1 f6g8")
+        self.assertEqual(game.repetition_count(), 3)
+        self.assertEqual(game.status(), Status.THREEFOLD_REPETITION)
+        game.pop()
+        self.assertEqual(game.status(), Status.IN_PROGRESS)
+        self.assertEqual(game.repetition_count(), 2)
+
+    def test_illegal_moves_leave_history_alone(self):
+        game = Game.from_fen("4k3/8/8/8/8/8/4r3/4K3 w - - 0 1")
+        self.assertFalse(game.play_move("e1", "d2"))  # Made, found to leave the king in check, undone
+        self.assertEqual(game.position_counts, {})
+        self.play(game, "e1e2")
+        self.assertEqual(sum(game.position_counts.values()), 1)
+
+    def test_fifty_move_rule(self):
+        game = Game.from_fen("4k3/8/8/8/8/8/8/R3K3 w - - 99 80")
+        self.assertEqual(game.status(), Status.IN_PROGRESS)
+        self.play(game, "a1a2")
+        self.assertEqual(game.status(), Status.FIFTY_MOVES)
+        game.pop()
+        self.play(game, "a1a7")
+        self.assertEqual(game.status(), Status.FIFTY_MOVES)
+        # Mate on the hundredth ply still wins
+        game = Game.from_fen("6k1/5ppp/8/8/8/8/8/R5K1 w - - 99 80")
+        self.play(game, "a1a8")
+        self.assertEqual(game.status(), Status.CHECKMATE)
+
+    def test_insufficient_material(self):
+        for fen, expected in (("4k3/8/8/8/8/8/8/4K3 w - - 0 1", True),
+                              ("4k3/8/8/8/8/8/8/2B1K3 w - - 0 1", True),
+                              ("4kn2/8/8/8/8/8/8/4K3 w - - 0 1", True),
+                              ("4kb2/8/8/8/8/8/8/2B1K3 w - - 0 1", True),
+                              ("2b1k3/8/8/8/8/8/8/2B1K3 w - - 0 1", False),
+                              ("4k3/8/8/8/8/8/8/1NN1K3 w - - 0 1", False),
+                              ("4k3/8/8/8/8/8/P7/4K3 w - - 0 1", False)):
+            self.assertEqual(Board(fen).has_insufficient_material(), expected, fen)
+        game = Game.from_fen("4k3/8/8/8/8/8/8/2B1K3 w - - 0 1")
+        self.assertEqual(game.status(), Status.INSUFFICIENT_MATERIAL)
+
+    def test_lru_cache_evicts_least_recently_used(self):
+        cache = LRUCache(2)
+        cache.put(1, 'a')
+        cache.put(2, 'b')
+        self.assertEqual(cache.get(1), 'a')
+        cache.put(3, 'c')
+        self.assertIsNone(cache.get(2))
+        self.assertEqual((cache.get(1), cache.get(3), len(cache)), ('a', 'c', 2))
+
+
+class TestInstrument(unittest.TestCase):
+    def setUp(self):
+        instrument.reset()
+
+    def tearDown(self):
+        instrument.disable()
+        instrument.reset()
+
+    def test_disabled_by_default_and_restored(self):
+        original = Board.__dict__['is_path_clear']
+        self.assertFalse(instrument.is_enabled())
+        instrument.enable()
+        self.assertIsNot(Board.__dict__['is_path_clear'], original)
+        self.assertIs(Board.__dict__['is_path_clear'].__wrapped__, original)
+        instrument.disable()
+        self.assertIs(Board.__dict__['is_path_clear'], original)
+
+    def test_counts_calls_per_function_and_piece(self):
+        with instrument.instrumented():
+            game = Game()
+            for start, end in (("g1", "f3"), ("e7", "e5"), ("f3", "e5")):
+                self.assertTrue(game.play_move(start, end))
+            BitboardBoard().is_path_clear(game.board.get_square("a1"), game.board.get_square("a3"))
+        self.assertFalse(instrument.is_enabled())
+        Game().play_move("e2", "e4")  # Not counted once disabled
+        stats = game.stats()
+        self.assertEqual(stats.functions["Game.play_move"][0], 3)
+        self.assertEqual(stats.functions["Knight.is_valid_move"][0], 2)
+        self.assertEqual(stats.functions["BitboardBoard.is_path_clear"][0], 1)
+        self.assertEqual(stats.pieces["Knight"], stats.functions["Knight.is_valid_move"])
+        self.assertGreater(stats.as_dict()["functions"]["Game.make_move"]["seconds"], 0)
+        self.assertNotIn("Queen.is_valid_move", stats.functions)
+
+    def test_profile_dumps_pstats(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "search.prof")
+            stream = io.StringIO()
+            result, stats = instrument.profile(Game().best_move, 2, path=path, limit=5, stream=stream)
+            self.assertIsNotNone(result.move)
+            self.assertTrue(os.path.getsize(path) > 0)
+            self.assertGreater(stats.total_calls, 0)
+            self.assertIn("cumulative", stream.getvalue())
+
+
+class TestFlyweightPieces(unittest.TestCase):
+    def test_pieces_shared_between_boards(self):
+        first, second = Board(), Board()
+        self.assertIs(first.get_square("b1").piece, second.get_square("g1").piece)
+        self.assertIs(Knight(Color.WHITE), first.get_square("b1").piece)
+        self.assertIsNot(Knight(Color.BLACK), Knight(Color.WHITE))
+
+    def test_castling_rights_follow_moves(self):
+        game = Game.from_fen("r3k2r/8/8/8/8/8/8/R3K2R w KQkq - 0 1")
+        game.play_move("h1", "h8")  # Captures the rook, both kingside rights go
+        self.assertEqual(game.board.castling_rights, 2 | 8)
+        self.assertTrue(game.play_move("e8", "e7"))
+        self.assertEqual(game.board.castling_rights, 2)
+        game.undo_move()
+        game.undo_move()
+        self.assertEqual(game.board.castling_rights, 15)
+
+    def test_squares_have_no_dict(self):
+        square = Board().get_square("e2")
+        self.assertFalse(hasattr(square, "__dict__"))
+        self.assertFalse(hasattr(square.piece, "__dict__"))
+
+
+class TestFen(unittest.TestCase):
+    def test_round_trip(self):
+        for fen, _ in POSITIONS.values():
+            self.assertEqual(Game.from_fen(fen).to_fen(), fen)
+            self.assertEqual(Board.from_fen(fen).to_fen(), fen.split()[0])
+        self.assertEqual(Game().to_fen(), START_FEN)
+
+    def test_counters_and_en_passant(self):
+        game = Game()
+        game.play_move("e2", "e4")
+        self.assertEqual(game.to_fen(), "rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq e3 0 1")
+        game.play_move("g8", "f6")
+        self.assertEqual(game.to_fen(), "rnbqkb1r/pppppppp/5n2/8/4P3/8/PPPP1PPP/RNBQKBNR w KQkq - 1 2")
+        game.undo_move()
+        self.assertEqual(game.halfmove_clock, 0)
+        self.assertEqual(game.fullmove_number, 1)
+
+    def test_matches_played_position(self):
+        game = Game()
+        for start, end in (("e2", "e4"), ("c7", "c5"), ("g1", "f3"), ("d7", "d6")):
+            game.play_move(start, end)
+        loaded = Game.from_fen(game.to_fen())
+        self.assertEqual(loaded.zobrist_hash, game.zobrist_hash)
+        self.assertEqual(loaded.board.attacks, game.board.attacks)
+        self.assertEqual(sorted(map(repr, loaded.legal_moves())), sorted(map(repr, game.legal_moves())))
+        bitboard = Game.from_fen(game.to_fen(), BitboardBoard())
+        self.assertEqual(bitboard.zobrist_hash, game.zobrist_hash)
+        self.assertEqual(len(bitboard.legal_moves()), len(game.legal_moves()))
+
+    def test_reload_reuses_board(self):
+        board = Board()
+        for fen, _ in POSITIONS.values():
+            board.load_fen(fen)
+            self.assertEqual(board.zobrist_hash, Board(fen).zobrist_hash)
+            self.assertEqual(board.to_fen(), fen.split()[0])
+
+    def test_reload_reuses_game(self):
+        game = Game()
+        game.play_move("e2", "e4")
+        for fen in [fen for fen, _ in POSITIONS.values()] + ["rnbqkbnr/ppp1pppp/8/8/3pP3/8/PPPP1PPP/RNBQKBNR b KQkq e3 0 2"]:
+            game.load_fen(fen)
+            loaded = Game.from_fen(fen)
+            self.assertEqual((game.to_fen(), game.zobrist_hash, game.move_stack), (fen, loaded.zobrist_hash, []))
+            self.assertEqual(len(game.legal_moves()), len(loaded.legal_moves()))
+
+    def test_invalid_fen(self):
+        for fen in ("", "8/8/9 w - - 0 1", "rnbqkbnr/ppppxppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1", "8/8/8/8/8/8/8/8",
+                    "8/8/8/8/8/8/7/9 w - - 0 1", "4k3/8/8/8/8/8/8/4K3 w - e9 0 1", "4k3/8/8/8/8/8/8/4K3 w - xx 0 1",
+                    "4k3/8/8/8/8/8/8/4K3 w - a8 0 1", "4k3/8/8/8/8/8/8/4K3 w - e3 0 1",
+                    "4k3/8/8/8/8/8/8/4K3 W - - 0 1"):
+            with self.assertRaises(ValueError):
+                Game.from_fen(fen)
+            if fen.count(' ') >= 3:
+                with self.assertRaises(ValueError):
+                    Position.from_fen(fen)
+            with self.assertRaises(ValueError):
+                Game().load_fen(fen)
+
+
+SAMPLE_PGN = b"""[Event "Opera game"]
+[White "Morphy"]
+[Black "Duke Karl / Count Isouard"]
+[Result "1-0"]
+
+1. e4 e5 2. Nf3 d6 3. d4 Bg4 {This is a weak move} 4. dxe5 Bxf3 5. Qxf3 dxe5
+6. Bc4 Nf6 7. Qb3 Qe7 8. Nc3 c6 9. Bg5 b5 $2 10. Nxb5 cxb5 (10... Qb4+ 11. Qxb4)
+11. Bxb5+ Nbd7 12. O-O-O Rd8 13. Rxd7 Rxd7 14. Rd1 Qe6 15. Bxd7+ Nxd7 16. Qb8+
+Nxb8 17. Rd8# 1-0
+
+[Event "Illegal"]
+[Result "*"]
+
+1. e4 e5 2. Ke3 *
+
+[Event "Broken tag
+[Result "*"]
+
+1. d4 d5 *
+
+[Event "Promotion"]
+[FEN "8/P6k/8/8/8/8/8/K7 w - - 0 1"]
+[Result "*"]
+
+1. a8=Q Kg6 2. Qa6+ *
+"""
+
+
+class TestPgn(unittest.TestCase):
+    def test_reads_headers_moves_and_offsets(self):
+        games = list(read_games(io.BytesIO(SAMPLE_PGN)))
+        self.assertEqual(len(games), 4)
+        opera = games[0]
+        self.assertEqual(opera.headers["White"], "Morphy")
+        self.assertEqual(opera.result, "1-0")
+        self.assertEqual(len(opera.moves), 33)
+        self.assertNotIn("Qb4+", opera.moves)
+        self.assertEqual(games[1].offset, SAMPLE_PGN.index(b'[Event "Illegal"]'))
+
+    def test_format_round_trips(self):
+        opera = next(read_games(io.BytesIO(SAMPLE_PGN)))
+        opera.headers["Annotator"] = 'A "quoted" name'
+        text = format_game(opera)
+        self.assertTrue(text.startswith('[Event "Opera game"]\n[Site "?"]'))
+        self.assertTrue(all(len(line) <= 80 for line in text.splitlines()))
+        copy = next(read_games(io.BytesIO(text.encode())))
+        self.assertEqual((copy.headers, copy.moves, copy.result), (dict(opera.headers, Site="?", Date="?", Round="?"),
+                                                                   opera.moves, opera.result))
+        black_first = PGNGame(0)
+        black_first.headers["FEN"] = "4k3/8/8/8/8/8/4P3/4K3 b - - 0 12"
+        black_first.moves = ["Kd7", "e4"]
+        self.assertTrue(format_game(black_first).endswith("\n\n12... Kd7 13. e4 *\n\n"))
+
+    def test_replay_reports_bad_games(self):
+        replayed = list(replay_games(read_games(io.BytesIO(SAMPLE_PGN))))
+        self.assertEqual(len(replayed), 2)
+        self.assertTrue(replayed[0][1].board.is_checkmate(Color.BLACK))
+        self.assertIsInstance(replayed[1][1].board.get_square("a6").piece, Queen)
+
+        games = list(read_games(io.BytesIO(SAMPLE_PGN)))
+        with self.assertRaises(PGNError) as context:
+            replay(games[1])
+        self.assertEqual(context.exception.offset, games[1].offset)
+        self.assertIn("Ke3", str(context.exception))
+        self.assertIsNotNone(games[2].error)
+
+    def test_bad_fen_headers_are_reported(self):
+        text = b""
+        for fen in ("4k3/8/8/8/8/8/8/4K3 w - e9 0 1", "4k3/8/8/8/8/8/8/4K3 x - - 0 1", "4k3/8/8/8/8/8/8/4K3 b - a8 0 1"):
+            text += f'[Event "Bad"]\n[FEN "{fen}"]\n[Result "*"]\n\n1. Kd2 *\n\n'.encode()
+        stats = ReplayStats()
+        replayed = list(replay_games(read_games(io.BytesIO(text + SAMPLE_PGN)), stats))
+        self.assertEqual(len(replayed), 2)
+        self.assertEqual(len(stats.errors), 5)
+        self.assertTrue(all("FEN" in str(error) for error in stats.errors[:3]))
+        clean, stats = ReplayStats(), ReplayStats()
+        self.assertEqual(collect([io.BytesIO(text + SAMPLE_PGN)], stats=stats),
+                         collect([io.BytesIO(SAMPLE_PGN)], stats=clean))
+        self.assertEqual((stats.games, len(stats.errors)), (clean.games, len(clean.errors) + 3))
+        self.assertTrue(all("FEN" in str(error) for error in stats.errors[:3]))
+
+    def test_memory_mapped_file(self):
+        with tempfile.NamedTemporaryFile(suffix=".pgn", delete=False) as file:
+            file.write(SAMPLE_PGN)
+        try:
+            mapped = [(game.offset, game.moves) for game in read_games(file.name)]
+            buffered = [(game.offset, game.moves) for game in read_games(file.name, use_mmap=False)]
+        finally:
+            os.unlink(file.name)
+        self.assertEqual(mapped, buffered)
+
+    def test_encode_decode_round_trip(self):
+        game = Game.from_fen(POSITIONS["kiwipete"][0])
+        for move in game.legal_moves():
+            san = encode_san(game, move)
+            pgn_game = next(read_games(io.BytesIO(f'[FEN "{POSITIONS["kiwipete"][0]}"]\n\n{san} *\n'.encode())))
+            start_square, end_square = replay(pgn_game).last_move
+            self.assertEqual((repr(start_square), repr(end_square)), (repr(move.start_pos), repr(move.end_pos)), san)
+
+
+class TestOpeningBook(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "book.bin")
+        self.count = build_book([io.BytesIO(SAMPLE_PGN)], self.path, max_ply=20)
+        self.book = OpeningBook(self.path, seed=1)
+        self.addCleanup(self.book.close)
+
+    def test_weights_from_results(self):
+        self.assertEqual(len(self.book), self.count)
+        game = Game()
+        self.assertEqual([(move.to_uci(), weight) for move, weight in self.book.moves(game)], [("e2e4", 3)])
+        self.assertTrue(game.play_move("e2", "e4"))
+        # Black lost the Opera game, so only the unfinished game counts for e5
+        self.assertEqual([(move.to_uci(), weight) for move, weight in self.book.moves(game)], [("e7e5", 1)])
+
+    def test_reports_bad_and_truncated_games(self):
+        stats = ReplayStats()
+        build_book([io.BytesIO(SAMPLE_PGN + b"\n[Event \"Cut off\"]\n\n1. d4 d5 2. c4")], self.path + ".new", stats=stats)
+        errors = [error.message for error in stats.errors]
+        self.assertEqual(len(errors), 3)
+        self.assertIn("ply 3: illegal move 'Ke3'", errors[0])
+        self.assertIn("malformed tag", errors[1])
+        self.assertIn("truncated", errors[2])
+        self.assertEqual(stats.games, 3)
+
+    def test_game_plays_from_book_then_searches(self):
+        game = Game()
+        game.book = self.book
+        result = game.best_move(2)
+        self.assertEqual((result.move.to_uci(), result.depth), ("e2e4", 0))
+        game = Game.from_fen("4k3/8/8/8/8/8/8/R3K3 w - - 0 1")
+        game.book = self.book
+        self.assertIsNone(self.book.choose(game))
+        self.assertEqual(game.best_move(1).depth, 1)
+
+    def test_lookup_in_large_book(self):
+        path = self.path + ".large"
+        weights = {(key * 7919, 1 << 6 | move): move + 1 for key in range(2000) for move in range(3)}
+        self.assertEqual(write_book(weights, path), 6000)
+        with OpeningBook(path) as book:
+            self.assertEqual(book.entries(1999 * 7919), [(1 << 6 | 2, 3), (1 << 6 | 1, 2), (1 << 6, 1)])
+            self.assertEqual(book.entries(0), [(1 << 6 | 2, 3), (1 << 6 | 1, 2), (1 << 6, 1)])
+            self.assertEqual(book.entries(5), [])
+        self.assertEqual(decode_move(12 | 28 << 6 | 4 << 12), (12, 28, Queen))
+
+    def test_rejects_other_files_and_pickles_as_path(self):
+        with open(self.path + ".bad", "wb") as bad:
+            bad.write(b"not a book")
+        with self.assertRaises(ValueError):
+            OpeningBook(self.path + ".bad")
+        for name, data, message in (("empty", b"", "not an opening book"),
+                                    ("truncated", open(self.path, "rb").read()[:-5], "truncated")):
+            with open(self.path + "." + name, "wb") as bad:
+                bad.write(data)
+            with self.assertRaisesRegex(ValueError, message):
+                OpeningBook(self.path + "." + name)
+        self.assertEqual(write_book({}, self.path + ".empty"), 0)
+        with OpeningBook(self.path + ".empty") as empty:
+            self.assertEqual(len(empty), 0)
+        copy = pickle.loads(pickle.dumps(self.book))
+        self.assertEqual(copy.entries(Game().zobrist_hash), self.book.entries(Game().zobrist_hash))
+        copy.close()
+
+
+class TestTablebase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.TemporaryDirectory()
+        cls.tablebase = Tablebase(cls.directory.name)
+        cls.counts = generate("KQvK", cls.tablebase)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tablebase.close()
+        cls.directory.cleanup()
+
+    def probe(self, fen):
+        return self.tablebase.probe(Game.from_fen(fen))
+
+    def test_known_positions(self):
+        self.assertEqual(self.probe("k7/1Q6/1K6/8/8/8/8/8 b - - 0 1"), (-1, 0))
+        self.assertEqual(self.probe("k7/2Q5/1K6/8/8/8/8/8 b - - 0 1"), (0, 0))
+        self.assertEqual(self.probe("k7/8/1K6/8/8/8/8/2Q5 w - - 0 1"), (1, 1))
+        self.assertEqual(self.probe("8/8/8/8/8/8/1kQ5/7K b - - 0 1"), (0, None))  # Black takes the queen
+        self.assertIsNone(self.probe("k7/Q7/1K6/8/8/8/8/8 w - - 0 1"))  # Black is in check with white to move
+        self.assertIsNone(self.probe("k7/8/1K6/8/8/8/8/2QR4 w - - 0 1"))  # No KQRvK table
+
+    def test_longest_mate_and_mirrored_colors(self):
+        won, drawn, lost = self.counts
+        self.assertGreater(won, 0)
+        self.assertGreater(lost, 0)
+        longest = max(value - 1 for value in bytes(self.tablebase.table("KQvK")) if value < 254)
+        self.assertEqual(longest, 20)  # Mate in 10 moves, counted from the losing side
+        self.assertEqual(self.probe("K7/8/1k6/8/8/8/8/2q5 b - - 0 1"), (1, 1))
+        self.assertEqual(self.probe("7k/8/6K1/8/8/8/8/5Q2 w - - 0 1"), (1, 1))
+
+    def test_game_plays_tablebase_moves(self):
+        game = Game.from_fen("8/8/8/4k3/8/8/8/KQ6 w - - 0 1")
+        game.tablebase = self.tablebase
+        wdl, plies = self.tablebase.probe(game)
+        self.assertEqual(wdl, 1)
+        while game.status() != Status.CHECKMATE:
+            result = game.best_move(1)
+            self.assertEqual(result.depth, 0)
+            game.push(result.move)
+            plies -= 1
+        self.assertEqual(plies, 0)
+        self.assertEqual(game.current_turn, Color.BLACK)
+
+    def test_status_from_tablebase(self):
+        for fen, status in (("8/8/8/4k3/8/8/8/KQ6 w - - 0 1", Status.TABLEBASE_WIN),
+                            ("8/8/8/4k3/8/8/8/KQ6 b - - 0 1", Status.TABLEBASE_LOSS),
+                            ("8/8/8/8/8/8/1kQ5/7K b - - 0 1", Status.TABLEBASE_DRAW),
+                            ("k7/1Q6/1K6/8/8/8/8/8 b - - 0 1", Status.CHECKMATE),
+                            ("8/8/8/4k3/8/8/8/KQR5 w - - 0 1", Status.IN_PROGRESS)):
+            game = Game.from_fen(fen)
+            game.tablebase = self.tablebase
+            self.assertEqual(game.status(), status, fen)
+        self.assertEqual(Game.from_fen("8/8/8/4k3/8/8/8/KQ6 w - - 0 1").status(), Status.IN_PROGRESS)
+
+    def test_signatures_come_after_their_subtables(self):
+        self.assertEqual(canonical("KR", "KQ"), ("KQ", "KR", True))
+        names = all_signatures(4)
+        self.assertEqual(names[:5], ["KBvK", "KNvK", "KQvK", "KRvK", "KPvK"])
+        self.assertLess(names.index("KQvKR"), names.index("KQvKP"))
+        self.assertLess(names.index("KQPvK"), names.index("KPPvK"))
+        for index, name in enumerate(names):
+            self.assertTrue(all(names.index(child) < index for child in subtables(name)), name)
+        self.assertEqual(subtables("KQvKR"), ["KQvK", "KRvK"])
+        self.assertEqual(subtables("KPvK"), ["KBvK", "KNvK", "KQvK", "KRvK"])
+        self.assertIn("KQvKP", subtables("KPvKP"))
+        with self.assertRaisesRegex(FileNotFoundError, "KRvK"):
+            generate("KQvKR", self.tablebase)
+
+    def test_pickles_as_directory(self):
+        copy = pickle.loads(pickle.dumps(self.tablebase))
+        self.assertEqual(copy.probe(Game.from_fen("k7/1Q6/1K6/8/8/8/8/8 b - - 0 1")), (-1, 0))
+        copy.close()
+
+
+@unittest.skipUnless(os.environ.get("TABLEBASE_DIRECTORY"), "set TABLEBASE_DIRECTORY to tables with KPvKP")
+class TestEnPassantTables(unittest.TestCase):
+    """Checks KPvKP, which with the tables it leads to takes about an hour to generate:
+
+        python tablebase.py generate tables KBvK KNvK KQvK KRvK KPvK KBvKB KBvKN KNvKN KQvKB KQvKN KQvKQ \\
+            KQvKR KRvKB KRvKN KRvKR KBvKP KNvKP KQvKP KRvKP KPvKP
+        TABLEBASE_DIRECTORY=tables python -m pytest tests.py -k EnPassant
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tablebase = Tablebase(os.environ["TABLEBASE_DIRECTORY"])
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tablebase.close()
+
+    def by_moves(self, game):
+        # (wdl, plies) of the best move, from probing the position after each legal move
+        best = None
+        for move in game.legal_moves():
+            game.push(move)
+            wdl, plies = self.tablebase.probe(game)
+            game.pop()
+            outcome = (-wdl, None if plies is None else plies + 1)
+            rank = (-wdl, 0 if wdl == 0 else plies * wdl)
+            if best is None or rank > best[0]:
+                best = (rank, outcome)
+        return best[1]
+
+    def test_en_passant_capture_decides(self):
+        for fen, without, moves in (("8/8/8/8/3Pp3/4K3/8/7k b - d3 0 1", (-1, 20), ["e4d3"]),  # Only drawing move
+                                    ("8/4K3/8/8/5Pp1/8/k7/8 b - f3 0 1", (0, None), ["g4f3"])):  # Only winning move
+            game = Game.from_fen(fen)
+            outcome = self.tablebase.probe(game)
+            self.assertEqual(outcome, self.by_moves(game), fen)
+            self.assertEqual(self.tablebase.probe(Game.from_fen(fen.replace(fen.split()[3], "-"))), without, fen)
+            self.assertNotEqual(outcome[0], without[0])
+            reaching = []
+            for move in game.legal_moves():
+                game.push(move)
+                if -self.tablebase.probe(game)[0] == outcome[0]:
+                    reaching.append(move.to_uci())
+                game.pop()
+            self.assertEqual(reaching, moves, fen)
+            self.assertEqual(self.tablebase.best_move(game)[0].to_uci(), moves[0])
+
+    def test_positions_before_a_double_push(self):
+        # Generated without the en passant replies these were a draw and a win in 37
+        for fen, outcome in (("8/8/8/3k4/6p1/1K6/7P/8 w - - 0 1", (-1, 32)),
+                             ("8/8/5K2/8/1p5k/8/P7/8 w - - 0 1", (0, None))):
+            game = Game.from_fen(fen)
+            self.assertEqual(self.tablebase.probe(game), outcome, fen)
+            self.assertEqual(self.by_moves(game), outcome, fen)
+
+
+class TestMatch(unittest.TestCase):
+    def test_elo_difference(self):
+        self.assertEqual(elo_difference(0, 10, 0), (0.0, 0.0, 0.0))
+        difference, low, high = elo_difference(60, 30, 10)
+        self.assertAlmostEqual(difference, 190.8, places=1)  # A 75% score
+        self.assertLess(low, difference)
+        self.assertLess(difference, high)
+        self.assertAlmostEqual(elo_difference(10, 30, 60)[0], -difference)
+        self.assertEqual(elo_difference(3, 0, 0)[0], float("inf"))
+
+    def test_adjudication(self):
+        adjudication = Adjudication(resign_score=500, resign_plies=4, draw_score=20, draw_plies=4, draw_after=6)
+        self.assertEqual(adjudication.decide([0, 600, 700, 650, 900]), ("1-0", "resignation"))
+        self.assertIsNone(adjudication.decide([-600, -700, None, -900]))
+        self.assertIsNone(adjudication.decide([0, 0, 0, 0, 0]))
+        self.assertEqual(adjudication.decide([0, 0, 5, -5, 10, 0]), ("1/2-1/2", "draw adjudication"))
+        engine = Engine.parse("name=new, depth=3,hash=4")
+        self.assertEqual((engine.name, engine.depth, engine.time_limit, engine.memory_mb), ("new", 3, None, 4.0))
+        with self.assertRaises(ValueError):
+            Engine.parse("speed=3")
+
+    def test_game_ends_in_mate_or_cap(self):
+        record = play_game(1, "6k1/5ppp/8/8/8/8/5PPP/3R2K1 w - - 0 1", Engine(depth=2), Engine(depth=1), Adjudication())
+        self.assertEqual((record.moves, record.result, record.reason), (["Rd8#"], "1-0", "checkmate"))
+        record = play_game(2, START_FEN, Engine(depth=1), Engine(depth=1), Adjudication(max_plies=4))
+        self.assertEqual((len(record.moves), record.result, record.reason), (4, "1/2-1/2", "move cap"))
+        self.assertGreater(record.nodes[Color.BLACK], 0)
+
+    def test_match_streams_pgn(self):
+        openings = ["6k1/5ppp/8/8/8/8/5PPP/3R2K1 w - - 0 1", START_FEN]
+        output = io.StringIO()
+        first, second = Engine("first", depth=2), Engine("second", depth=1)
+        stats = run_match(first, second, openings, workers=2, adjudication=Adjudication(max_plies=6), output=output)
+        self.assertEqual(stats.games, 4)
+        # The first engine mates at once as white; as black it faces the same mate
+        self.assertEqual((stats.wins, stats.losses), (1, 1))
+        self.assertEqual(stats.reasons["move cap"], 2)
+        self.assertGreater(stats.nps(0), 0)
+        games = list(read_games(io.BytesIO(output.getvalue().encode())))
+        self.assertEqual(sorted(game.headers["Round"] for game in games), ["1", "2", "3", "4"])
+        for pgn_game in games:
+            replay(pgn_game)
+        self.assertIn("Elo difference", str(stats))
+
+    def test_bad_openings_and_failed_games(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.epd', delete=False) as file:
+            file.write("# openings\n\nrnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq e3 bm e5; id \"e4\";\n"
+                       f"{START_FEN}\n")
+        try:
+            openings = read_fens(file.name)
+        finally:
+            os.unlink(file.name)
+        self.assertEqual(openings, ["rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq e3", START_FEN])
+        with self.assertRaisesRegex(ValueError, "opening 2"):
+            run_match(Engine(depth=1), Engine(depth=1), [START_FEN, "8/8/8/8/8/8/7/9 w - - 0 1"])
+        # A game that raises in its worker is reported with its round and start, and the others still count
+        broken = Engine("broken", depth=1, time_limit="soon")
+        stats = run_match(broken, Engine(depth=1), openings[:1], workers=1,
+                          adjudication=Adjudication(max_plies=1))
+        self.assertEqual(stats.games, 1)
+        self.assertEqual([(number, fen) for number, fen, _ in stats.failures], [(2, openings[0])])
+        self.assertIn("TypeError", stats.failures[0][2])
+        self.assertIn(f"round 2 failed from {openings[0]}", str(stats))
+
+
+class TestParallel(unittest.TestCase):
+    def test_perft_matches_serial(self):
+        fen = POSITIONS["kiwipete"][0]
+        self.assertEqual(parallel_divide(fen, 2, workers=2), divide(Game.from_fen(fen), 2))
+        self.assertEqual(parallel_perft(POSITIONS["position3"][0], 3, workers=2, backend="bitboard"), 2812)
+
+    def test_search_is_deterministic(self):
+        fen = "6k1/5ppp/8/8/8/8/5PPP/3R2K1 w - - 0 1"
+        scores = parallel_search(fen, 2, workers=2)
+        self.assertEqual(scores[0][0], "d1d8")
+        self.assertEqual(scores, parallel_search(fen, 2, workers=1))
+
+    def test_replay_merges_chunks_in_order(self):
+        with tempfile.NamedTemporaryFile(suffix=".pgn", delete=False) as file:
+            file.write(SAMPLE_PGN * 3)
+        try:
+            stats = parallel_replay(file.name, workers=2, chunk_size=2)
+        finally:
+            os.unlink(file.name)
+        self.assertEqual((stats.games, stats.moves), (6, 3 * 36))
+        offsets = [error.offset for error in stats.errors]
+        self.assertEqual(len(offsets), 6)
+        self.assertEqual(offsets, sorted(offsets))
+        self.assertEqual(offsets[2] - offsets[0], len(SAMPLE_PGN))
+
+
+class TestBatchEvaluation(unittest.TestCase):
+    FENS = [fen for fen, _ in POSITIONS.values()] + [
+        "4k3/8/8/8/8/8/8/4K2R w K - 0 1",
+        "4k3/8/8/8/7b/8/8/4K3 w - - 0 1",  # Bishop check
+        "4k3/3P4/8/8/8/8/8/4K3 b - - 0 1",  # Pawn check on black
+        "4k3/8/5N2/8/8/8/8/4K3 b - - 0 1",  # Knight check on black
+        "4k3/4r3/8/8/8/8/4B3/4K3 w - - 0 1",  # Rook blocked by the bishop
+    ]
+
+    def test_matches_board(self):
+        result = evaluate_batch(encode_fens(self.FENS), chunk_size=4)
+        for index, fen in enumerate(self.FENS):
+            board = Board(fen)
+            self.assertEqual(result.score[index], evaluate(board, Color.WHITE), fen)
+            self.assertEqual(result.mobility[index],
+                             sum(board.attacks[Color.WHITE]) - sum(board.attacks[Color.BLACK]), fen)
+            self.assertEqual(result.white_in_check[index], board.is_king_in_check(Color.WHITE), fen)
+            self.assertEqual(result.black_in_check[index], board.is_king_in_check(Color.BLACK), fen)
+        self.assertEqual(list(result.white_in_check[-5:]), [False, True, False, False, False])
+        self.assertEqual(list(result.black_in_check[-5:]), [False, False, True, True, False])
+
+    def test_conversions(self):
+        codes = encode_fens(self.FENS)
+        boards = [Board(fen) for fen in self.FENS]
+        self.assertTrue((encode(boards) == codes).all())
+        self.assertTrue((encode([BitboardBoard(fen) for fen in self.FENS]) == codes).all())
+        self.assertTrue((from_planes(to_planes(codes)) == codes).all())
+        self.assertEqual(to_planes(codes).shape, (len(self.FENS), 12, 64))
+        board = Board()
+        for fen, row in zip(self.FENS, codes):
+            self.assertEqual(decode(row, board).to_fen(), fen.split()[0])
+        self.assertTrue((evaluate_batch(to_planes(codes)).score == evaluate_batch(codes).score).all())
+
+    def test_invalid_placement(self):
+        with self.assertRaises(ValueError):
+            encode_fens(["8/8/8/8/8/8/8/7x w - - 0 1"])
+
+
+class TestServer(unittest.TestCase):
+    def run_with_server(self, scenario, **options):
+        async def run():
+            server = await GameServer(port=0, **options).start()
+            try:
+                await asyncio.wait_for(scenario(server), 30)
+            finally:
+                await server.close()
+        asyncio.run(run())
+
+    async def pair(self, server):
+        white = await Client.connect("127.0.0.1", server.port)
+        black = await Client.connect("127.0.0.1", server.port)
+        await white.send("NEW")
+        game_id = (await white.expect("GAME"))[1]
+        await black.send(f"JOIN {game_id}")
+        self.assertEqual(await black.expect("GAME"), ["GAME", game_id, "black"])
+        await white.expect("BOARD")
+        await black.expect("BOARD")
+        return white, black
+
+    def test_fools_mate(self):
+        async def scenario(server):
+            white, black = await self.pair(server)
+            await black.send("MOVE e7e5")
+            self.assertEqual(await black.expect("ERROR"), ["ERROR", "not", "your", "turn"])
+            await white.send("MOVE e2 e5")
+            self.assertEqual(await white.expect("ERROR"), ["ERROR", "illegal", "move"])
+            for mover, move in ((white, "f2f3"), (black, "e7e5"), (white, "g2g4"), (black, "d8h4")):
+                await mover.send(f"MOVE {move}")
+                board = await white.expect("BOARD")
+                self.assertEqual(board, await black.expect("BOARD"))
+            self.assertEqual(board[1], "rnb1kbnr/pppp1ppp/8/4p3/6Pq/5P2/PPPPP2P/RNBQKBNR")
+            self.assertEqual(await white.expect("END"), ["END", "0-1", "checkmate"])
+            self.assertEqual(await black.expect("END"), ["END", "0-1", "checkmate"])
+            self.assertEqual(server.moves_played, 4)
+            self.assertEqual(server.sessions, {})
+        self.run_with_server(scenario)
+
+    def test_idle_games_expire(self):
+        async def scenario(server):
+            white, black = await self.pair(server)
+            self.assertEqual(await white.expect("END"), ["END", "*", "idle"])
+            self.assertEqual(await black.expect("END"), ["END", "*", "idle"])
+        self.run_with_server(scenario, idle_timeout=0.2)
+
+    def test_repetition_ends_the_game(self):
+        async def scenario(server):
+            white, black = await self.pair(server)
+            for ply in range(8):
+                await (white, black)[ply % 2].send(f"MOVE {('g1f3', 'g8f6', 'f3g1', 'f6g8')[ply % 4]}")
+                await white.expect("BOARD")
+                await black.expect("BOARD")
+            self.assertEqual(await white.expect("END"), ["END", "1/2-1/2", "threefold-repetition"])
+        self.run_with_server(scenario)
+
+    def test_engine_replies(self):
+        async def scenario(server):
+            client = await Client.connect("127.0.0.1", server.port)
+            await client.send("NEW white engine 1")
+            await client.expect("BOARD")
+            await client.send("MOVE e2e4")
+            await client.expect("BOARD")
+            reply = await client.expect("BOARD")
+            self.assertEqual(reply[2], "w")
+            await client.send("RESIGN")
+            self.assertEqual(await client.expect("END"), ["END", "0-1", "resignation"])
+        self.run_with_server(scenario, engine_workers=1)
+
+    def test_engine_depth_is_capped(self):
+        async def scenario(server):
+            client = await Client.connect("127.0.0.1", server.port)
+            await client.send("NEW black engine 40")
+            game_id = (await client.expect("GAME"))[1]
+            self.assertEqual(server.sessions[game_id].engine_depth, 3)
+            await client.expect("BOARD")
+            self.assertEqual((await client.expect("BOARD"))[2], "b")
+        self.run_with_server(scenario, engine_workers=1, max_engine_depth=3, engine_time=0.2)
+
+    def test_resign_while_engine_thinks(self):
+        async def scenario(server):
+            client = await Client.connect("127.0.0.1", server.port)
+            await client.send("NEW white engine 20")
+            await client.expect("BOARD")
+            await client.send("MOVE e2e4")
+            await client.expect("BOARD")
+            start = time.perf_counter()
+            await client.send("RESIGN")
+            self.assertEqual(await client.expect("END"), ["END", "0-1", "resignation"])
+            self.assertLess(time.perf_counter() - start, 1.0)
+        self.run_with_server(scenario, engine_workers=1, max_engine_depth=20, engine_time=3.0)
+
+    def test_resign_while_move_is_checked(self):
+        def slow_play(*args):
+            time.sleep(0.3)
+            return play_and_check(*args)
+
+        async def scenario(server):
+            white, black = await self.pair(server)
+            with mock.patch("server.play_and_check", slow_play):
+                await white.send("MOVE e2e4")
+                await asyncio.sleep(0.1)
+                await black.send("RESIGN")
+                # The move was being played when black resigned, so its board comes before the end
+                self.assertEqual((await black.expect("BOARD", "END"))[0], "BOARD")
+                self.assertEqual(await black.expect("BOARD", "END"), ["END", "1-0", "resignation"])
+        self.run_with_server(scenario)
+
+    def test_long_line_is_refused(self):
+        async def scenario(server):
+            client = await Client.connect("127.0.0.1", server.port)
+            await client.send("MOVE" + " e2e4" * 2000)
+            self.assertEqual(await client.expect("ERROR", "GAME"), ["ERROR", "line", "longer", "than", "4096", "bytes"])
+            # The rest of the long line is dropped rather than read as commands
+            await client.send("NEW")
+            self.assertEqual((await client.expect("ERROR", "GAME"))[0], "GAME")
+        self.run_with_server(scenario)
+
+
+class TestTables(unittest.TestCase):
+    def test_knight_targets(self):
+        self.assertEqual(sorted(KNIGHT_TARGETS[0]), [10, 17])  # a1: c2 and b3
+        self.assertEqual(len(KNIGHT_TARGETS[27]), 8)  # d4
+
+    def test_rays_and_between_squares(self):
+        self.assertEqual(RAYS[0][0], (8, 16, 24, 32, 40, 48, 56))  # a1 up the a file
+        self.assertEqual(BETWEEN[0][63], (9, 18, 27, 36, 45, 54))
+        self.assertEqual(BETWEEN_MASKS[0][63], sum(1 << index for index in BETWEEN[0][63]))
+        self.assertEqual(BETWEEN[0][1], ())
+        self.assertEqual(LINE[0][10], NO_LINE)
+        self.assertEqual(BETWEEN[0][10], ())
+        for start in range(64):
+            for end in range(64):
+                self.assertEqual(BETWEEN[start][end], tuple(reversed(BETWEEN[end][start])))
+
+    def test_path_clear_uses_between_squares(self):
+        for board in (Board(), BitboardBoard()):
+            self.assertFalse(board.is_path_clear(board.get_square("a1"), board.get_square("a8")))
+            self.assertTrue(board.is_path_clear(board.get_square("a2"), board.get_square("a7")))
+            self.assertTrue(board.is_path_clear(board.get_square("c1"), board.get_square("d2")))
+
+    def test_piece_moves_come_from_tables(self):
+        game = Game()
+        self.assertTrue(game.play_move("g1", "f3"))
+        self.assertFalse(game.play_move("g8", "g6"))
+        square = game.board.get_square("f3")
+        targets = [target.index for target in square.piece.candidate_squares(square)]
+        self.assertEqual(targets, [index for index in KNIGHT_TARGETS[square.index]
+                                   if game.board.squares[index].piece is None])
+
+
+class TestAttackMaps(unittest.TestCase):
+    def test_maps_follow_moves(self):
+        game = Game()
+        for start_pos, end_pos in [("e2", "e4"), ("d7", "d5"), ("e4", "d5"), ("d8", "d5"), ("g1", "f3"),
+                                   ("c8", "g4"), ("f1", "e2"), ("b8", "c6"), ("e1", "g1"), ("e8", "c8")]:
+            self.assertTrue(game.play_move(start_pos, end_pos))
+
+        # Placing the same pieces on an empty board in a different order must give the same maps
+        rebuilt = Board()
+        rebuilt.clear()
+        for square in reversed(game.board.squares):
+            rebuilt.set_piece(rebuilt.squares[square.y * 8 + square.x], square.piece)
+        self.assertEqual(game.board.attacks, rebuilt.attacks)
+        self.assertEqual(repr(game.board.find_king(Color.WHITE)), "g1")
+        self.assertEqual(repr(game.board.find_king(Color.BLACK)), "c8")
+
+    def test_king_in_check(self):
+        game = Game()
+        for start_pos, end_pos in [("e2", "e4"), ("f7", "f6"), ("d1", "h5")]:
+            game.play_move(start_pos, end_pos)
+        self.assertTrue(game.board.is_king_in_check(Color.BLACK))
+        self.assertTrue(game.board.is_square_attacked(game.board.get_square("f7"), Color.WHITE))
+        self.assertFalse(game.board.is_square_attacked(game.board.get_square("e6"), Color.WHITE))
+
+class TestPerft(unittest.TestCase):
+    def assertPerft(self, name, depth, board=None):
+        fen, expected = POSITIONS[name]
+        self.assertEqual(perft(Game.from_fen(fen, board), depth), expected[depth - 1])
+
+    def test_start_position(self):
+        self.assertPerft("start", 3)
+
+    def test_castling_and_en_passant(self):
+        self.assertPerft("kiwipete", 2)
+
+    def test_en_passant_pins(self):
+        self.assertPerft("position3", 3)
+
+    def test_promotion(self):
+        self.assertPerft("position4", 2)
+        self.assertPerft("position5", 2)
+
+    def test_quiet_middlegame(self):
+        self.assertPerft("position6", 2)
+
+    def test_bitboard_backend(self):
+        self.assertPerft("kiwipete", 2, BitboardBoard())
+
+    def test_divide(self):
+        counts = divide(Game(), 2)
+        self.assertEqual(len(counts), 20)
+        self.assertEqual(counts["e2e4"], 20)
+        self.assertEqual(sum(counts.values()), 400)
+
+class TestFrontEnd(unittest.TestCase):
+    def test_rules_import_without_display(self):
+        code = "import sys, chess; print('pyfiglet' in sys.modules, 'cli' in sys.modules)"
+        output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout
+        self.assertEqual(output.split(), ["False", "False"])
+
+    def test_render_board(self):
+        lines = cli.render_board(Board()).splitlines()
+        self.assertEqual(lines[0], "  a b c d e f g h")
+        self.assertEqual(len(lines), 10)
+        self.assertEqual(cli.render_board(Board(), Color.BLACK).splitlines()[0], "  h g f e d c b a")
+
+    def test_play_until_mate(self):
+        moves = iter(["f2 f3", "e7 e5", "g2 g4", "x", "d8 h4"])
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            cli.play(Game(), lambda prompt: next(moves))
+        self.assertIn("Invalid command", output.getvalue())
+        self.assertEqual(output.getvalue().count("Moved from"), 4)
+
+
 class TestFamousGames(unittest.TestCase):
     def test_scholars_mate(self):
         game = Game()
@@ -39,5 +1185,23 @@ class TestFamousGames(unittest.TestCase):
         game.board.print_board(game.current_turn)
         self.assertTrue(game.board.is_checkmate(Color.WHITE))
 
+class TestBitboardBoard(unittest.TestCase):
+    def test_bitboards_follow_moves(self):
+        game = Game(BitboardBoard())
+        game.play_move("e2", "e4")
+        board = game.board
+        self.assertTrue(board.occupied & (1 << 28))
+        self.assertFalse(board.occupied & (1 << 12))
+        self.assertEqual(bin(board.occupied).count("1"), 32)
+
+    def test_fools_mate(self):
+        game = Game(BitboardBoard())
+        game.play_move("f2", "f3")
+        game.play_move("e7", "e5")
+        game.play_move("g2", "g4")
+        game.play_move("d8", "h4")
+        self.assertTrue(game.board.is_king_in_check(Color.WHITE))
+        self.assertTrue(game.board.is_checkmate(Color.WHITE))
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,127 @@
+"""Bounded caches keyed by Game.zobrist_hash."""
+import sys
+from array import array
+from collections import OrderedDict
+
+# Bytes each slot takes in the key, depth, generation and value arrays
+SLOT_SIZE = 8 + 2 + 4 + 8
+
+
+def _allocated(obj):
+    # The allocator hands out memory in 16 byte steps
+    return -(-sys.getsizeof(obj) // 16) * 16
+
+
+# Bytes held by a value the way Searcher stores one: the (score, flag, move key,
+# depth) tuple, its move key tuple and a score outside the small int cache. The
+# squares and piece types in the move key are shared with the board.
+SEARCH_VALUE_SIZE = _allocated((0, 0, None, 0)) + _allocated((None, None, None)) + _allocated(1000)
+
+
+class TranspositionTable:
+    """Fixed number of slots addressed by key, sized from a memory budget.
+
+    Keys, depths and generations are packed into arrays, so a slot costs
+    SLOT_SIZE bytes plus its value, counted as value_size bytes. The default is
+    the size of a search entry, which keeps a full table within memory_mb.
+
+    Values whose size varies, such as the legal move lists of Game.move_cache,
+    need measure, a function returning the bytes a value holds. Stored values
+    are then counted as they come and value_size only sets the slot count, and
+    a store that would take them past memory_mb is turned down.
+
+    When two positions map to the same slot the newer entry wins if the slot
+    holds an entry from an earlier search generation or one searched no deeper,
+    so deep results from the current search are kept.
+    """
+
+    def __init__(self, memory_mb=16, value_size=SEARCH_VALUE_SIZE, measure=None):
+        slot_size = SLOT_SIZE + (4 if measure is not None else 0)  # Plus the size of each value when measured
+        self.memory = int(memory_mb * 1024 * 1024)
+        self.size = max(1, self.memory // (slot_size + value_size))
+        self.measure = measure
+        self.generation = 0
+        self.clear()
+
+    def __len__(self):
+        return self.size - self.values.count(None)
+
+    def probe(self, key, depth=0):
+        """Return the value stored for the key at the given depth or deeper, else None."""
+        index = key % self.size
+        value = self.values[index]
+        if value is not None and self.keys[index] == key and self.depths[index] >= depth:
+            self.hits += 1
+            return value
+        self.misses += 1
+        return None
+
+    def store(self, key, value, depth=0):
+        index = key % self.size
+        if (self.values[index] is not None and self.keys[index] != key and
+                self.generations[index] == self.generation and self.depths[index] > depth):
+            self.rejected += 1
+            return False
+        if self.measure is not None:
+            size = self.measure(value)
+            used = self.used - self.sizes[index] + size
+            if used > self.budget:
+                self.rejected += 1
+                return False
+            self.used = used
+            self.sizes[index] = size
+        self.keys[index] = key
+        self.depths[index] = depth
+        self.generations[index] = self.generation
+        self.values[index] = value
+        self.stores += 1
+        return True
+
+    def new_search(self):
+        """Age the stored entries so the next search can replace them freely."""
+        self.generation += 1
+
+    def clear(self):
+        self.keys = array('Q', bytes(8 * self.size))
+        self.depths = array('h', bytes(2 * self.size))
+        self.generations = array('I', bytes(4 * self.size))
+        self.values = [None] * self.size
+        self.sizes = array('I', bytes(4 * self.size)) if self.measure is not None else None
+        self.used = 0  # Bytes held by the measured values
+        # What the slot arrays leave of the budget for measured values
+        self.budget = self.memory - sum(_allocated(part) for part in (self.keys, self.depths, self.generations,
+                                                                       self.values, self.sizes))
+        self.generation = 0
+        self.hits = self.misses = self.stores = self.rejected = 0
+
+
+class LRUCache:
+    """Holds up to maxsize entries and drops the least recently used one to make room."""
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        value = self.entries.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = self.misses = 0